@@ -0,0 +1,104 @@
+# app/core/auth_cache.py
+import time
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import Admin, Role, Student, User
+from app.utils.cache import TTLCache
+
+# token -> (kind, payload, snapshot) ลดการ jwt.decode + query user ซ้ำทุก request
+principal_cache = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_TTL)
+
+_timing = {"miss_seconds": 0.0, "miss_count": 0, "hit_seconds": 0.0, "hit_count": 0}
+
+
+class RoleSnapshot:
+    def __init__(self, role_id, role_name):
+        self.role_id = role_id
+        self.role_name = role_name
+
+
+class UserSnapshot:
+    """Detached, read-only copy of a User row that is safe to share across requests."""
+
+    def __init__(self, user: User, role: Role = None, student_id=None):
+        self.user_id = user.user_id
+        self.username = user.username
+        self.email = user.email
+        self.name = user.name
+        self.line_user_id = user.line_user_id
+        self.role_id = user.role_id
+        self.role = RoleSnapshot(role.role_id, role.role_name) if role else None
+        self.student_id = student_id
+
+
+class AdminSnapshot:
+    def __init__(self, admin: Admin):
+        self.admin_id = admin.admin_id
+        self.username = admin.username
+        self.role_id = admin.role_id
+        self.is_active = admin.is_active
+
+
+def load_user_snapshot(db: Session, criterion):
+    # query เดียว: user + role + student ที่ผูกกับ LINE id เดียวกัน
+    row = (
+        db.query(User, Role, Student.student_id)
+        .outerjoin(Role, Role.role_id == User.role_id)
+        .outerjoin(Student, (Student.line_id == User.line_user_id) & User.line_user_id.isnot(None))
+        .filter(criterion)
+        .first()
+    )
+    if row is None:
+        return None
+    user, role, student_id = row
+    return UserSnapshot(user, role, student_id)
+
+
+def user_role(snapshot: UserSnapshot, default: str = None):
+    # อนุญาตตาม role ปัจจุบันใน DB ไม่ใช่ claim ใน token: เปลี่ยน role แล้วมีผลทันทีหลัง invalidate_user
+    # default ใช้กับ user ที่ไม่มี role ในตาราง (ค่าเดียวกับตอนออก token)
+    return snapshot.role.role_name if snapshot.role else default
+
+
+def load_admin_snapshot(db: Session, username: str):
+    admin = db.query(Admin).filter(Admin.username == username).first()
+    return AdminSnapshot(admin) if admin else None
+
+
+def get_cached(kind: str, token: str):
+    started = time.perf_counter()
+    entry = principal_cache.get((kind, token))
+    if entry is not None:
+        _timing["hit_seconds"] += time.perf_counter() - started
+        _timing["hit_count"] += 1
+    return entry
+
+
+def store(kind: str, token: str, payload: dict, snapshot, started: float):
+    # started = เวลาเริ่ม decode (ใช้คำนวณเวลาที่ cache ช่วยประหยัด)
+    _timing["miss_seconds"] += time.perf_counter() - started
+    _timing["miss_count"] += 1
+    exp = payload.get("exp")
+    expires_at = time.time() + settings.AUTH_CACHE_TTL
+    if exp:
+        expires_at = min(expires_at, float(exp))
+    principal_cache.set((kind, token), (payload, snapshot), expires_at=expires_at)
+
+
+def invalidate_user(user_id: int):
+    return principal_cache.discard_where(
+        lambda key, value: isinstance(value[1], UserSnapshot) and value[1].user_id == user_id
+    )
+
+
+def get_stats():
+    avg_miss = _timing["miss_seconds"] / _timing["miss_count"] if _timing["miss_count"] else 0.0
+    avg_hit = _timing["hit_seconds"] / _timing["hit_count"] if _timing["hit_count"] else 0.0
+    return {
+        **principal_cache.stats(),
+        "avg_miss_ms": round(avg_miss * 1000, 3),
+        "avg_hit_ms": round(avg_hit * 1000, 3),
+        "estimated_saved_ms": round(principal_cache.hits * max(avg_miss - avg_hit, 0.0) * 1000, 1),
+    }
@@ -18,11 +18,88 @@ class Settings(BaseSettings):
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 480
     DATABASE_URL: str
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 0
     LINE_LOGIN_CHANNEL_ID: str
     LINE_LOGIN_CHANNEL_SECRET: str
     LINE_MESSAGING_CHANNEL_ID: str
     LINE_MESSAGING_CHANNEL_SECRET: str
     LINE_CHANNEL_ACCESS_TOKEN: str
+    EXAM_IMPORT_CHUNK_SIZE: int = 1000
+    IMPORT_UPLOAD_DIR: str = os.path.join(os.path.dirname(env_path), "uploads", "imports")
+    IMPORT_JOB_WORKERS: int = 2
+    IMPORT_JOB_STALE_SECONDS: int = 300
+    IMPORT_JOB_HEARTBEAT_SECONDS: int = 30  # ต้องน้อยกว่า IMPORT_JOB_STALE_SECONDS หลายเท่า
+    LINE_API_BASE_URL: str = "https://api.line.me"
+    LINE_API_TIMEOUT: float = 5.0
+    LINE_API_CONNECT_TIMEOUT: float = 3.0
+    LINE_API_MAX_CONNECTIONS: int = 20
+    LINE_API_MAX_RETRIES: int = 3
+    LINE_API_BACKOFF_BASE: float = 0.5
+    LINE_API_MAX_BACKOFF: float = 10.0
+    LINE_MULTICAST_BATCH_SIZE: int = 500
+    LINE_BROADCAST_RATE_PER_SECOND: float = 50.0
+    LINE_BROADCAST_BURST: int = 10
+    LINE_BROADCAST_CONCURRENCY: int = 5
+    LINE_BROADCAST_STALE_SECONDS: int = 300
+    LINE_ID_TOKEN_VERIFY_MODE: str = "remote"  # remote = เรียก /oauth2/v2.1/verify, local = ตรวจลายเซ็นเอง (HS256/ES256)
+    LINE_ID_TOKEN_CACHE_SIZE: int = 10000
+    LINE_ID_TOKEN_CACHE_MAX_TTL: int = 3600
+    LINE_JWKS_PATH: str = "/oauth2/v2.1/certs"
+    LINE_JWKS_CACHE_SECONDS: int = 86400
+    LINE_JWKS_MIN_REFRESH_SECONDS: int = 60
+    LINE_WEBHOOK_QUEUE_SIZE: int = 10000
+    LINE_WEBHOOK_WORKERS: int = 4
+    LINE_WEBHOOK_DEDUP_SIZE: int = 100000
+    LINE_WEBHOOK_DEDUP_TTL: int = 86400
+    LINE_WEBHOOK_DRAIN_SECONDS: float = 10.0
+    AUTH_CACHE_SIZE: int = 10000
+    AUTH_CACHE_TTL: int = 60
+    EXAM_DETAIL_CACHE_SIZE: int = 256
+    EXAM_DETAIL_CACHE_TTL: int = 300
+    GRADING_BATCH_SIZE: int = 500
+    GRADING_ANSWER_KEY_CACHE_SIZE: int = 256
+    GRADING_ANSWER_KEY_TTL: int = 60  # worker อื่นที่แก้เฉลย: key เก่าถูกใช้ได้นานสุดเท่านี้
+    AUTOSAVE_ENABLED: bool = True
+    AUTOSAVE_FLUSH_INTERVAL: float = 2.0
+    AUTOSAVE_MAX_BUFFERED_ANSWERS: int = 20000
+    AUTOSAVE_JOURNAL_DIR: str = os.path.join(os.path.dirname(env_path), "uploads", "autosave")  # ทุก worker ต้องใช้โฟลเดอร์เดียวกัน (ส่งข้อสอบอ่าน draft จาก journal ของ worker อื่นด้วย)
+    ANALYTICS_REBUILD_EVERY: int = 50  # rebuild discrimination ทุก ๆ N attempt ที่เสร็จ
+    ANALYTICS_UPPER_LOWER_FRACTION: float = 0.27
+    AUTOSAVE_FSYNC: bool = True  # fsync journal ทุกครั้งที่รับ draft (ปิดได้ถ้ารับความเสี่ยงตอนไฟดับ)
+    EXPORT_BATCH_SIZE: int = 2000
+    COURSE_PRICE_CACHE_TTL: int = 300
+    INVOICE_DUE_DAYS: int = 7
+    INVOICE_SCHEDULER_ENABLED: bool = False  # เปิดเองหลังตรวจผล dry run: รอบแรกจะส่งเตือนทุกใบที่ค้างอยู่
+    INVOICE_SCHEDULER_INTERVAL: int = 300
+    INVOICE_SCHEDULER_DRY_RUN: bool = False  # นับอย่างเดียว ไม่เปลี่ยนสถานะ/ไม่ส่ง LINE
+    INVOICE_SCHEDULER_LOCK_KEY: int = 7190019  # pg advisory lock key สำหรับเลือก worker ที่รัน scheduler
+    INVOICE_SWEEP_BATCH_SIZE: int = 500
+    INVOICE_REMINDER_DAYS_BEFORE: int = 3
+    INVOICE_REMINDER_STALE_SECONDS: int = 600  # claim ที่ heartbeat ขาดนานกว่านี้ถือว่า worker ตาย ให้ claim ใหม่ได้
+    INVOICE_REMINDER_HEARTBEAT_SECONDS: int = 60
+    INVOICE_REMINDER_MAX_ATTEMPTS: int = 5
+    INVOICE_REMINDER_RETRY_SECONDS: int = 900  # ส่งไม่สำเร็จ: รอ 15 นาที แล้วเพิ่มเป็นสองเท่าทุกครั้ง
+    INVOICE_REMINDER_MAX_RETRY_SECONDS: int = 6 * 3600
+    RECONCILE_DATE_WINDOW_DAYS: int = 60  # payment ต้องอยู่ในช่วง invoice_date - N วัน ถึง due_date + N วัน
+    RECONCILE_BATCH_SIZE: int = 500
+    RECONCILE_INCOME_TYPE: str = "tuition"
+    ATTENDANCE_ROSTER_CACHE_SIZE: int = 512
+    ATTENDANCE_ROSTER_CACHE_TTL: int = 600
+    ATTENDANCE_MAX_BATCH: int = 500  # จำนวนนักเรียนสูงสุดต่อการเช็คชื่อหนึ่งครั้ง
+    SCHEDULE_INDEX_REFRESH: int = 60  # วินาที: โหลด index ตารางเรียนใหม่จาก DB (รับการแก้ไขจาก worker อื่น)
+    SCHEDULE_TERM_MAX_SESSIONS: int = 400
+    COURSE_CATALOG_CACHE_TTL: int = 300  # กันข้อมูลค้างเมื่อมีการแก้ไขจาก worker อื่น
+    STUDENT_SEARCH_LIMIT: int = 20
+    STUDENT_SEARCH_MIN_SIMILARITY: float = 0.4  # ค่าต่ำสุดของ trigram word similarity ที่ถือว่าใกล้เคียง
+    STUDENT_SEARCH_MAX_CANDIDATES: int = 5000  # จำนวน candidate สูงสุดของ fuzzy search (n-gram index)
+    STUDENT_OVERVIEW_CACHE_SIZE: int = 1024
+    STUDENT_OVERVIEW_CACHE_TTL: int = 30
+    STUDENT_OVERVIEW_RECENT_EXAMS: int = 5
     
     class Config:
         env_file = env_path
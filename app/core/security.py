@@ -5,7 +5,10 @@ from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 from ..database import get_db
 from ..models.models import User
+from . import auth_cache
+from starlette.concurrency import run_in_threadpool
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()  # โหลดค่าใน .env
@@ -22,18 +25,23 @@ def admin_required(allowed_roles: list = ["admin"]):
             detail="Invalid credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            username: str = payload.get("sub")
-            role: str = payload.get("role")
-            if username is None:
+        cached = auth_cache.get_cached("security", token)
+        if cached is not None:
+            payload, user = cached
+        else:
+            started = time.perf_counter()
+            try:
+                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+                username: str = payload.get("sub")
+                if username is None:
+                    raise credentials_exception
+            except JWTError:
                 raise credentials_exception
-            token_data = TokenData(username=username)
-        except JWTError:
-            raise credentials_exception
-        user = db.query(User).filter(User.username == token_data.username).first()
-        if user is None:
-            raise credentials_exception
+            user = await run_in_threadpool(auth_cache.load_user_snapshot, db, User.username == username)
+            if user is None:
+                raise credentials_exception
+            auth_cache.store("security", token, payload, user, started)
+        role: str = auth_cache.user_role(user, payload.get("role"))
         if role not in allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
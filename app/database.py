@@ -12,8 +12,37 @@ load_dotenv()
 # สร้าง database URL
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
+
+def _is_sqlite(url):
+    return url.startswith("sqlite")
+
+
+def _pool_kwargs(url):
+    # SQLite ใช้ pool ของตัวเอง ไม่รับค่า pool_size/max_overflow
+    if _is_sqlite(url):
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def _connect_args(url):
+    # statement_timeout ฝั่ง Postgres (ms), 0 = ไม่จำกัด
+    if not settings.DB_STATEMENT_TIMEOUT_MS or not url.startswith("postgresql"):
+        return {}
+    return {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
+
+
 # สร้าง engine
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args=_connect_args(SQLALCHEMY_DATABASE_URL),
+    **_pool_kwargs(SQLALCHEMY_DATABASE_URL),
+)
 
 # สร้าง SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -27,4 +56,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
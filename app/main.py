@@ -5,7 +5,12 @@ from fastapi.openapi.utils import get_openapi
 from fastapi.security import OAuth2PasswordBearer, HTTPBearer
 from .database import engine
 from .models import models
-from app.routers import students, courses, enrollments, auth, line_auth, line_webhook, invoice, finance, exams, admin
+from app.routers import students, courses, enrollments, auth, line_auth, line_webhook, invoice, finance, exams, admin, broadcasts, exports, payments, attendance, schedules
+from app.utils import import_jobs, line_broadcast, autosave, scheduling
+from app.utils.invoice_scheduler import scheduler as invoice_scheduler
+from app.utils.line_client import close_line_clients
+from app.utils.line_webhook_pipeline import dispatcher as line_webhook_dispatcher
+from app.core.config import settings
 
 models.Base.metadata.create_all(bind=engine)
 
@@ -27,6 +32,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(students.router)
@@ -36,9 +42,34 @@ app.include_router(auth.router)
 app.include_router(line_auth.router)
 app.include_router(line_webhook.router)
 app.include_router(invoice.router)
+app.include_router(payments.router)
 app.include_router(finance.router)
 app.include_router(exams.router)
 app.include_router(admin.router)
+app.include_router(broadcasts.router)
+app.include_router(exports.router)
+app.include_router(attendance.router)
+app.include_router(schedules.router)
+
+@app.on_event("startup")
+async def on_startup():
+    import_jobs.resume_pending_jobs()
+    await line_broadcast.resume_broadcasts()
+    line_webhook_dispatcher.start()
+    scheduling.index.load()  # index ห้อง/ครูสำหรับตรวจตารางชน
+    if settings.AUTOSAVE_ENABLED:
+        await autosave.buffer.start(settings.AUTOSAVE_FLUSH_INTERVAL)
+    if settings.INVOICE_SCHEDULER_ENABLED:
+        invoice_scheduler.start(settings.INVOICE_SCHEDULER_INTERVAL)
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    import_jobs.shutdown_executor()
+    await line_webhook_dispatcher.stop(timeout=settings.LINE_WEBHOOK_DRAIN_SECONDS)
+    await line_broadcast.cancel_running_broadcasts()
+    await autosave.buffer.stop()
+    await invoice_scheduler.stop()
+    await close_line_clients()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/admin/login")
 bearer_scheme = HTTPBearer()
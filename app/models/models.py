@@ -1,5 +1,5 @@
 # app/models/models.py
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Float, Text, Date, Numeric
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Float, Text, Date, Numeric, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
@@ -35,7 +35,7 @@ class Student(Base):
     last_name = Column(String)
     email = Column(String, unique=True, index=True)
     phone = Column(String)
-    line_id = Column(String)
+    line_id = Column(String)  # LINE userId (U...) ส่งข้อความได้เมื่อตรงกับ user.line_user_id ของคนที่ login ผ่าน LINE แล้ว
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -59,10 +59,17 @@ class Course(Base):
     attendances = relationship("Attendance", back_populates="course")
     schedules = relationship("Schedule", back_populates="course")
 
+class CoursePrice(Base):
+    __tablename__ = "course_price"
+
+    course_id = Column(Integer, ForeignKey("course.course_id", ondelete="CASCADE"), primary_key=True)
+    price = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class Enrollment(Base):
     __tablename__ = "enrollment"
     enrollment_id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(Integer, ForeignKey("student.student_id"))
+    student_id = Column(Integer, ForeignKey("student.student_id"), index=True)
     course_id = Column(Integer, ForeignKey("course.course_id"))
     enroll_date = Column(Date)
     expire_date = Column(Date)
@@ -71,6 +78,14 @@ class Enrollment(Base):
     student = relationship("Student", back_populates="enrollments")
     course = relationship("Course", back_populates="enrollments")
 
+    # นักเรียนหนึ่งคนมี enrollment ที่ active ได้แค่หนึ่งแถวต่อคอร์ส (กันสอง request ลงทะเบียนพร้อมกัน)
+    __table_args__ = (
+        Index(
+            "uq_enrollment_active_student_course", "student_id", "course_id", unique=True,
+            postgresql_where=(status == "active"), sqlite_where=(status == "active"),
+        ),
+    )
+
 class Teacher(Base):
     __tablename__ = "teacher"
 
@@ -109,6 +124,24 @@ class Attendance(Base):
     student = relationship("Student", back_populates="attendances")
     course = relationship("Course", back_populates="attendances")
 
+    # หนึ่งแถวต่อ (คาบเรียน, นักเรียน) ใช้เป็น key ของ bulk upsert และ index สำหรับดึงทั้งคาบ
+    __table_args__ = (
+        UniqueConstraint("course_id", "date", "student_id", name="uq_attendance_session_student"),
+    )
+
+class AttendanceCounter(Base):
+    __tablename__ = "attendance_counter"
+
+    # ตัวนับสะสมต่อ (นักเรียน, คอร์ส) อัปเดตพร้อมกับการเช็คชื่อ ใช้คำนวณอัตราการเข้าเรียนโดยไม่ต้อง scan attendance
+    student_id = Column(Integer, ForeignKey("student.student_id", ondelete="CASCADE"), primary_key=True)
+    course_id = Column(Integer, ForeignKey("course.course_id", ondelete="CASCADE"), primary_key=True)
+    sessions = Column(Integer, nullable=False, default=0)
+    present = Column(Integer, nullable=False, default=0)
+    late = Column(Integer, nullable=False, default=0)
+    absent = Column(Integer, nullable=False, default=0)
+    excused = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class Schedule(Base):
     __tablename__ = "schedule"
 
@@ -121,6 +154,10 @@ class Schedule(Base):
     course = relationship("Course", back_populates="schedules")
     classroom = relationship("Classroom", back_populates="schedules")
 
+    __table_args__ = (
+        Index("ix_schedule_classroom_start", "classroom_id", "start_time"),
+    )
+
 class RefreshToken(Base):
     __tablename__ = "refresh_token"
 
@@ -134,9 +171,12 @@ class RefreshToken(Base):
 
 class Invoice(Base):
     __tablename__ = "invoice"
+    __table_args__ = (
+        Index("ix_invoice_status_due_date", "status", "due_date"),  # ใช้ตอน sweep ใบแจ้งหนี้ใกล้ครบ/เลยกำหนด
+    )
 
     invoice_id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(Integer, ForeignKey("student.student_id"), nullable=False)
+    student_id = Column(Integer, ForeignKey("student.student_id"), nullable=False, index=True)
     enrollment_id = Column(Integer, ForeignKey("enrollment.enrollment_id"), nullable=False)
     invoice_date = Column(DateTime, nullable=False)
     due_date = Column(DateTime, nullable=False)
@@ -149,6 +189,23 @@ class Invoice(Base):
     enrollment = relationship("Enrollment")
     payments = relationship("Payment", back_populates="invoice")
 
+class InvoiceReminder(Base):
+    __tablename__ = "invoice_reminders"
+    __table_args__ = (
+        UniqueConstraint("invoice_id", "kind", name="uq_invoice_reminder_kind"),
+    )
+
+    reminder_id = Column(Integer, primary_key=True, index=True)
+    invoice_id = Column(Integer, ForeignKey("invoice.invoice_id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String(20), nullable=False)  # due_soon, overdue
+    status = Column(String(20), default="queued")  # queued, sent, failed
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    heartbeat_at = Column(DateTime, nullable=True)  # worker ที่กำลังส่งต่ออายุ claim เป็นระยะ
+    next_attempt_at = Column(DateTime, nullable=True)  # failed: ส่งใหม่ได้หลังเวลานี้
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
 class Payment(Base):
     __tablename__ = "payment"
 
@@ -237,7 +294,7 @@ class StudentExam(Base):
     __tablename__ = "student_exams"
 
     student_exam_id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(Integer, ForeignKey("student.student_id", ondelete="CASCADE"), nullable=False)
+    student_id = Column(Integer, ForeignKey("student.student_id", ondelete="CASCADE"), nullable=False, index=True)
     exam_id = Column(Integer, ForeignKey("exams.exam_id", ondelete="CASCADE"), nullable=False)
     started_at = Column(DateTime)
     finished_at = Column(DateTime)
@@ -253,6 +310,9 @@ class StudentExam(Base):
 
 class StudentAnswer(Base):
     __tablename__ = "student_answers"
+    __table_args__ = (
+        UniqueConstraint("student_exam_id", "question_id", name="uq_student_answer_question"),
+    )
 
     student_answer_id = Column(Integer, primary_key=True, index=True)
     student_exam_id = Column(Integer, ForeignKey("student_exams.student_exam_id", ondelete="CASCADE"), nullable=False)
@@ -280,4 +340,114 @@ class Admin(Base):
     role = relationship("Role", back_populates="admins")
 
     def is_admin(self):
-        return self.role.role_name == "admin"
\ No newline at end of file
+        return self.role.role_name == "admin"
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+
+    job_id = Column(Integer, primary_key=True, index=True)
+    filename = Column(String(255), nullable=False)
+    file_path = Column(Text, nullable=False)
+    status = Column(String(20), default="queued", index=True)  # queued, running, completed, failed, cancelled
+    cancel_requested = Column(Boolean, default=False)
+    rows_done = Column(Integer, default=0)
+    rows_skipped = Column(Integer, default=0)  # โจทย์ซ้ำที่ถูกข้าม
+    rows_invalid = Column(Integer, default=0)
+    questions_inserted = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    lease_id = Column(String(32), nullable=True)  # token ของ worker ที่ถือ job อยู่
+    heartbeat_at = Column(DateTime, nullable=True)  # worker ต่ออายุ lease เป็นระยะ
+    created_by = Column(Integer, ForeignKey("user.user_id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Broadcast(Base):
+    __tablename__ = "broadcasts"
+
+    broadcast_id = Column(Integer, primary_key=True, index=True)
+    message = Column(Text, nullable=False)
+    status = Column(String(20), default="pending", index=True)  # pending, running, completed, failed
+    total_recipients = Column(Integer, default=0)
+    sent_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    created_by = Column(Integer, ForeignKey("user.user_id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    recipients = relationship("BroadcastRecipient", back_populates="broadcast", cascade="all, delete-orphan")
+
+
+class BroadcastRecipient(Base):
+    __tablename__ = "broadcast_recipients"
+    __table_args__ = (
+        UniqueConstraint("broadcast_id", "line_user_id", name="uq_broadcast_recipient"),
+        Index("ix_broadcast_recipient_status", "broadcast_id", "status", "batch_no"),
+    )
+
+    recipient_id = Column(Integer, primary_key=True, index=True)
+    broadcast_id = Column(Integer, ForeignKey("broadcasts.broadcast_id", ondelete="CASCADE"), nullable=False)
+    line_user_id = Column(String, nullable=False)
+    batch_no = Column(Integer, nullable=False)
+    status = Column(String(20), default="pending")  # pending, sent, failed
+    error = Column(Text, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+
+    broadcast = relationship("Broadcast", back_populates="recipients")
+
+
+# ----------------- สถิติข้อสอบ (summary tables สำหรับ /exams/{id}/analytics) -----------------
+
+class ExamScoreStat(Base):
+    __tablename__ = "exam_score_stats"
+
+    exam_id = Column(Integer, ForeignKey("exams.exam_id", ondelete="CASCADE"), primary_key=True)
+    attempts = Column(Integer, default=0)
+    score_sum = Column(Float, default=0.0)
+    score_sq_sum = Column(Float, default=0.0)
+    min_score = Column(Float, nullable=True)
+    max_score = Column(Float, nullable=True)
+    attempts_at_rebuild = Column(Integer, default=0)  # discrimination คำนวณจาก attempt ชุดนี้
+    rebuilt_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ExamScoreBin(Base):
+    __tablename__ = "exam_score_bins"
+
+    exam_id = Column(Integer, ForeignKey("exams.exam_id", ondelete="CASCADE"), primary_key=True)
+    bin_no = Column(Integer, primary_key=True)  # 0 = 0-9.99, ..., 9 = 90-100
+    count = Column(Integer, default=0)
+
+
+class ExamQuestionStat(Base):
+    __tablename__ = "exam_question_stats"
+
+    question_id = Column(Integer, ForeignKey("questions.question_id", ondelete="CASCADE"), primary_key=True)
+    exam_id = Column(Integer, ForeignKey("exams.exam_id", ondelete="CASCADE"), nullable=False, index=True)
+    attempts = Column(Integer, default=0)
+    correct_count = Column(Integer, default=0)
+    discrimination = Column(Float, nullable=True)  # p(กลุ่มสูง 27%) - p(กลุ่มต่ำ 27%)
+
+
+class ExamChoiceStat(Base):
+    __tablename__ = "exam_choice_stats"
+
+    choice_id = Column(Integer, ForeignKey("choices.choice_id", ondelete="CASCADE"), primary_key=True)
+    question_id = Column(Integer, ForeignKey("questions.question_id", ondelete="CASCADE"), nullable=False)
+    exam_id = Column(Integer, ForeignKey("exams.exam_id", ondelete="CASCADE"), nullable=False, index=True)
+    picked_count = Column(Integer, default=0)
+
+
+class FinanceDailyRollup(Base):
+    __tablename__ = "finance_daily_rollup"
+
+    day = Column(Date, primary_key=True)
+    kind = Column(String(10), primary_key=True)  # income, expense
+    category = Column(String(100), primary_key=True, default="")  # income_type / expense_type ("" = ไม่ระบุ)
+    total = Column(Float, default=0.0)
+    count = Column(Integer, default=0)
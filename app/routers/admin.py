@@ -5,6 +5,9 @@ from app.database import get_db
 from app.models.models import User, Role
 from app.schemas.schemas import UserResponse
 from app.core.security import admin_required
+from app.core import auth_cache
+from app.utils import line_token, exam_cache, grading, autosave, attendance, scheduling, course_catalog, student_search, student_overview
+from app.utils.line_webhook_pipeline import dispatcher as line_webhook_dispatcher
 
 router = APIRouter(
     prefix="/admin",
@@ -26,4 +29,23 @@ def update_user_role(user_id: int, role_id: int, db: Session = Depends(get_db),
         raise HTTPException(status_code=404, detail="Role not found")
     user.role_id = role_id
     db.commit()
-    return {"message": "User role updated successfully"}
\ No newline at end of file
+    # role เปลี่ยน: ล้าง principal ที่ cache ไว้ของ user นี้
+    auth_cache.invalidate_user(user_id)
+    return {"message": "User role updated successfully"}
+
+# ตัวเลข cache / metrics ของระบบ
+@router.get("/metrics")
+def read_metrics(admin=Depends(admin_required(["admin"]))):
+    return {
+        "line_id_token_cache": line_token.get_stats(),
+        "line_webhook": line_webhook_dispatcher.get_metrics(),
+        "auth_cache": auth_cache.get_stats(),
+        "exam_detail_cache": exam_cache.get_stats(),
+        "answer_key_cache": grading.get_stats(),
+        "exam_autosave": autosave.buffer.get_metrics(),
+        "attendance_roster_cache": attendance.get_stats(),
+        "schedule_index": scheduling.index.get_metrics(),
+        "course_catalog_cache": course_catalog.get_stats(),
+        "student_search_index": student_search.get_stats(),
+        "student_overview_cache": student_overview.get_stats(),
+    }
\ No newline at end of file
@@ -0,0 +1,73 @@
+# app/routers/attendance.py
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.routers.line_auth import role_required
+from app.schemas import schemas
+from app.utils import attendance
+
+router = APIRouter(
+    prefix="/attendance",
+    tags=["attendance"],
+)
+
+# รายชื่อนักเรียนในคอร์สสำหรับหน้าเช็คชื่อ (cache ต่อคอร์ส ล้างอัตโนมัติเมื่อ enrollment เปลี่ยน)
+@router.get("/courses/{course_id}/roster", response_model=schemas.CourseRoster)
+def get_course_roster(
+    course_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    roster = attendance.get_roster(db, course_id)
+    if roster is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    return Response(content=roster["json"], media_type="application/json")
+
+# เช็คชื่อทั้งคาบในครั้งเดียว (multi-row upsert + อัปเดตตัวนับใน transaction เดียวกัน)
+@router.post("/check_in", response_model=schemas.AttendanceBulkResult)
+def bulk_check_in(
+    payload: schemas.AttendanceBulkCheckIn,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    try:
+        return attendance.bulk_check_in(
+            db, payload.course_id, payload.session_date, payload.records, default_status=payload.default_status
+        )
+    except attendance.AttendanceError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+# สถานะการเช็คชื่อของคาบเรียน (ใช้เติมหน้าจอเมื่อเปิดคาบเดิมซ้ำ)
+@router.get("/courses/{course_id}/sessions", response_model=List[schemas.AttendanceMark])
+def get_session(
+    course_id: int,
+    session_date: datetime,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    return attendance.get_session_marks(db, course_id, session_date)
+
+# อัตราการเข้าเรียนของทั้งคอร์ส
+@router.get("/courses/{course_id}/rates", response_model=List[schemas.AttendanceRate])
+def get_course_rates(
+    course_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    return attendance.get_rates(db, course_id=course_id)
+
+# อัตราการเข้าเรียนของนักเรียน (นักเรียนดูได้เฉพาะของตัวเอง)
+@router.get("/students/{student_id}/rates", response_model=List[schemas.AttendanceRate])
+def get_student_rates(
+    student_id: int,
+    course_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher", "student"]))
+):
+    if user["role"] == "student" and user["user"].student_id != student_id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return attendance.get_rates(db, student_id=student_id, course_id=course_id)
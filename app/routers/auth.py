@@ -4,10 +4,12 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models.models import Admin, Role  # import Admin และ Role model
 from app.core.config import settings
+from app.core import auth_cache
 from passlib.context import CryptContext
 from jose import jwt, JWTError
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 import datetime
+import time
 
 router = APIRouter(
     prefix="/auth",
@@ -43,6 +45,11 @@ def admin_login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     return {"access_token": token, "token_type": "bearer"}
 
 def get_current_admin(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    cached = auth_cache.get_cached("admin", token)
+    if cached is not None:
+        payload, admin = cached
+        return {"admin": admin, "role": payload.get("role")}
+    started = time.perf_counter()
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -56,9 +63,10 @@ def get_current_admin(token: str = Depends(oauth2_scheme), db: Session = Depends
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    admin = db.query(Admin).filter(Admin.username == username).first()
+    admin = auth_cache.load_admin_snapshot(db, username)
     if admin is None:
         raise credentials_exception
+    auth_cache.store("admin", token, payload, admin, started)
     return {"admin": admin, "role": role}
 
 def admin_required(allowed_roles: list):
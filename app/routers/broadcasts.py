@@ -0,0 +1,50 @@
+# app/routers/broadcasts.py
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.database import get_db
+from app.models import models
+from app.routers.line_auth import role_required
+from app.schemas import schemas
+from app.utils import line_broadcast
+
+router = APIRouter(
+    prefix="/broadcasts",
+    tags=["broadcasts"]
+)
+
+# สร้าง broadcast แล้วเริ่มส่งแบบ background ทันที
+@router.post("/", response_model=schemas.BroadcastRead)
+async def create_broadcast(
+    data: schemas.BroadcastCreate,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    broadcast = await run_in_threadpool(line_broadcast.create_broadcast, db, data, user["user"].user_id)
+    line_broadcast.schedule_broadcast(broadcast.broadcast_id)
+    return broadcast
+
+# throughput / จำนวน batch ที่ส่งสำเร็จ-ล้มเหลว
+@router.get("/metrics")
+def broadcast_metrics(user=Depends(role_required(["admin", "teacher"]))):
+    return line_broadcast.get_metrics()
+
+# สถานะการส่งของ broadcast
+@router.get("/{broadcast_id}", response_model=schemas.BroadcastRead)
+def get_broadcast(broadcast_id: int, db: Session = Depends(get_db), user=Depends(role_required(["admin", "teacher"]))):
+    broadcast = db.query(models.Broadcast).filter(models.Broadcast.broadcast_id == broadcast_id).first()
+    if not broadcast:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return broadcast
+
+# ส่งซ้ำเฉพาะผู้รับที่ล้มเหลว
+@router.post("/{broadcast_id}/retry", response_model=schemas.BroadcastRead)
+async def retry_broadcast(
+    broadcast_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    broadcast = await run_in_threadpool(line_broadcast.retry_failed_recipients, db, broadcast_id)
+    line_broadcast.schedule_broadcast(broadcast.broadcast_id)
+    return broadcast
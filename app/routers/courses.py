@@ -1,15 +1,51 @@
 # app/routers/courses.py
-from fastapi import APIRouter
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from app.database import get_db
 from sqlalchemy.orm import Session
 from app.models.models import Course  # Import Course model if needed
+from app.schemas.schemas import CoursePriceRead, CoursePriceUpdate, CourseCatalogItem, CourseCatalogDetail
+from app.core.security import admin_required
+from app.utils import course_catalog, course_prices
 
 router = APIRouter(
     prefix="/courses",
     tags=["courses"]
 )
 
-# ตัวอย่าง endpoint (ลบออกได้ถ้ายังไม่ใช้)
-@router.get("/")
-def read_courses():
-    return {"message": "List of courses"}
\ No newline at end of file
+
+def _conditional(request: Request, entry):
+    # client ส่ง ETag เดิมมา และยังตรงกับ cache: ตอบ 304 โดยไม่แตะ DB และไม่ส่ง body ซ้ำ
+    etag, body = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if course_catalog.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# รายการคอร์สทั้งหมดพร้อมครู ราคา และสรุปคาบเรียน (cache ตาม catalog version + ETag)
+@router.get("/", response_model=List[CourseCatalogItem])
+def read_courses(request: Request, db: Session = Depends(get_db)):
+    return _conditional(request, course_catalog.get_catalog(db))
+
+# ตารางราคาคอร์ส (อ่านจาก cache)
+@router.get("/prices", response_model=List[CoursePriceRead])
+def list_course_prices(db: Session = Depends(get_db)):
+    return [{"course_id": course_id, "price": price} for course_id, price in sorted(course_prices.get_price_table(db).items())]
+
+@router.put("/{course_id}/price", response_model=CoursePriceRead)
+def update_course_price(course_id: int, data: CoursePriceUpdate, db: Session = Depends(get_db), admin=Depends(admin_required(["admin"]))):
+    if not db.query(Course.course_id).filter(Course.course_id == course_id).first():
+        raise HTTPException(status_code=404, detail="Course not found")
+    if data.price < 0:
+        raise HTTPException(status_code=400, detail="Price must not be negative")
+    row = course_prices.set_price(db, course_id, data.price)
+    return {"course_id": row.course_id, "price": row.price}
+
+# รายละเอียดคอร์สพร้อมตารางเรียน
+@router.get("/{course_id}", response_model=CourseCatalogDetail)
+def read_course(course_id: int, request: Request, db: Session = Depends(get_db)):
+    entry = course_catalog.get_course(db, course_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    return _conditional(request, entry)
@@ -1,53 +1,34 @@
 # app/routers/enrollments.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from ..database import get_db
-from ..models.models import Enrollment, Invoice, Course
-from ..schemas.schemas import EnrollmentCreate, EnrollmentResponse, InvoiceCreate
-from app.routers.auth import admin_required
-from datetime import datetime, timedelta, date
+from ..utils.pagination import paginate
+from ..models.models import Enrollment
+from ..schemas.schemas import EnrollmentCreate, EnrollmentResponse, EnrollmentWithInvoice, BulkEnrollmentCreate, BulkEnrollmentResult
+from ..utils import enrollment_service
+from app.core.security import admin_required
 
 router = APIRouter(
     prefix="/enrollments",
     tags=["enrollments"]
 )
 
-from datetime import date
-
-@router.post("/", response_model=EnrollmentResponse)
+# สร้าง enrollment + invoice ใน transaction เดียว (ราคาอ่านจาก cache ของตาราง course_price)
+@router.post("/", response_model=EnrollmentWithInvoice)
 def create_enrollment(enrollment: EnrollmentCreate, db: Session = Depends(get_db)):
-    # สร้าง enrollment โดยกำหนด enroll_date เป็นวันนี้
-    db_enrollment = Enrollment(
-        student_id=enrollment.student_id,
-        course_id=enrollment.course_id,
-        enroll_date=date.today(),  # ใช้ enroll_date แทน enrolled_at
-        status="active"
-    )
-    db.add(db_enrollment)
-    db.commit()
-    db.refresh(db_enrollment)
-
-    # ดึงราคาคอร์สจริงจากตาราง course
-    course = db.query(Course).filter(Course.course_id == enrollment.course_id).first()
-    total_amount = course.price if course else 0
-
-    # สร้าง invoice อัตโนมัติ
-    invoice_data = InvoiceCreate(
-        student_id=enrollment.student_id,
-        enrollment_id=db_enrollment.enrollment_id,
-        invoice_date=date.today(),
-        due_date=date.today() + timedelta(days=7),
-        total_amount=total_amount,
-        description="Invoice for enrollment",
-        status="pending"
-    )
-    db_invoice = Invoice(**invoice_data.dict())
-    db.add(db_invoice)
-    db.commit()
-    db.refresh(db_invoice)
-
-    return db_enrollment
+    try:
+        return enrollment_service.enroll_student(db, enrollment.student_id, enrollment.course_id)
+    except enrollment_service.EnrollmentError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+# ลงทะเบียนนักเรียนทั้งห้องในครั้งเดียว (ข้ามคนที่ลงทะเบียนอยู่แล้ว)
+@router.post("/bulk", response_model=BulkEnrollmentResult)
+def bulk_enroll(data: BulkEnrollmentCreate, db: Session = Depends(get_db), admin=Depends(admin_required(["admin"]))):
+    try:
+        return enrollment_service.bulk_enroll(db, data.course_id, data.student_ids)
+    except enrollment_service.EnrollmentError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
 @router.get("/{enrollment_id}", response_model=EnrollmentResponse)
 def get_enrollment(enrollment_id: int, db: Session = Depends(get_db)):
@@ -57,8 +38,8 @@ def get_enrollment(enrollment_id: int, db: Session = Depends(get_db)):
     return db_enrollment
 
 @router.get("/", response_model=List[EnrollmentResponse])
-def list_enrollments(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    enrollments = db.query(Enrollment).offset(skip).limit(limit).all()
+def list_enrollments(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    enrollments = paginate(db.query(Enrollment), response, Enrollment.enrollment_id, skip=skip, limit=limit, cursor=cursor)
     return enrollments
 
 @router.put("/{enrollment_id}", response_model=EnrollmentResponse)
@@ -1,15 +1,21 @@
 # app/routers/exams.py
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Body
-from typing import List
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, UploadFile, File, Body, Response
+from typing import List, Optional
 from sqlalchemy.orm import Session
 import pandas as pd
 import re
+from datetime import datetime
 
 from app.database import get_db
 from app.routers.line_auth import get_current_user, role_required
 from app.schemas import schemas
 from app.models import models
 from app.core.security import admin_required
+from app.core.config import settings
+from app.utils.pagination import paginate
+from app.utils import exam_cache, grading, autosave, exam_analytics
+from app.utils.exam_import import import_dataframe, import_chunks
+from app.utils.import_jobs import submit_import_job, get_import_job, cancel_import_job
 
 router = APIRouter(
     prefix="/exams",
@@ -33,17 +39,18 @@ def create_exam(
 
 # ดึงรายการข้อสอบทั้งหมด
 @router.get("/", response_model=List[schemas.ExamRead])
-def list_exams(skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    exams = db.query(models.Exam).offset(skip).limit(limit).all()
+def list_exams(response: Response, skip: int = 0, limit: int = 20, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    exams = paginate(db.query(models.Exam), response, models.Exam.exam_id, skip=skip, limit=limit, cursor=cursor)
     return exams
 
 # ดึงรายละเอียดข้อสอบพร้อมคำถาม
 @router.get("/{exam_id}", response_model=schemas.ExamDetail)
 def get_exam(exam_id: int, db: Session = Depends(get_db)):
-    exam = db.query(models.Exam).filter(models.Exam.exam_id == exam_id).first()
-    if not exam:
+    # โหลดทั้ง tree แบบ eager แล้ว cache JSON ไว้ต่อ exam (ล้างอัตโนมัติเมื่อ question/choice เปลี่ยน)
+    body = exam_cache.get_exam_detail_json(db, exam_id)
+    if body is None:
         raise HTTPException(status_code=404, detail="Exam not found")
-    return exam
+    return Response(content=body, media_type="application/json")
 
 # นักเรียนเริ่มสอบ (สร้าง student_exam record)
 @router.post("/{exam_id}/start", response_model=schemas.StudentExamRead)
@@ -60,39 +67,132 @@ def start_exam(
     if not student_id:
         raise HTTPException(status_code=403, detail="User is not a student")
 
-    student_exam = models.StudentExam(student_id=student_id, exam_id=exam_id, status="in_progress")
+    student_exam = models.StudentExam(
+        student_id=student_id, exam_id=exam_id, status="in_progress", started_at=datetime.utcnow()
+    )
     db.add(student_exam)
     db.commit()
     db.refresh(student_exam)
     return student_exam
 
-# ส่งคำตอบของนักเรียน
-@router.post("/student_exams/{student_exam_id}/answers", response_model=schemas.StudentAnswerRead)
-def submit_answer(student_exam_id: int, answer: schemas.StudentAnswerCreate, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    # ตรวจสอบ student_exam
+def get_own_student_exam(db: Session, student_exam_id: int, user):
     student_exam = db.query(models.StudentExam).filter(models.StudentExam.student_exam_id == student_exam_id).first()
     if not student_exam:
         raise HTTPException(status_code=404, detail="Student exam not found")
     # ตรวจสอบสิทธิ์ผู้ใช้
-    if student_exam.student_id != user.student_id:
+    if student_exam.student_id != user["user"].student_id:
         raise HTTPException(status_code=403, detail="Not authorized")
-    # บันทึกคำตอบ
-    student_answer = models.StudentAnswer(student_exam_id=student_exam_id, **answer.dict())
-    db.add(student_answer)
+    return student_exam
+
+def save_answers(db: Session, student_exam, answers):
+    if student_exam.status == "completed":
+        raise HTTPException(status_code=409, detail="Exam already finished")
+    try:
+        return grading.upsert_answers(db, student_exam, answers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# ส่งคำตอบของนักเรียน (ตรวจทันทีจาก answer key ที่ precompute ไว้, ส่งซ้ำได้)
+@router.post("/student_exams/{student_exam_id}/answers", response_model=schemas.StudentAnswerRead)
+def submit_answer(student_exam_id: int, answer: schemas.StudentAnswerCreate, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    student_exam = get_own_student_exam(db, student_exam_id, user)
+    return save_answers(db, student_exam, [answer])[0]
+
+# ส่งคำตอบหลายข้อพร้อมกัน: upsert ใน statement เดียว commit ครั้งเดียว
+@router.post("/student_exams/{student_exam_id}/answers/batch", response_model=schemas.StudentAnswerBatchResult)
+def submit_answers_batch(student_exam_id: int, batch: schemas.StudentAnswerBatch, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    student_exam = get_own_student_exam(db, student_exam_id, user)
+    saved = save_answers(db, student_exam, batch.answers)
+    return {
+        "student_exam_id": student_exam_id,
+        "saved": len(saved),
+        "correct": sum(1 for answer in saved if answer.is_correct),
+        "answers": [schemas.StudentAnswerRead.model_validate(answer, from_attributes=True) for answer in saved],
+    }
+
+# autosave ระหว่างสอบ: เก็บ draft ใน buffer แล้ว flush ลง student_answers เป็นรอบ ๆ
+@router.put("/student_exams/{student_exam_id}/autosave")
+def autosave_answers(student_exam_id: int, batch: schemas.StudentAnswerBatch, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    student_exam = get_own_student_exam(db, student_exam_id, user)
+    if not settings.AUTOSAVE_ENABLED:
+        saved = save_answers(db, student_exam, batch.answers)
+        return {"student_exam_id": student_exam_id, "mode": "write_through", "saved": len(saved)}
+    if student_exam.status == "completed":
+        raise HTTPException(status_code=409, detail="Exam already finished")
+    key = grading.get_answer_key(db, student_exam.exam_id)
+    unknown = sorted({answer.question_id for answer in batch.answers if answer.question_id not in key.correct_choices})
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Questions not in this exam: {unknown}")
+    buffered = autosave.buffer.put(student_exam_id, batch.answers)
+    return {"student_exam_id": student_exam_id, "mode": "buffered", "saved": buffered}
+
+# ส่งข้อสอบ: flush draft ที่ค้างอยู่ก่อน แล้วคำนวณคะแนนรวม
+@router.post("/student_exams/{student_exam_id}/finish", response_model=schemas.StudentExamResult)
+def finish_exam(student_exam_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    student_exam = get_own_student_exam(db, student_exam_id, user)
+    if student_exam.status == "completed":
+        return student_exam
+    try:
+        autosave.buffer.flush(student_exam_id)
+    except Exception:
+        raise HTTPException(status_code=503, detail="Could not save answers, please retry")
+    db.refresh(student_exam)
+    if not grading.finish_student_exam(db, student_exam):
+        # request อื่นส่งข้อสอบนี้ไปแล้ว: คืนผลเดิม ไม่นับ attempt ซ้ำใน summary
+        db.rollback()
+        db.refresh(student_exam)
+        return student_exam
+    exam_analytics.record_attempt(db, student_exam)
     db.commit()
-    db.refresh(student_answer)
-    return student_answer
+    db.refresh(student_exam)
+    if exam_analytics.needs_rebuild(db, student_exam.exam_id):
+        background_tasks.add_task(exam_analytics.rebuild_in_background, student_exam.exam_id)
+    return student_exam
 
 # ดึงผลสอบของนักเรียน
 @router.get("/student_exams/{student_exam_id}/results", response_model=schemas.StudentExamResult)
 def get_exam_result(student_exam_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    student_exam = db.query(models.StudentExam).filter(models.StudentExam.student_exam_id == student_exam_id).first()
-    if not student_exam:
-        raise HTTPException(status_code=404, detail="Student exam not found")
-    if student_exam.student_id != user.student_id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    # คำนวณหรือดึงผลสอบ (สมมติว่ามีฟิลด์ score)
-    return student_exam
+    return get_own_student_exam(db, student_exam_id, user)
+
+# ตรวจใหม่ทั้ง exam หลังแก้เฉลย
+@router.post("/{exam_id}/regrade")
+def regrade_exam(
+    exam_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    exam = db.query(models.Exam).filter(models.Exam.exam_id == exam_id).first()
+    if not exam:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    result = grading.regrade_exam(db, exam_id)
+    # คะแนนเปลี่ยน: สถิติเดิมใช้ไม่ได้แล้ว
+    background_tasks.add_task(exam_analytics.rebuild_in_background, exam_id)
+    return {"status": "success", **result}
+
+# สถิติข้อสอบ (อ่านจาก summary tables)
+@router.get("/{exam_id}/analytics", response_model=schemas.ExamAnalytics)
+def get_exam_analytics(
+    exam_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    exam = db.query(models.Exam).filter(models.Exam.exam_id == exam_id).first()
+    if not exam:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    return exam_analytics.get_exam_analytics(db, exam_id)
+
+# คำนวณสถิติใหม่ทั้งหมดด้วย pandas (เช่นหลังแก้ข้อมูลย้อนหลัง)
+@router.post("/{exam_id}/analytics/rebuild")
+def rebuild_exam_analytics(
+    exam_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    exam = db.query(models.Exam).filter(models.Exam.exam_id == exam_id).first()
+    if not exam:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    return {"status": "success", **exam_analytics.rebuild_exam_stats(db, exam_id)}
 
 # TODO: เพิ่ม endpoint สำหรับดาวน์โหลดผลสอบ (PDF/Word) พร้อมลายน้ำ
 
@@ -118,9 +218,24 @@ def read_google_sheet(sheet_url: str) -> pd.DataFrame:
 async def import_exam_file(
     file: UploadFile = File(None),
     sheet_url: str = Body(None),
+    stream: bool = False,
+    background: bool = False,
     db: Session = Depends(get_db),
     user=Depends(role_required(["admin", "teacher"]))
 ):
+    chunk_size = settings.EXAM_IMPORT_CHUNK_SIZE
+    # background mode: เก็บไฟล์แล้วตอบ job_id กลับทันที ให้ worker pool ทำต่อ
+    if background:
+        if not file or sheet_url:
+            raise HTTPException(status_code=400, detail="Background import requires an uploaded file")
+        job = submit_import_job(db, file, user_id=user["user"].user_id)
+        return {"status": "queued", "job_id": job.job_id}
+
+    # streaming mode: อ่านไฟล์ทีละ chunk แล้วบันทึกทันที (ใช้กับไฟล์ขนาดใหญ่)
+    if stream and file and not sheet_url:
+        importer = import_chunks(db, file.filename, file.file, chunk_size=chunk_size)
+        return {"status": "success", "message": "Imported successfully", **importer.result()}
+
     # อ่านไฟล์หรือ Google Sheet
     if sheet_url:
         df = read_google_sheet(sheet_url)
@@ -134,51 +249,24 @@ async def import_exam_file(
     else:
         raise HTTPException(status_code=400, detail="No file or sheet_url provided")
     
-    # ตรวจสอบคอลัมน์หลัก
-    required_cols = ['subject', 'grade', 'question_text', 'answer']
-    if not all(col in df.columns for col in required_cols):
-        raise HTTPException(status_code=400, detail=f"Missing required columns: {required_cols}")
-    
-    # หา columns ที่เป็น choice
-    choice_cols = [col for col in df.columns if col.startswith('choice') and df[col].notnull().any()]
-    if not choice_cols:
-        raise HTTPException(status_code=400, detail="No choice columns found (choice1, choice2, ...)")
-    
-    for idx, row in df.iterrows():
-        # หา/สร้าง exam
-        exam = db.query(models.Exam).filter_by(subject=row['subject'], grade=row['grade']).first()
-        if not exam:
-            exam = models.Exam(subject=row['subject'], grade=row['grade'], name=f"{row['subject']} {row['grade']}")
-            db.add(exam)
-            db.commit()
-            db.refresh(exam)
-        # ตรวจสอบโจทย์ซ้ำ
-        existing_q = db.query(models.Question).filter_by(exam_id=exam.exam_id, question_text=row['question_text']).first()
-        if existing_q:
-            continue  # ข้ามถ้ามีโจทย์นี้แล้วใน exam เดียวกัน
-        # เพิ่ม question
-        question = models.Question(
-            exam_id=exam.exam_id,
-            question_text=row['question_text'],
-            question_type=row.get('question_type', 'normal'),
-            media_url=row.get('image_url', None),
-            table_html=row.get('table_html', None),
-            explanation=row.get('explanation', None)
-        )
-        db.add(question)
-        db.commit()
-        db.refresh(question)
-        # เพิ่ม choices
-        answer = str(row['answer']).strip()
-        for i, col in enumerate(choice_cols, 1):
-            choice_text = row.get(col, '')
-            if choice_text:
-                is_correct = (str(i) == answer or col == f'choice{answer}')
-                choice = models.Choice(
-                    question_id=question.question_id,
-                    choice_text=choice_text,
-                    is_correct=is_correct
-                )
-                db.add(choice)
-        db.commit()
-    return {"status": "success", "message": "Imported successfully"}
\ No newline at end of file
+    # import แบบ bulk: resolve exam/โจทย์ซ้ำด้วย query ไม่กี่ครั้ง แล้ว insert เป็นก้อน
+    importer = import_dataframe(db, df, chunk_size=chunk_size)
+    return {"status": "success", "message": "Imported successfully", **importer.result()}
+
+# ดูความคืบหน้าของ import job
+@router.get("/import/jobs/{job_id}", response_model=schemas.ImportJobRead)
+def read_import_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    return get_import_job(db, job_id)
+
+# ยกเลิก import job
+@router.post("/import/jobs/{job_id}/cancel", response_model=schemas.ImportJobRead)
+def cancel_import(
+    job_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    return cancel_import_job(db, job_id)
\ No newline at end of file
@@ -0,0 +1,39 @@
+# app/routers/exports.py
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.core.security import admin_required
+from app.utils import export
+
+router = APIRouter(
+    prefix="/exports",
+    tags=["exports"]
+)
+
+# export ข้อมูลบัญชีแบบ streaming (CSV/XLSX) แทนการเรียก list ทีละ 100 แถว
+@router.get("/{dataset}")
+def export_dataset(
+    dataset: str,
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    columns: Optional[str] = Query(None, description="คอลัมน์คั่นด้วย comma เช่น invoice_id,total_amount"),
+    admin=Depends(admin_required(["admin"]))
+):
+    if dataset not in export.DATASETS:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset. Available: {sorted(export.DATASETS)}")
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    try:
+        selected = export.resolve_columns(dataset, columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filename = export.export_filename(dataset, format, start, end)
+    return StreamingResponse(
+        export.export_stream(dataset, format, selected, start, end),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,11 +1,14 @@
 # app/routers/finance.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from ..database import get_db
+from ..utils import finance_rollup
+from ..utils.pagination import paginate
 from ..models.models import Income, Expense
-from ..schemas.schemas import IncomeCreate, IncomeResponse, ExpenseCreate, ExpenseResponse
+from ..schemas.schemas import IncomeCreate, IncomeResponse, ExpenseCreate, ExpenseResponse, FinanceSummary
 from app.core.security import admin_required
 
 router = APIRouter(
@@ -13,10 +16,23 @@ router = APIRouter(
     tags=["finance"]
 )
 
-# Income endpoints
+# สรุปรายรับ/รายจ่าย จากตาราง rollup รายวัน (อัปเดตอัตโนมัติทุกครั้งที่ income/expense เปลี่ยน)
+@router.get("/summary", response_model=FinanceSummary)
+def finance_summary(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    group_by: str = Query("month", pattern="^(day|month)$"),
+    db: Session = Depends(get_db),
+    admin=Depends(admin_required(["admin"]))
+):
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return finance_rollup.summarize(db, start=start, end=end, group_by=group_by)
+
+# Income endpoints (แก้ไขได้เฉพาะ admin: ทุกการเปลี่ยนแปลงไหลเข้า rollup ของ /finance/summary)
 
 @router.post("/income/", response_model=IncomeResponse)
-def create_income(income: IncomeCreate, db: Session = Depends(get_db)):
+def create_income(income: IncomeCreate, db: Session = Depends(get_db), admin=Depends(admin_required(["admin"]))):
     db_income = Income(**income.dict())
     db.add(db_income)
     db.commit()
@@ -30,15 +46,35 @@ def get_income(income_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Income record not found")
     return db_income
 
+@router.put("/income/{income_id}", response_model=IncomeResponse)
+def update_income(income_id: int, income: IncomeCreate, db: Session = Depends(get_db), admin=Depends(admin_required(["admin"]))):
+    db_income = db.query(Income).filter(Income.income_id == income_id).first()
+    if not db_income:
+        raise HTTPException(status_code=404, detail="Income record not found")
+    for key, value in income.dict().items():
+        setattr(db_income, key, value)
+    db.commit()
+    db.refresh(db_income)
+    return db_income
+
+@router.delete("/income/{income_id}")
+def delete_income(income_id: int, db: Session = Depends(get_db), admin=Depends(admin_required(["admin"]))):
+    db_income = db.query(Income).filter(Income.income_id == income_id).first()
+    if not db_income:
+        raise HTTPException(status_code=404, detail="Income record not found")
+    db.delete(db_income)
+    db.commit()
+    return {"detail": "Income record deleted"}
+
 @router.get("/income/", response_model=List[IncomeResponse])
-def list_incomes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    incomes = db.query(Income).offset(skip).limit(limit).all()
+def list_incomes(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    incomes = paginate(db.query(Income), response, Income.income_id, skip=skip, limit=limit, cursor=cursor)
     return incomes
 
 # Expense endpoints
 
 @router.post("/expense/", response_model=ExpenseResponse)
-def create_expense(expense: ExpenseCreate, db: Session = Depends(get_db)):
+def create_expense(expense: ExpenseCreate, db: Session = Depends(get_db), admin=Depends(admin_required(["admin"]))):
     db_expense = Expense(**expense.dict())
     db.add(db_expense)
     db.commit()
@@ -52,7 +88,27 @@ def get_expense(expense_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Expense record not found")
     return db_expense
 
+@router.put("/expense/{expense_id}", response_model=ExpenseResponse)
+def update_expense(expense_id: int, expense: ExpenseCreate, db: Session = Depends(get_db), admin=Depends(admin_required(["admin"]))):
+    db_expense = db.query(Expense).filter(Expense.expense_id == expense_id).first()
+    if not db_expense:
+        raise HTTPException(status_code=404, detail="Expense record not found")
+    for key, value in expense.dict().items():
+        setattr(db_expense, key, value)
+    db.commit()
+    db.refresh(db_expense)
+    return db_expense
+
+@router.delete("/expense/{expense_id}")
+def delete_expense(expense_id: int, db: Session = Depends(get_db), admin=Depends(admin_required(["admin"]))):
+    db_expense = db.query(Expense).filter(Expense.expense_id == expense_id).first()
+    if not db_expense:
+        raise HTTPException(status_code=404, detail="Expense record not found")
+    db.delete(db_expense)
+    db.commit()
+    return {"detail": "Expense record deleted"}
+
 @router.get("/expense/", response_model=List[ExpenseResponse])
-def list_expenses(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    expenses = db.query(Expense).offset(skip).limit(limit).all()
+def list_expenses(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    expenses = paginate(db.query(Expense), response, Expense.expense_id, skip=skip, limit=limit, cursor=cursor)
     return expenses
\ No newline at end of file
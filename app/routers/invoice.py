@@ -1,12 +1,14 @@
 # app/routers/invoices.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from ..database import get_db
+from ..utils.pagination import paginate
 from ..models.models import Invoice
 from ..schemas.schemas import InvoiceCreate, InvoiceResponse
 from app.core.security import admin_required
+from app.utils.invoice_scheduler import scheduler as invoice_scheduler
 
 router = APIRouter(
     prefix="/invoices",
@@ -21,6 +23,15 @@ def create_invoice(invoice: InvoiceCreate, db: Session = Depends(get_db)):
     db.refresh(db_invoice)
     return db_invoice
 
+# sweep ใบแจ้งหนี้ทันที (dry_run=true = ดูตัวเลขอย่างเดียว)
+@router.post("/sweep")
+async def sweep_invoices(dry_run: bool = True, admin=Depends(admin_required(["admin"]))):
+    return await invoice_scheduler.run_once(dry_run=dry_run)
+
+@router.get("/scheduler/metrics")
+def invoice_scheduler_metrics(admin=Depends(admin_required(["admin"]))):
+    return invoice_scheduler.get_metrics()
+
 @router.get("/{invoice_id}", response_model=InvoiceResponse)
 def get_invoice(invoice_id: int, db: Session = Depends(get_db)):
     db_invoice = db.query(Invoice).filter(Invoice.invoice_id == invoice_id).first()
@@ -29,8 +40,8 @@ def get_invoice(invoice_id: int, db: Session = Depends(get_db)):
     return db_invoice
 
 @router.get("/", response_model=List[InvoiceResponse])
-def list_invoices(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    invoices = db.query(Invoice).offset(skip).limit(limit).all()
+def list_invoices(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    invoices = paginate(db.query(Invoice), response, Invoice.invoice_id, skip=skip, limit=limit, cursor=cursor)
     return invoices
 
 @router.put("/{invoice_id}", response_model=InvoiceResponse)
@@ -1,14 +1,17 @@
 # app/routers/line_auth.py
 from fastapi import APIRouter, HTTPException, Depends, status
 from sqlalchemy.orm import Session
-from ..utils.line_utils import verify_line_id_token
+from ..utils.line_utils import averify_line_id_token
 from ..database import get_db
 from ..models.models import User, RefreshToken, Role  # import Role model
 from ..core.config import settings
+from ..core import auth_cache
 from ..schemas.schemas import LineLoginRequest, TokenResponse, RefreshTokenRequest, RefreshTokenResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
+import time
 
 router = APIRouter(
     prefix="/auth/line",
@@ -78,6 +81,29 @@ def store_refresh_token(db: Session, user: User, refresh_token: str):
     db.refresh(db_refresh_token)
     return db_refresh_token
 
+def _issue_tokens(db: Session, line_user_id: str, user_info: dict):
+    user = get_or_create_user(db, line_user_id, user_info)
+    access_token = create_access_token(user, db)
+    refresh_token = create_refresh_token(user)
+    store_refresh_token(db, user, refresh_token)
+    return access_token, refresh_token
+
+def _refresh_access_token(db: Session, user_id: int, refresh_token: str):
+    db_refresh_token = db.query(RefreshToken).filter(
+        RefreshToken.user_id == user_id,
+        RefreshToken.token == refresh_token,
+        RefreshToken.expires_at > datetime.utcnow()
+    ).first()
+
+    if not db_refresh_token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired refresh token")
+
+    user = db.query(User).filter(User.user_id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+    return create_access_token(user, db)
+
 def role_required(allowed_roles: list):
     def role_checker(current_user: dict = Depends(get_current_user)):
         if current_user["role"] not in allowed_roles:
@@ -96,15 +122,13 @@ async def line_login(request_data: LineLoginRequest, db: Session = Depends(get_d
     if not id_token:
         raise HTTPException(status_code=400, detail="Missing id_token")
 
-    user_info = verify_line_id_token(id_token)
+    user_info = await averify_line_id_token(id_token)
     if not user_info:
         raise HTTPException(status_code=401, detail="Invalid LINE token")
 
     line_user_id = user_info["sub"]
-    user = get_or_create_user(db, line_user_id, user_info)
-    access_token = create_access_token(user, db)
-    refresh_token = create_refresh_token(user)
-    store_refresh_token(db, user, refresh_token)
+    # งาน DB แบบ sync รันใน threadpool เพื่อไม่ให้บล็อก event loop
+    access_token, refresh_token = await run_in_threadpool(_issue_tokens, db, line_user_id, user_info)
 
     return {
         "access_token": access_token,
@@ -130,24 +154,16 @@ async def refresh_access_token(request_data: RefreshTokenRequest, db: Session =
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
 
-    db_refresh_token = db.query(RefreshToken).filter(
-        RefreshToken.user_id == int(user_id),
-        RefreshToken.token == refresh_token,
-        RefreshToken.expires_at > datetime.utcnow()
-    ).first()
-
-    if not db_refresh_token:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired refresh token")
-
-    user = db.query(User).filter(User.user_id == int(user_id)).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-
-    new_access_token = create_access_token(user, db)
+    new_access_token = await run_in_threadpool(_refresh_access_token, db, int(user_id), refresh_token)
     return {"access_token": new_access_token, "token_type": "bearer"}
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme), db: Session = Depends(get_db)):
     token = credentials.credentials
+    cached = auth_cache.get_cached("line", token)
+    if cached is not None:
+        payload, user = cached
+        return {"user": user, "role": auth_cache.user_role(user, "student")}
+    started = time.perf_counter()
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -161,7 +177,8 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.user_id == int(user_id)).first()
+    user = auth_cache.load_user_snapshot(db, User.user_id == int(user_id))
     if user is None:
         raise credentials_exception
-    return {"user": user, "role": role}
\ No newline at end of file
+    auth_cache.store("line", token, payload, user, started)
+    return {"user": user, "role": auth_cache.user_role(user, "student")}
\ No newline at end of file
@@ -1,6 +1,9 @@
 # app/routers/line_webhook.py
-from fastapi import APIRouter, Request
+import json
+
+from fastapi import APIRouter, Header, HTTPException, Request
 from ..utils.line_utils import send_line_message
+from ..utils.line_webhook_pipeline import dispatcher, verify_signature
 
 router = APIRouter(
     prefix="/webhook",
@@ -8,8 +11,17 @@ router = APIRouter(
 )
 
 @router.post("/line")
-async def line_webhook(request: Request):
-    body = await request.json()
-    print("LINE Webhook Event:", body)
-    # TODO: เขียน logic ตอบกลับหรือบันทึก event ตามต้องการ
-    return {"status": "ok"}
\ No newline at end of file
+async def line_webhook(request: Request, x_line_signature: str = Header(None)):
+    body = await request.body()
+    # ตรวจลายเซ็นจาก LINE ก่อนเสมอ
+    if not verify_signature(body, x_line_signature):
+        dispatcher.metrics["rejected_signature"] += 1
+        raise HTTPException(status_code=400, detail="Invalid signature")
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    # โยน event เข้าคิวแล้วตอบกลับทันที ให้ worker ประมวลผลทีหลัง
+    if not dispatcher.enqueue(payload.get("events", [])):
+        raise HTTPException(status_code=503, detail="Webhook queue is full")
+    return {"status": "ok"}
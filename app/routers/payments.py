@@ -1,10 +1,13 @@
 # app/routers/payments.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from ..database import get_db
+from ..utils.pagination import paginate
 from ..models.models import Payment
 from ..schemas.schemas import PaymentCreate, PaymentResponse
+from ..utils import reconciliation
+from app.core.security import admin_required
 
 router = APIRouter(
     prefix="/payments",
@@ -12,41 +15,57 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=PaymentResponse)
-def create_payment(payment: PaymentCreate, db: Session = Depends(get_db)):
+def create_payment(payment: PaymentCreate, db: Session = Depends(get_db), admin=Depends(admin_required(["admin"]))):
     db_payment = Payment(**payment.dict())
     db.add(db_payment)
+    db.flush()
+    # reconcile ทันทีใน transaction เดียวกัน: payment, สถานะ invoice และ income commit พร้อมกัน
+    # (เฉพาะสลิปที่ status เป็น verified/approved สลิปอื่นรอจนกว่าจะถูกแก้สถานะผ่าน PUT)
+    reconciliation.reconcile_payments(db, [db_payment])
     db.commit()
     db.refresh(db_payment)
     return db_payment
 
+# reconcile ทั้งหมดแบบ batch (ปกติรันทุกคืนผ่าน scripts/reconcile_payments.py)
+@router.post("/reconcile")
+def reconcile_all(full: bool = False, db: Session = Depends(get_db), admin=Depends(admin_required(["admin"]))):
+    report = reconciliation.run_batch(db)
+    if full:
+        report["invoice_statuses_recomputed"] = reconciliation.recompute_invoice_statuses(db)
+    return report
+
 @router.get("/{payment_id}", response_model=PaymentResponse)
 def get_payment(payment_id: int, db: Session = Depends(get_db)):
-    db_payment = db.query(Payment).filter(Payment.id == payment_id).first()
+    db_payment = db.query(Payment).filter(Payment.payment_id == payment_id).first()
     if not db_payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     return db_payment
 
 @router.get("/", response_model=List[PaymentResponse])
-def list_payments(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    payments = db.query(Payment).offset(skip).limit(limit).all()
+def list_payments(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    payments = paginate(db.query(Payment), response, Payment.payment_id, skip=skip, limit=limit, cursor=cursor)
     return payments
 
 @router.put("/{payment_id}", response_model=PaymentResponse)
-def update_payment(payment_id: int, payment_update: PaymentCreate, db: Session = Depends(get_db)):
-    db_payment = db.query(Payment).filter(Payment.id == payment_id).first()
+def update_payment(payment_id: int, payment_update: PaymentCreate, db: Session = Depends(get_db), admin=Depends(admin_required(["admin"]))):
+    db_payment = db.query(Payment).filter(Payment.payment_id == payment_id).first()
     if not db_payment:
         raise HTTPException(status_code=404, detail="Payment not found")
+    reconciliation.unreconcile_payment(db, db_payment)
     for key, value in payment_update.dict().items():
         setattr(db_payment, key, value)
+    db.flush()
+    reconciliation.reconcile_payments(db, [db_payment])
     db.commit()
     db.refresh(db_payment)
     return db_payment
 
 @router.delete("/{payment_id}", response_model=dict)
-def delete_payment(payment_id: int, db: Session = Depends(get_db)):
-    db_payment = db.query(Payment).filter(Payment.id == payment_id).first()
+def delete_payment(payment_id: int, db: Session = Depends(get_db), admin=Depends(admin_required(["admin"]))):
+    db_payment = db.query(Payment).filter(Payment.payment_id == payment_id).first()
     if not db_payment:
         raise HTTPException(status_code=404, detail="Payment not found")
+    reconciliation.unreconcile_payment(db, db_payment)
     db.delete(db_payment)
     db.commit()
     return {"message": "Payment deleted successfully"}
\ No newline at end of file
@@ -0,0 +1,113 @@
+# app/routers/schedules.py
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.models import models
+from app.routers.line_auth import role_required
+from app.schemas import schemas
+from app.utils import scheduling
+
+router = APIRouter(
+    prefix="/schedules",
+    tags=["schedules"],
+)
+
+
+def _raise(e: scheduling.ScheduleError):
+    if e.conflicts:
+        # 409 พร้อมรายการคาบที่ชน ให้หน้าจอแสดงได้ว่าชนกับอะไร
+        raise HTTPException(status_code=e.status_code, detail={"message": e.detail, "conflicts": jsonable_encoder(e.conflicts)})
+    raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+# ห้องว่างในช่วงเวลา [start, end) ที่จุคนได้อย่างน้อย min_capacity
+@router.get("/free_rooms", response_model=List[schemas.FreeRoom])
+def free_rooms(
+    start: datetime,
+    end: datetime,
+    min_capacity: Optional[int] = None,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    start, end = scheduling.naive(start), scheduling.naive(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    scheduling.index.ensure_loaded(db)
+    return scheduling.index.free_rooms(start, end, min_capacity)
+
+# ตรวจว่าช่วงเวลาชนกับห้อง/ครูหรือไม่ โดยไม่บันทึก
+@router.post("/check", response_model=List[schemas.ScheduleConflict])
+def check_schedule(
+    schedule: schemas.ScheduleCreate,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    scheduling.index.ensure_loaded(db)
+    return scheduling.index.conflicts(
+        schedule.course_id, schedule.classroom_id, scheduling.naive(schedule.start_time), scheduling.naive(schedule.end_time)
+    )
+
+@router.post("/", response_model=schemas.ScheduleRead)
+def create_schedule(
+    schedule: schemas.ScheduleCreate,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    try:
+        return scheduling.create_schedule(db, schedule.course_id, schedule.classroom_id, schedule.start_time, schedule.end_time)
+    except scheduling.ScheduleError as e:
+        _raise(e)
+
+# สร้างคาบเรียนรายสัปดาห์ทั้งเทอมในครั้งเดียว
+@router.post("/term", response_model=schemas.ScheduleTermResult)
+def generate_term(
+    term: schemas.ScheduleTermCreate,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    try:
+        return scheduling.generate_term(
+            db, term.course_id, term.classroom_id, term.start_date, term.end_date, term.slots,
+            skip_dates=term.skip_dates, skip_conflicts=term.skip_conflicts,
+        )
+    except scheduling.ScheduleError as e:
+        _raise(e)
+
+@router.get("/{schedule_id}", response_model=schemas.ScheduleRead)
+def get_schedule(schedule_id: int, db: Session = Depends(get_db)):
+    schedule = db.get(models.Schedule, schedule_id)
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return schedule
+
+@router.put("/{schedule_id}", response_model=schemas.ScheduleRead)
+def update_schedule(
+    schedule_id: int,
+    data: schemas.ScheduleCreate,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    schedule = db.get(models.Schedule, schedule_id)
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    try:
+        return scheduling.update_schedule(db, schedule, data.course_id, data.classroom_id, data.start_time, data.end_time)
+    except scheduling.ScheduleError as e:
+        _raise(e)
+
+@router.delete("/{schedule_id}")
+def delete_schedule(
+    schedule_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(role_required(["admin", "teacher"]))
+):
+    schedule = db.get(models.Schedule, schedule_id)
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    db.delete(schedule)
+    db.commit()
+    return {"detail": "Schedule deleted"}
@@ -1,18 +1,22 @@
 # app/routers/students.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
+from typing import List, Optional
 from ..models import models
 from ..schemas import schemas
 from ..database import get_db
+from ..utils import student_overview, student_search
+from ..utils.pagination import paginate
+from app.core.security import admin_required
 
 router = APIRouter(
     prefix="/students",
     tags=["students"]
 )
 
-# สร้างนักเรียนใหม่
+# สร้างนักเรียนใหม่ (def ธรรมดา ให้ FastAPI รันใน threadpool ไม่บล็อก event loop)
 @router.post("/", response_model=schemas.StudentResponse)
-async def create_student(student: schemas.StudentCreate, db: Session = Depends(get_db)):
+def create_student(student: schemas.StudentCreate, db: Session = Depends(get_db)):
     db_student = db.query(models.Student).filter(models.Student.email == student.email).first()
     if db_student:
         raise HTTPException(status_code=400, detail="Email already registered")
@@ -24,10 +28,32 @@ async def create_student(student: schemas.StudentCreate, db: Session = Depends(g
 
 # อ่านรายชื่อนักเรียนทั้งหมด
 @router.get("/", response_model=list[schemas.StudentResponse])
-def read_students(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    students = db.query(models.Student).offset(skip).limit(limit).all()
+def read_students(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    students = paginate(db.query(models.Student), response, models.Student.student_id, skip=skip, limit=limit, cursor=cursor)
     return students
 
+# ค้นหานักเรียนด้วยชื่อ (ไทย/อังกฤษ) อีเมล LINE id หรือเบอร์โทร เรียงตามความใกล้เคียง
+@router.get("/search", response_model=List[schemas.StudentSearchResult])
+def search_students(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    db: Session = Depends(get_db),
+    admin=Depends(admin_required(["admin"]))
+):
+    return student_search.search(db, q, limit)
+
+# ภาพรวมนักเรียน: คอร์ส ยอดค้างชำระ คะแนนสอบล่าสุด และอัตราการเข้าเรียน (cache สั้น ๆ ล้างเมื่อข้อมูลเปลี่ยน)
+@router.get("/{student_id}/overview", response_model=schemas.StudentOverview)
+def read_student_overview(
+    student_id: int,
+    db: Session = Depends(get_db),
+    admin=Depends(admin_required(["admin"]))
+):
+    body = student_overview.get_overview_json(db, student_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return Response(content=body, media_type="application/json")
+
 # อ่านข้อมูลนักเรียนรายคน
 @router.get("/{student_id}", response_model=schemas.StudentResponse)
 def read_student(student_id: int, db: Session = Depends(get_db)):
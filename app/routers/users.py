@@ -7,6 +7,7 @@ from app.models.models import User, Role
 from app.schemas.schemas import UserResponse
 from app.routers.line_auth import get_current_user  # สมมติมีฟังก์ชันนี้สำหรับดึง user จาก token
 from app.core.security import admin_required
+from app.core import auth_cache
 
 router = APIRouter(
     prefix="/users",
@@ -47,5 +48,6 @@ def update_user_role(
         raise HTTPException(status_code=400, detail="Role not found")
     user.role = role
     db.commit()
+    auth_cache.invalidate_user(user_id)
     db.refresh(user)
     return user
\ No newline at end of file
@@ -1,7 +1,7 @@
 # app/schemas/schemas.py
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional, List, Dict
+from datetime import date, datetime, time
 
 # Role Schemas
 class RoleBase(BaseModel):
@@ -36,12 +36,63 @@ class EnrollmentCreate(EnrollmentBase):
     pass
 
 class EnrollmentResponse(EnrollmentBase):
-    id: int
-    enrolled_at: datetime
+    enrollment_id: int
+    enroll_date: Optional[date] = None
+    expire_date: Optional[date] = None
+    status: Optional[str] = None
 
     class Config:
         orm_mode = True
 
+class EnrollmentWithInvoice(EnrollmentResponse):
+    invoice_id: int
+    total_amount: float
+
+# ลงทะเบียนทั้งห้องในครั้งเดียว
+class BulkEnrollmentCreate(BaseModel):
+    course_id: int
+    student_ids: List[int]
+
+class BulkEnrollmentResult(BaseModel):
+    course_id: int
+    enrolled: List[EnrollmentWithInvoice]
+    skipped_student_ids: List[int] = []
+
+class CoursePriceUpdate(BaseModel):
+    price: float
+
+class CoursePriceRead(BaseModel):
+    course_id: int
+    price: float
+
+# Course catalog (หน้า LIFF)
+class TeacherSummary(BaseModel):
+    teacher_id: int
+    first_name: str
+    last_name: str
+
+class ScheduleSummary(BaseModel):
+    schedule_id: int
+    classroom_id: int
+    classroom_name: Optional[str] = None
+    start_time: datetime
+    end_time: datetime
+
+class CourseCatalogItem(BaseModel):
+    course_id: int
+    name: str
+    description: Optional[str] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    price: float = 0.0
+    teacher: Optional[TeacherSummary] = None
+    session_count: int = 0
+    first_session: Optional[datetime] = None
+    last_session: Optional[datetime] = None
+
+class CourseCatalogDetail(CourseCatalogItem):
+    schedules: List[ScheduleSummary] = []
+
 # Student Schemas
 class StudentBase(BaseModel):
     first_name: str
@@ -63,6 +114,15 @@ class StudentResponse(StudentBase):
     class Config:
         orm_mode = True
 
+class StudentSearchResult(BaseModel):
+    student_id: int
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    line_id: Optional[str] = None
+    score: float
+
 # Course Schemas
 class CourseBase(BaseModel):
     name: str
@@ -120,6 +180,50 @@ class ClassroomResponse(ClassroomBase):
     class Config:
         orm_mode = True
 
+# Schedule Schemas
+class ScheduleCreate(BaseModel):
+    course_id: int
+    classroom_id: int
+    start_time: datetime
+    end_time: datetime
+
+class ScheduleRead(ScheduleCreate):
+    schedule_id: int
+
+    class Config:
+        orm_mode = True
+
+class ScheduleConflict(BaseModel):
+    resource: str  # "classroom" หรือ "teacher"
+    resource_id: int
+    schedule_id: Optional[int] = None  # None = ชนกับคาบอื่นในชุดที่สร้างพร้อมกัน
+    start_time: datetime
+    end_time: datetime
+
+class WeeklySlot(BaseModel):
+    weekday: int = Field(..., ge=0, le=6)  # 0 = จันทร์ ... 6 = อาทิตย์
+    start: time
+    end: time
+
+class ScheduleTermCreate(BaseModel):
+    course_id: int
+    classroom_id: int
+    start_date: date
+    end_date: date
+    slots: List[WeeklySlot]
+    skip_dates: List[date] = []  # วันหยุด
+    skip_conflicts: bool = False  # True = ข้ามคาบที่ชน แล้วสร้างที่เหลือ
+
+class ScheduleTermResult(BaseModel):
+    created: List[ScheduleRead]
+    conflicts: List[ScheduleConflict] = []
+
+class FreeRoom(BaseModel):
+    classroom_id: int
+    name: str
+    location: Optional[str] = None
+    capacity: Optional[int] = None
+
 # Attendance Schemas
 class AttendanceBase(BaseModel):
     student_id: int
@@ -140,6 +244,87 @@ class AttendanceResponse(AttendanceBase):
     class Config:
         orm_mode = True
 
+class AttendanceMark(BaseModel):
+    student_id: int
+    status: str  # "present", "late", "absent", "excused"
+    note: Optional[str] = None
+
+class AttendanceBulkCheckIn(BaseModel):
+    course_id: int
+    session_date: datetime
+    records: List[AttendanceMark] = []
+    # นักเรียนใน roster ที่ไม่ได้ส่งมา ให้บันทึกเป็นสถานะนี้ (เช่น "absent") ถ้าไม่กำหนดจะข้ามไป
+    default_status: Optional[str] = None
+
+class AttendanceBulkResult(BaseModel):
+    course_id: int
+    session_date: datetime
+    inserted: int
+    updated: int
+    unchanged: int
+
+class RosterStudent(BaseModel):
+    student_id: int
+    enrollment_id: int
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+
+class CourseRoster(BaseModel):
+    course_id: int
+    students: List[RosterStudent]
+
+class AttendanceRate(BaseModel):
+    student_id: int
+    course_id: int
+    sessions: int
+    present: int
+    late: int
+    absent: int
+    excused: int
+    rate: float
+
+# Student overview (หน้าโปรไฟล์นักเรียนฝั่ง admin)
+class OverviewEnrollment(BaseModel):
+    enrollment_id: int
+    course_id: Optional[int] = None
+    course_name: Optional[str] = None
+    enroll_date: Optional[date] = None
+    expire_date: Optional[date] = None
+    status: Optional[str] = None
+
+class OverviewInvoice(BaseModel):
+    invoice_id: int
+    enrollment_id: int
+    due_date: datetime
+    total_amount: float
+    paid_amount: float
+    outstanding: float
+    status: str
+
+class OverviewExam(BaseModel):
+    student_exam_id: int
+    exam_id: int
+    exam_name: Optional[str] = None
+    status: Optional[str] = None
+    score: Optional[float] = None
+    finished_at: Optional[datetime] = None
+
+class StudentOverview(BaseModel):
+    student_id: int
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    line_id: Optional[str] = None
+    enrollments: List[OverviewEnrollment] = []
+    open_invoices: List[OverviewInvoice] = []
+    outstanding_balance: float = 0.0
+    overdue_count: int = 0
+    recent_exams: List[OverviewExam] = []
+    attendance: List[AttendanceRate] = []
+    attendance_rate: Optional[float] = None
+    generated_at: datetime
+
 class LineLoginRequest(BaseModel):
     id_token: str
 
@@ -225,6 +410,28 @@ class ExpenseResponse(ExpenseBase):
     class Config:
         orm_mode = True
 
+# Finance summary (จาก rollup รายวัน)
+class FinancePeriod(BaseModel):
+    period: str
+    income: float
+    expense: float
+    net: float
+
+class FinanceTypeTotal(BaseModel):
+    category: Optional[str] = None
+    total: float
+    count: int
+
+class FinanceSummary(BaseModel):
+    start: Optional[date] = None
+    end: Optional[date] = None
+    group_by: str
+    income_total: float
+    expense_total: float
+    net: float
+    periods: List[FinancePeriod]
+    by_type: Dict[str, List[FinanceTypeTotal]]
+
 class PaymentBase(BaseModel):
     enrollment_id: int
     invoice_id: Optional[int] = None
@@ -238,7 +445,8 @@ class PaymentCreate(PaymentBase):
     pass
 
 class PaymentResponse(PaymentBase):
-    id: int
+    payment_id: int
+    payment_status: Optional[str] = None
 
     class Config:
         orm_mode = True
@@ -327,6 +535,16 @@ class StudentAnswerRead(StudentAnswerBase):
     class Config:
         orm_mode = True
 
+# ส่งคำตอบหลายข้อในครั้งเดียว (ทั้งชุดหรือเฉพาะข้อที่เปลี่ยน)
+class StudentAnswerBatch(BaseModel):
+    answers: List[StudentAnswerCreate]
+
+class StudentAnswerBatchResult(BaseModel):
+    student_exam_id: int
+    saved: int
+    correct: int
+    answers: List[StudentAnswerRead]
+
 # Schema สำหรับผลสอบ (รวมคะแนนและสถานะ)
 class StudentExamResult(BaseModel):
     student_exam_id: int
@@ -341,6 +559,80 @@ class StudentExamResult(BaseModel):
         orm_mode = True
 
 
+# Schemas สำหรับสถิติข้อสอบ
+class ChoiceAnalytics(BaseModel):
+    choice_id: int
+    picked_count: int
+    rate: Optional[float] = None
+    is_correct: bool
+
+class QuestionAnalytics(BaseModel):
+    question_id: int
+    attempts: int
+    correct_count: int
+    p_value: Optional[float] = None
+    discrimination: Optional[float] = None
+    choices: List[ChoiceAnalytics] = []
+
+class ScoreBin(BaseModel):
+    bin_no: int
+    label: str
+    count: int
+
+class ExamAnalytics(BaseModel):
+    exam_id: int
+    attempts: int
+    mean_score: Optional[float] = None
+    stddev_score: Optional[float] = None
+    min_score: Optional[float] = None
+    max_score: Optional[float] = None
+    distribution: List[ScoreBin]
+    questions: List[QuestionAnalytics]
+    attempts_at_rebuild: int = 0
+    rebuilt_at: Optional[datetime] = None
+
+# Schemas สำหรับ ImportJob (import ข้อสอบแบบ background)
+class ImportJobRead(BaseModel):
+    job_id: int
+    filename: str
+    status: str
+    cancel_requested: bool = False
+    rows_done: int = 0
+    rows_skipped: int = 0
+    rows_invalid: int = 0
+    questions_inserted: int = 0
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+
+# Schemas สำหรับ Broadcast (ส่งข้อความ LINE แบบกลุ่ม)
+class BroadcastCreate(BaseModel):
+    message: str
+    course_ids: List[int] = []
+    enrollment_ids: List[int] = []
+    user_ids: List[int] = []
+    line_user_ids: List[str] = []
+
+class BroadcastRead(BaseModel):
+    broadcast_id: int
+    message: str
+    status: str
+    total_recipients: int = 0
+    sent_count: int = 0
+    failed_count: int = 0
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+
 # Admin Schemas
 class AdminBase(BaseModel):
     username: str
@@ -0,0 +1,349 @@
+# app/utils/attendance.py
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, case, delete, event, exists, func, insert, inspect, literal, select, text, update
+from sqlalchemy.orm import Session, aliased, object_session
+
+from app.core.config import settings
+from app.models import models
+from app.schemas import schemas
+from app.utils import student_overview
+from app.utils.cache import TTLCache
+from app.utils.sql import has_unique, upsert_insert
+
+STATUSES = ("present", "late", "absent", "excused")
+ATTENDED = ("present", "late")
+_LOCK_CLASS = 7190021  # class id ของ advisory lock (คู่กับ course_id)
+SESSION_CONSTRAINT = "uq_attendance_session_student"
+_SESSION_CONSTRAINT_RECHECK = 60  # วินาที: ยังไม่มี constraint ให้ตรวจใหม่เป็นระยะ (หลังรัน script แล้วใช้ได้เอง)
+_session_constraint = {"ready": False, "checked_at": None}
+
+Counter = models.AttendanceCounter
+
+# course_id -> JSON ของ roster (นักเรียนที่ enroll อยู่) หน้าจอเช็คชื่อโหลดจากนี่โดยไม่ต้อง join
+roster_cache = TTLCache(maxsize=settings.ATTENDANCE_ROSTER_CACHE_SIZE, ttl=settings.ATTENDANCE_ROSTER_CACHE_TTL)
+
+_DIRTY_KEY = "attendance_roster_dirty"
+_ALL = "*"
+
+
+class AttendanceError(ValueError):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def session_key(value: datetime) -> datetime:
+    # เก็บเป็น UTC แบบ naive เหมือนคอลัมน์ DateTime อื่นในระบบ ให้ key ของคาบเรียนตรงกันทุกครั้ง
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+# ----------------- roster -----------------
+
+def _load_roster(db: Session, course_id: int):
+    rows = db.execute(
+        select(
+            models.Enrollment.student_id,
+            func.min(models.Enrollment.enrollment_id),
+            models.Student.first_name,
+            models.Student.last_name,
+        )
+        .join(models.Student, models.Student.student_id == models.Enrollment.student_id)
+        .where(models.Enrollment.course_id == course_id, models.Enrollment.status == "active")
+        .group_by(models.Enrollment.student_id, models.Student.first_name, models.Student.last_name)
+        .order_by(models.Student.first_name, models.Student.last_name, models.Enrollment.student_id)
+    ).all()
+    roster = schemas.CourseRoster(course_id=course_id, students=[
+        schemas.RosterStudent(student_id=student_id, enrollment_id=enrollment_id, first_name=first_name, last_name=last_name)
+        for student_id, enrollment_id, first_name, last_name in rows
+    ])
+    return {
+        "student_ids": frozenset(student.student_id for student in roster.students),
+        "json": roster.model_dump_json().encode(),
+    }
+
+
+def get_roster(db: Session, course_id: int, refresh: bool = False):
+    """Cached roster entry ({"student_ids", "json"}) of a course, or None if the course does not exist."""
+    if db.get(models.Course, course_id) is None:
+        return None
+    entry = None if refresh else roster_cache.get(course_id)
+    if entry is None:
+        entry = _load_roster(db, course_id)
+        roster_cache.set(course_id, entry)
+    return entry
+
+
+def mark_roster_dirty(db: Session, course_id: int):
+    """For writes that bypass ORM events (bulk INSERT): drop the course's roster after commit."""
+    db.info.setdefault(_DIRTY_KEY, set()).add(course_id)
+
+
+def get_stats():
+    return roster_cache.stats()
+
+
+# ----------------- bulk check-in -----------------
+
+def _lock_course(db: Session, course_id: int):
+    # เช็คชื่อคาบเดียวกันพร้อมกันสองเครื่อง: ให้ทีละ transaction ต่อคอร์ส ตัวนับจึงไม่เพี้ยน
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:cls, :course_id)"), {"cls": _LOCK_CLASS, "course_id": course_id})
+
+
+def has_session_constraint(db: Session) -> bool:
+    """True once attendance has a unique (course_id, date, student_id) constraint or index.
+
+    create_all does not add constraints to an existing table, so ON CONFLICT is only
+    safe after scripts/add_attendance_constraint.py has run.
+    """
+    if _session_constraint["ready"]:
+        return True
+    checked_at = _session_constraint["checked_at"]
+    if checked_at is not None and time.monotonic() - checked_at < _SESSION_CONSTRAINT_RECHECK:
+        return False
+    _session_constraint["ready"] = session_constraint_exists(db.connection())
+    _session_constraint["checked_at"] = time.monotonic()
+    return _session_constraint["ready"]
+
+
+def session_constraint_exists(connection) -> bool:
+    return has_unique(connection, models.Attendance.__tablename__, ["course_id", "date", "student_id"])
+
+
+def duplicate_marks():
+    """Condition: a newer row exists for the same (course_id, date, student_id) (legacy duplicates only)."""
+    Attendance = models.Attendance
+    newer = aliased(Attendance)
+    return exists().where(and_(
+        newer.course_id == Attendance.course_id,
+        newer.date == Attendance.date,
+        newer.student_id == Attendance.student_id,
+        newer.attendance_id > Attendance.attendance_id,
+    ))
+
+
+def _upsert_marks(db: Session, rows: list):
+    stmt = upsert_insert(db, models.Attendance)
+    if stmt is not None and has_session_constraint(db):
+        db.execute(
+            stmt.values(rows).on_conflict_do_update(
+                index_elements=["course_id", "date", "student_id"],
+                set_={"status": stmt.excluded.status, "note": stmt.excluded.note},
+            )
+        )
+        return
+    # dialect อื่น หรือฐานข้อมูลเดิมที่ยังไม่ได้เพิ่ม constraint: ลบแล้ว insert ใหม่ (อยู่ใต้ lock ของคอร์สแล้ว)
+    first = rows[0]
+    db.execute(delete(models.Attendance).where(
+        models.Attendance.course_id == first["course_id"],
+        models.Attendance.date == first["date"],
+        models.Attendance.student_id.in_([row["student_id"] for row in rows]),
+    ))
+    db.execute(insert(models.Attendance), rows)
+
+
+def _apply_counters(db: Session, course_id: int, deltas: dict):
+    if not deltas:
+        return
+    now = datetime.utcnow()
+    rows = [
+        {"student_id": student_id, "course_id": course_id, "updated_at": now, **{column: 0 for column in ("sessions",) + STATUSES}, **delta}
+        for student_id, delta in deltas.items()
+    ]
+    stmt = upsert_insert(db, Counter)
+    if stmt is not None:
+        db.execute(
+            stmt.values(rows).on_conflict_do_update(
+                index_elements=["student_id", "course_id"],
+                set_={
+                    **{column: getattr(Counter, column) + getattr(stmt.excluded, column) for column in ("sessions",) + STATUSES},
+                    "updated_at": stmt.excluded.updated_at,
+                },
+            )
+        )
+        return
+    for row in rows:
+        result = db.execute(
+            update(Counter)
+            .where(Counter.student_id == row["student_id"], Counter.course_id == course_id)
+            .values(updated_at=now, **{column: getattr(Counter, column) + row[column] for column in ("sessions",) + STATUSES})
+        )
+        if result.rowcount == 0:
+            db.execute(insert(Counter).values(row))
+
+
+def bulk_check_in(db: Session, course_id: int, session_date: datetime, records, default_status: str = None):
+    """Record a whole session in one multi-row upsert and update the counters in the same commit.
+
+    Re-sending the same session is safe: only status changes move the counters.
+    """
+    marks = {}
+    for record in records:
+        marks[record.student_id] = (record.status, record.note)  # ส่งซ้ำในชุดเดียวกัน ใช้ตัวหลังสุด
+    for status, _ in list(marks.values()) + ([(default_status, None)] if default_status else []):
+        if status not in STATUSES:
+            raise AttendanceError(400, f"Invalid status {status!r}. Allowed: {list(STATUSES)}")
+
+    roster = get_roster(db, course_id)
+    if roster is None:
+        raise AttendanceError(404, "Course not found")
+    unknown = [student_id for student_id in marks if student_id not in roster["student_ids"]]
+    if unknown:
+        # roster ใน cache อาจเก่ากว่าการ enroll ใน worker อื่น: โหลดใหม่ก่อนปฏิเสธ
+        roster = get_roster(db, course_id, refresh=True)
+        unknown = [student_id for student_id in marks if student_id not in roster["student_ids"]]
+        if unknown:
+            raise AttendanceError(400, f"Students not enrolled in course {course_id}: {sorted(unknown)}")
+    if default_status:
+        for student_id in roster["student_ids"]:
+            marks.setdefault(student_id, (default_status, None))
+    if len(marks) > settings.ATTENDANCE_MAX_BATCH:
+        raise AttendanceError(400, f"At most {settings.ATTENDANCE_MAX_BATCH} students per check-in")
+
+    session_date = session_key(session_date)
+    result = {"course_id": course_id, "session_date": session_date, "inserted": 0, "updated": 0, "unchanged": 0}
+    if not marks:
+        return result
+
+    try:
+        _lock_course(db, course_id)
+        previous = {
+            student_id: (status, note)
+            for student_id, status, note in db.execute(
+                select(models.Attendance.student_id, models.Attendance.status, models.Attendance.note).where(
+                    models.Attendance.course_id == course_id,
+                    models.Attendance.date == session_date,
+                    models.Attendance.student_id.in_(list(marks)),
+                )
+            )
+        }
+        rows, deltas = [], {}
+        for student_id, (status, note) in marks.items():
+            old = previous.get(student_id)
+            if old == (status, note):
+                result["unchanged"] += 1
+                continue
+            rows.append({"student_id": student_id, "course_id": course_id, "date": session_date, "status": status, "note": note})
+            if old is None:
+                result["inserted"] += 1
+                deltas[student_id] = {"sessions": 1, status: 1}
+            else:
+                result["updated"] += 1
+                if old[0] != status:
+                    delta = {status: 1}
+                    if old[0] in STATUSES:
+                        delta[old[0]] = -1
+                    deltas[student_id] = delta
+        if rows:
+            _upsert_marks(db, rows)
+            _apply_counters(db, course_id, deltas)
+            student_overview.mark_dirty(db, *deltas)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return result
+
+
+def get_session_marks(db: Session, course_id: int, session_date: datetime):
+    return db.execute(
+        select(models.Attendance.student_id, models.Attendance.status, models.Attendance.note)
+        .where(models.Attendance.course_id == course_id, models.Attendance.date == session_key(session_date))
+        .order_by(models.Attendance.student_id)
+    ).mappings().all()
+
+
+# ----------------- attendance rate -----------------
+
+def _rate(row):
+    attended = sum(getattr(row, status) for status in ATTENDED)
+    return {
+        "student_id": row.student_id,
+        "course_id": row.course_id,
+        "sessions": row.sessions,
+        **{status: getattr(row, status) for status in STATUSES},
+        "rate": round(attended / row.sessions, 4) if row.sessions else 0.0,
+    }
+
+
+def get_rates(db: Session, student_id: int = None, course_id: int = None):
+    """Attendance rates from the counter table (primary-key lookups, no scan of attendance)."""
+    query = select(Counter)
+    if student_id is not None:
+        query = query.where(Counter.student_id == student_id)
+    if course_id is not None:
+        query = query.where(Counter.course_id == course_id)
+    return [_rate(row) for row in db.execute(query.order_by(Counter.course_id, Counter.student_id)).scalars()]
+
+
+def rebuild_counters(db: Session, course_id: int = None):
+    """Recompute the counters from the attendance table with one INSERT ... SELECT (repairs drift)."""
+    delete_stmt = delete(Counter)
+    if course_id is not None:
+        delete_stmt = delete_stmt.where(Counter.course_id == course_id)
+    db.execute(delete_stmt)
+    Attendance = models.Attendance
+    source = (
+        select(
+            Attendance.student_id,
+            Attendance.course_id,
+            func.count(),
+            *(func.sum(case((Attendance.status == status, 1), else_=0)) for status in STATUSES),
+            literal(datetime.utcnow()),
+        )
+        .group_by(Attendance.student_id, Attendance.course_id)
+    )
+    if course_id is not None:
+        source = source.where(Attendance.course_id == course_id)
+    result = db.execute(
+        insert(Counter).from_select(["student_id", "course_id", "sessions", *STATUSES, "updated_at"], source)
+    )
+    db.commit()
+    return result.rowcount
+
+
+# ----------------- ล้าง roster หลัง commit ที่แก้ enrollment/ชื่อนักเรียน -----------------
+
+def _mark(target, course_id):
+    session = object_session(target)
+    if session is not None and course_id is not None:
+        session.info.setdefault(_DIRTY_KEY, set()).add(course_id)
+
+
+def _enrollment_changed(mapper, connection, target):
+    _mark(target, target.course_id)
+    for course_id in inspect(target).attrs.course_id.history.deleted:
+        _mark(target, course_id)  # ย้ายคอร์ส: roster เดิมก็ต้องล้างด้วย
+
+
+def _student_changed(mapper, connection, target):
+    # ไม่รู้ว่านักเรียนอยู่คอร์สไหนบ้างโดยไม่ query: ล้างทั้งหมด (ชื่อนักเรียนเปลี่ยนไม่บ่อย)
+    _mark(target, _ALL)
+
+
+for _event in ("after_insert", "after_update", "after_delete"):
+    event.listen(models.Enrollment, _event, _enrollment_changed)
+for _event in ("after_update", "after_delete"):
+    event.listen(models.Student, _event, _student_changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _clear_after_commit(session):
+    course_ids = session.info.pop(_DIRTY_KEY, None)
+    if not course_ids:
+        return
+    if _ALL in course_ids:
+        roster_cache.clear()
+        return
+    for course_id in course_ids:
+        roster_cache.pop(course_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_DIRTY_KEY, None)
@@ -0,0 +1,334 @@
+# app/utils/autosave.py
+import asyncio
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models import models
+from app.schemas import schemas
+from app.utils import grading
+
+logger = logging.getLogger(__name__)
+
+
+def _written_at(draft) -> datetime:
+    return datetime.fromisoformat(draft[2])
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AutosaveBuffer:
+    """Write-behind buffer for draft answers, keyed by student_exam_id.
+
+    Every draft is appended to a local journal before it is acknowledged, so a
+    crash between flushes loses nothing: the journal is replayed on the next
+    startup. Journal segments are deleted only after a full flush commits.
+
+    The buffer itself belongs to one process, but the journal directory is shared
+    by every worker on the host: finishing an attempt also reads that attempt's
+    drafts from the other workers' journals, so it never depends on which worker
+    received them.
+    """
+
+    def __init__(self, journal_dir: str, fsync: bool = True):
+        self.journal_dir = journal_dir
+        self.fsync = fsync
+        self._lock = threading.Lock()        # ป้องกัน _pending และ journal
+        self._flush_lock = threading.Lock()  # flush ได้ทีละครั้ง
+        self._pending = {}      # student_exam_id -> {question_id: (choice_id, answer_text, written_at)}
+        self._first_dirty = {}  # student_exam_id -> monotonic time ของ draft เก่าสุดที่ยังไม่ flush
+        self._journal = None
+        self._journal_path = None
+        self._segment = 0
+        self._retired = []      # journal ที่ลบได้หลัง flush เต็มรอบถัดไปสำเร็จ
+        self._task = None
+        self.metrics = {
+            "drafts_received": 0,
+            "rows_written": 0,
+            "rows_dropped": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "forced_flushes": 0,
+            "replayed_drafts": 0,
+            "last_flush_ms": 0.0,
+            "last_flush_lag_seconds": 0.0,
+            "max_flush_lag_seconds": 0.0,
+        }
+
+    # ----------------- journal -----------------
+
+    def _open_segment(self):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self._segment += 1
+        self._journal_path = os.path.join(self.journal_dir, f"autosave-{os.getpid()}-{self._segment:06d}.jsonl")
+        self._journal = open(self._journal_path, "a", encoding="utf-8")
+
+    def _close_segment(self):
+        # put() fsync นอก lock: ต้อง fsync ที่นี่ก่อนปิด ไม่งั้น draft ที่ตอบรับไปแล้วอาจยังไม่ลงดิสก์
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._journal.close()
+
+    def _rotate(self):
+        # เรียกภายใต้ self._lock
+        if self._journal is None:
+            return
+        self._close_segment()
+        self._retired.append(self._journal_path)
+        self._open_segment()
+
+    def _append(self, record: dict):
+        # เรียกภายใต้ self._lock: เขียนลง OS แล้วคืน segment ไป fsync นอก lock
+        if self._journal is None:
+            self._open_segment()
+        self._journal.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._journal.flush()
+        return self._journal
+
+    def _sync(self, journal):
+        try:
+            os.fsync(journal.fileno())
+        except ValueError:
+            pass  # segment ถูก rotate/ปิดไปแล้ว และ fsync ก่อนปิดแล้ว
+
+    @staticmethod
+    def _read_journal(path: str):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    break  # บรรทัดสุดท้ายเขียนไม่ครบ (crash หรือ worker อื่นกำลังเขียน)
+
+    def _journal_drafts(self, student_exam_id: int):
+        """Drafts of one attempt from every journal in the directory, including other workers'."""
+        drafts = {}
+        for path in glob.glob(os.path.join(self.journal_dir, "autosave-*.jsonl")):
+            try:
+                records = [record for record in self._read_journal(path) if record["se"] == student_exam_id]
+            except FileNotFoundError:
+                continue  # worker เจ้าของ flush เสร็จแล้วลบทิ้ง: draft อยู่ใน DB แล้ว
+            for record in records:
+                for question_id, choice_id, answer_text in record["answers"]:
+                    if question_id not in drafts or _written_at(drafts[question_id]) <= datetime.fromisoformat(record["at"]):
+                        drafts[question_id] = (choice_id, answer_text, record["at"])
+        return drafts
+
+    def recover(self):
+        """Load drafts from journals left behind by dead processes (or a previous run)."""
+        records, files = [], []
+        for path in glob.glob(os.path.join(self.journal_dir, "autosave-*.jsonl")):
+            try:
+                pid = int(os.path.basename(path).split("-")[1])
+            except (IndexError, ValueError):
+                continue
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            files.append(path)
+            records.extend(self._read_journal(path))
+        records.sort(key=lambda record: record["at"])
+        now = time.monotonic()
+        with self._lock:
+            for record in records:
+                drafts = self._pending.setdefault(record["se"], {})
+                for question_id, choice_id, answer_text in record["answers"]:
+                    drafts[question_id] = (choice_id, answer_text, record["at"])
+                self._first_dirty.setdefault(record["se"], now)
+                self.metrics["replayed_drafts"] += len(record["answers"])
+            self._retired.extend(files)
+        if records:
+            logger.info("Autosave recovered %s draft batches from %s journal files", len(records), len(files))
+        return len(records)
+
+    # ----------------- buffer -----------------
+
+    def put(self, student_exam_id: int, answers):
+        written_at = datetime.utcnow().isoformat()
+        rows = [[answer.question_id, answer.choice_id, answer.answer_text] for answer in answers]
+        with self._lock:
+            journal = self._append({"se": student_exam_id, "at": written_at, "answers": rows})
+            drafts = self._pending.setdefault(student_exam_id, {})
+            for question_id, choice_id, answer_text in rows:
+                drafts[question_id] = (choice_id, answer_text, written_at)
+            self._first_dirty.setdefault(student_exam_id, time.monotonic())
+            self.metrics["drafts_received"] += len(rows)
+            buffered = sum(len(drafts) for drafts in self._pending.values())
+        if self.fsync:
+            self._sync(journal)  # ตอบรับหลังลงดิสก์แล้ว แต่ไม่ถือ lock ระหว่างรอ ให้ request อื่นเขียนต่อได้
+        if buffered > settings.AUTOSAVE_MAX_BUFFERED_ANSWERS:
+            # buffer ใหญ่เกิน: flush ใน request นี้เลยแทนที่จะรอ timer
+            self.metrics["forced_flushes"] += 1
+            self.flush()
+        return len(rows)
+
+    def _take(self, student_exam_id=None):
+        with self._lock:
+            if student_exam_id is None:
+                batch, dirty = self._pending, self._first_dirty
+                self._pending, self._first_dirty = {}, {}
+                self._rotate()
+            else:
+                if student_exam_id not in self._pending:
+                    return {}, {}
+                batch = {student_exam_id: self._pending.pop(student_exam_id)}
+                dirty = {student_exam_id: self._first_dirty.pop(student_exam_id, time.monotonic())}
+        return batch, dirty
+
+    def _restore(self, batch: dict, dirty: dict):
+        # flush ไม่สำเร็จ: คืน draft เข้า buffer โดยไม่ทับ draft ที่ใหม่กว่า
+        with self._lock:
+            for student_exam_id, drafts in batch.items():
+                self._pending[student_exam_id] = {**drafts, **self._pending.get(student_exam_id, {})}
+                self._first_dirty[student_exam_id] = min(
+                    dirty.get(student_exam_id, time.monotonic()),
+                    self._first_dirty.get(student_exam_id, time.monotonic()),
+                )
+
+    def flush(self, student_exam_id: int = None):
+        """Write buffered drafts to student_answers; all of them, or one attempt's.
+
+        Flushing one attempt (before finishing it) also picks up its drafts from
+        the journals of other workers; the newest write of each question wins.
+        """
+        with self._flush_lock:
+            batch, dirty = self._take(student_exam_id)
+            if student_exam_id is not None:
+                shared = self._journal_drafts(student_exam_id)
+                local = batch.get(student_exam_id, {})
+                merged = {
+                    question_id: max(draft, local.get(question_id, draft), key=_written_at)
+                    for question_id, draft in shared.items()
+                }
+                merged.update({question_id: draft for question_id, draft in local.items() if question_id not in merged})
+                if merged:
+                    batch = {student_exam_id: merged}
+                    dirty.setdefault(student_exam_id, time.monotonic())
+            if not batch:
+                if student_exam_id is None:
+                    self._delete_retired()
+                return 0
+            started = time.monotonic()
+            written = 0
+            db = SessionLocal()
+            try:
+                student_exams = {
+                    student_exam.student_exam_id: student_exam
+                    for student_exam in db.query(models.StudentExam).filter(
+                        models.StudentExam.student_exam_id.in_(list(batch))
+                    )
+                }
+                for se_id, drafts in batch.items():
+                    student_exam = student_exams.get(se_id)
+                    if student_exam is None or student_exam.status == "completed":
+                        self.metrics["rows_dropped"] += len(drafts)
+                        continue
+                    answers = [
+                        schemas.StudentAnswerCreate(question_id=question_id, choice_id=choice_id, answer_text=answer_text)
+                        for question_id, (choice_id, answer_text, _) in drafts.items()
+                    ]
+                    written_at = {
+                        question_id: datetime.fromisoformat(at) for question_id, (_, _, at) in drafts.items()
+                    }
+                    try:
+                        grading.upsert_answers(db, student_exam, answers, written_at=written_at)
+                    except ValueError:
+                        # โจทย์ถูกลบออกจาก exam ระหว่างสอบ
+                        db.rollback()
+                        self.metrics["rows_dropped"] += len(drafts)
+                        continue
+                    written += len(drafts)
+            except Exception:
+                db.rollback()
+                self._restore(batch, dirty)
+                self.metrics["flush_errors"] += 1
+                raise
+            finally:
+                db.close()
+
+            lag = started - min(dirty.values())
+            self.metrics["flushes"] += 1
+            self.metrics["rows_written"] += written
+            self.metrics["last_flush_ms"] = round((time.monotonic() - started) * 1000, 2)
+            self.metrics["last_flush_lag_seconds"] = round(lag, 3)
+            self.metrics["max_flush_lag_seconds"] = max(self.metrics["max_flush_lag_seconds"], round(lag, 3))
+            if student_exam_id is None:
+                self._delete_retired()
+            return written
+
+    def _delete_retired(self):
+        retired, self._retired = self._retired, []
+        for path in retired:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    # ----------------- lifecycle -----------------
+
+    async def _run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.exception("Autosave flush failed, drafts kept for next attempt")
+
+    async def start(self, interval: float):
+        if self._task is not None:
+            return
+        if self.recover():
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.exception("Autosave recovery flush failed, drafts kept for next attempt")
+        self._task = asyncio.get_running_loop().create_task(self._run(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await asyncio.to_thread(self.flush)
+        except Exception:
+            logger.exception("Autosave shutdown flush failed, drafts stay in the journal")
+        with self._lock:
+            if self._journal is not None:
+                empty = self._journal.tell() == 0
+                self._close_segment()
+                self._journal = None
+                if empty and not self._pending:
+                    os.remove(self._journal_path)
+
+    def get_metrics(self):
+        with self._lock:
+            buffered_answers = sum(len(drafts) for drafts in self._pending.values())
+            oldest = min(self._first_dirty.values()) if self._first_dirty else None
+            journal_bytes = self._journal.tell() if self._journal is not None else 0
+        received = self.metrics["drafts_received"]
+        return {
+            **self.metrics,
+            "buffered_exams": len(self._pending),
+            "buffered_answers": buffered_answers,
+            "flush_lag_seconds": round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+            "coalesced": max(received - self.metrics["rows_written"] - self.metrics["rows_dropped"] - buffered_answers, 0),
+            "journal_bytes": journal_bytes,
+            "running": self._task is not None,
+        }
+
+
+buffer = AutosaveBuffer(settings.AUTOSAVE_JOURNAL_DIR, fsync=settings.AUTOSAVE_FSYNC)
@@ -0,0 +1,161 @@
+# app/utils/course_catalog.py
+import hashlib
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload, object_session, selectinload
+
+from app.core.config import settings
+from app.models import models
+from app.schemas import schemas
+from app.utils.cache import TTLCache
+
+# version ของทั้ง catalog: bump หลัง commit ที่แก้ course/schedule/teacher/ห้อง/ราคา
+# entry ที่ผูกกับ version เก่าจึงไม่ถูกใช้อีก (และหมดอายุตาม TTL)
+_version = 0
+_version_lock = threading.Lock()
+_build_lock = threading.Lock()
+
+catalog_cache = TTLCache(maxsize=256, ttl=settings.COURSE_CATALOG_CACHE_TTL)
+
+_DIRTY_KEY = "course_catalog_dirty"
+
+
+def catalog_version() -> int:
+    return _version
+
+
+def bump_version():
+    global _version
+    with _version_lock:
+        _version += 1
+
+
+def mark_dirty(db: Session):
+    """For writes that bypass ORM events (bulk INSERT): bump the catalog version after commit."""
+    db.info[_DIRTY_KEY] = True
+
+
+def _load_courses(db: Session, course_id: int = None):
+    # course + ครู + ราคา + คาบเรียนพร้อมชื่อห้อง: 3 query ไม่ว่าจะมีกี่คอร์ส
+    query = (
+        db.query(models.Course, models.CoursePrice.price)
+        .outerjoin(models.CoursePrice, models.CoursePrice.course_id == models.Course.course_id)
+        .options(
+            joinedload(models.Course.teacher),
+            selectinload(models.Course.schedules).joinedload(models.Schedule.classroom),
+        )
+        .order_by(models.Course.start_date, models.Course.course_id)
+    )
+    if course_id is not None:
+        query = query.filter(models.Course.course_id == course_id)
+    return query.all()
+
+
+def _item(course: models.Course, price, detail: bool):
+    schedules = sorted(course.schedules, key=lambda schedule: (schedule.start_time, schedule.schedule_id))
+    teacher = course.teacher
+    item = {
+        "course_id": course.course_id,
+        "name": course.name,
+        "description": course.description,
+        "start_date": course.start_date,
+        "end_date": course.end_date,
+        "price": float(price or 0.0),
+        "teacher": {"teacher_id": teacher.teacher_id, "first_name": teacher.first_name, "last_name": teacher.last_name} if teacher else None,
+        "session_count": len(schedules),
+        "first_session": schedules[0].start_time if schedules else None,
+        "last_session": schedules[-1].start_time if schedules else None,
+    }
+    if not detail:
+        return schemas.CourseCatalogItem(**item)
+    item["schedules"] = [
+        {
+            "schedule_id": schedule.schedule_id,
+            "classroom_id": schedule.classroom_id,
+            "classroom_name": schedule.classroom.name if schedule.classroom else None,
+            "start_time": schedule.start_time,
+            "end_time": schedule.end_time,
+        }
+        for schedule in schedules
+    ]
+    return schemas.CourseCatalogDetail(**item)
+
+
+def _entry(body: bytes):
+    # strong ETag จากเนื้อหาจริง: ทุก worker ได้ค่าเดียวกันถ้าข้อมูลเท่ากัน
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"', body
+
+
+def _cached(key, build):
+    versioned = (key, catalog_version())
+    entry = catalog_cache.get(versioned)
+    if entry is not None:
+        return entry
+    # LIFF เปิดพร้อมกันหลายคน: ให้ request แรกสร้าง ที่เหลือรอใช้ผลเดียวกัน
+    with _build_lock:
+        entry = catalog_cache.get(versioned)
+        if entry is not None:
+            return entry
+        body = build()
+        if body is None:
+            return None
+        entry = _entry(body)
+        catalog_cache.set(versioned, entry)
+        return entry
+
+
+def get_catalog(db: Session):
+    """(etag, JSON body) of the full course list."""
+    def build():
+        items = [_item(course, price, detail=False) for course, price in _load_courses(db)]
+        return ("[" + ",".join(item.model_dump_json() for item in items) + "]").encode()
+    return _cached("list", build)
+
+
+def get_course(db: Session, course_id: int):
+    """(etag, JSON body) of one course with its schedule, or None if it does not exist."""
+    def build():
+        rows = _load_courses(db, course_id)
+        if not rows:
+            return None
+        course, price = rows[0]
+        return _item(course, price, detail=True).model_dump_json().encode()
+    return _cached(("course", course_id), build)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match เทียบแบบ weak: W/"x" ถือว่าตรงกับ "x"
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def get_stats():
+    return {**catalog_cache.stats(), "version": catalog_version()}
+
+
+# ----------------- bump version อัตโนมัติเมื่อแก้ไขผ่าน ORM -----------------
+
+def _mark(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info[_DIRTY_KEY] = True
+
+
+for _model in (models.Course, models.CoursePrice, models.Schedule, models.Teacher, models.Classroom):
+    for _event in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event, _mark)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session):
+    if session.info.pop(_DIRTY_KEY, None):
+        bump_version()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_DIRTY_KEY, None)
@@ -0,0 +1,70 @@
+# app/utils/course_prices.py
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+
+from app.core.config import settings
+from app.models import models
+from app.utils.cache import TTLCache
+
+# course_id -> ราคา ของทุกคอร์ส (ตารางเล็ก โหลดทั้งก้อนครั้งเดียว)
+price_cache = TTLCache(maxsize=1, ttl=settings.COURSE_PRICE_CACHE_TTL)
+
+_KEY = "prices"
+_DIRTY_KEY = "course_prices_dirty"
+
+
+def get_price_table(db: Session) -> dict:
+    prices = price_cache.get(_KEY)
+    if prices is None:
+        prices = {
+            course_id: float(price or 0.0)
+            for course_id, price in db.execute(
+                select(models.Course.course_id, models.CoursePrice.price)
+                .outerjoin(models.CoursePrice, models.CoursePrice.course_id == models.Course.course_id)
+            )
+        }
+        price_cache.set(_KEY, prices)
+    return prices
+
+
+def get_price(db: Session, course_id: int):
+    """Price of a course, or None if the course does not exist."""
+    return get_price_table(db).get(course_id)
+
+
+def set_price(db: Session, course_id: int, price: float):
+    row = db.get(models.CoursePrice, course_id)
+    if row is None:
+        row = models.CoursePrice(course_id=course_id)
+        db.add(row)
+    row.price = price
+    db.commit()
+    return row
+
+
+def get_stats():
+    return price_cache.stats()
+
+
+# ----------------- ล้าง cache หลัง commit ที่แก้ course/ราคา -----------------
+
+def _mark(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info[_DIRTY_KEY] = True
+
+
+for _model in (models.Course, models.CoursePrice):
+    for _event in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event, _mark)
+
+
+@event.listens_for(Session, "after_commit")
+def _clear_after_commit(session):
+    if session.info.pop(_DIRTY_KEY, None):
+        price_cache.clear()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_DIRTY_KEY, None)
@@ -0,0 +1,159 @@
+# app/utils/enrollment_service.py
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import models
+from app.utils import attendance, course_prices, student_overview
+
+
+class EnrollmentError(ValueError):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+# partial unique index (student_id, course_id) WHERE status = 'active' บน enrollment
+ACTIVE_ENROLLMENT_INDEX = "uq_enrollment_active_student_course"
+
+
+def _is_duplicate_enrollment(error: IntegrityError):
+    # Postgres บอกชื่อ index ที่ชน ส่วน SQLite บอกเป็นรายชื่อ column
+    message = str(error.orig)
+    return ACTIVE_ENROLLMENT_INDEX in message or "enrollment.student_id, enrollment.course_id" in message
+
+
+def _invoice_dates():
+    today = datetime.combine(date.today(), datetime.min.time())
+    return today, today + timedelta(days=settings.INVOICE_DUE_DAYS)
+
+
+def _active_student_ids(db: Session, course_id: int, student_ids):
+    return set(db.execute(
+        select(models.Enrollment.student_id).where(
+            models.Enrollment.course_id == course_id,
+            models.Enrollment.student_id.in_(list(student_ids)),
+            models.Enrollment.status == "active",
+        )
+    ).scalars())
+
+
+def _result(enrollment_id: int, student_id: int, course_id: int, invoice_id: int, price: float):
+    return {
+        "enrollment_id": enrollment_id,
+        "student_id": student_id,
+        "course_id": course_id,
+        "enroll_date": date.today(),
+        "expire_date": None,
+        "status": "active",
+        "invoice_id": invoice_id,
+        "total_amount": price,
+    }
+
+
+def enroll_student(db: Session, student_id: int, course_id: int):
+    """Create an enrollment and its invoice in one transaction (flush, one commit)."""
+    price = course_prices.get_price(db, course_id)
+    if price is None:
+        raise EnrollmentError(404, "Course not found")
+    if _active_student_ids(db, course_id, [student_id]):
+        raise EnrollmentError(409, "Student is already enrolled in this course")
+
+    invoice_date, due_date = _invoice_dates()
+    enrollment = models.Enrollment(student_id=student_id, course_id=course_id, enroll_date=date.today(), status="active")
+    invoice = models.Invoice(
+        student_id=student_id,
+        enrollment=enrollment,
+        invoice_date=invoice_date,
+        due_date=due_date,
+        total_amount=price,
+        description="Invoice for enrollment",
+        status="pending",
+    )
+    db.add_all([enrollment, invoice])
+    try:
+        db.flush()
+        result = _result(enrollment.enrollment_id, student_id, course_id, invoice.invoice_id, price)
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        # อีก request ลงทะเบียนคู่นี้ไปก่อนหลังจากที่เราเช็คแล้ว
+        if _is_duplicate_enrollment(e):
+            raise EnrollmentError(409, "Student is already enrolled in this course") from e
+        raise
+    except Exception:
+        db.rollback()
+        raise
+    return result
+
+
+def bulk_enroll(db: Session, course_id: int, student_ids):
+    """Enroll a class roster: one INSERT for enrollments, one for invoices, one commit.
+
+    Students already actively enrolled are skipped, so retrying the same roster is safe.
+    """
+    price = course_prices.get_price(db, course_id)
+    if price is None:
+        raise EnrollmentError(404, "Course not found")
+    student_ids = list(dict.fromkeys(student_ids))
+    known = set(db.execute(
+        select(models.Student.student_id).where(models.Student.student_id.in_(student_ids))
+    ).scalars())
+    unknown = [student_id for student_id in student_ids if student_id not in known]
+    if unknown:
+        raise EnrollmentError(400, f"Unknown student ids: {unknown}")
+
+    skipped = _active_student_ids(db, course_id, student_ids)
+    to_enroll = [student_id for student_id in student_ids if student_id not in skipped]
+    if not to_enroll:
+        return {"course_id": course_id, "enrolled": [], "skipped_student_ids": sorted(skipped)}
+
+    invoice_date, due_date = _invoice_dates()
+    try:
+        enrollment_ids = db.execute(
+            insert(models.Enrollment).returning(models.Enrollment.enrollment_id, sort_by_parameter_order=True),
+            [
+                {"student_id": student_id, "course_id": course_id, "enroll_date": date.today(), "status": "active"}
+                for student_id in to_enroll
+            ],
+        ).scalars().all()
+        invoice_ids = db.execute(
+            insert(models.Invoice).returning(models.Invoice.invoice_id, sort_by_parameter_order=True),
+            [
+                {
+                    "student_id": student_id,
+                    "enrollment_id": enrollment_id,
+                    "invoice_date": invoice_date,
+                    "due_date": due_date,
+                    "total_amount": price,
+                    "description": "Invoice for enrollment",
+                    "status": "pending",
+                    "created_at": datetime.utcnow(),
+                }
+                for student_id, enrollment_id in zip(to_enroll, enrollment_ids)
+            ],
+        ).scalars().all()
+        # INSERT แบบ bulk ไม่ผ่าน ORM event: แจ้ง roster / overview cache เอง
+        attendance.mark_roster_dirty(db, course_id)
+        student_overview.mark_dirty(db, *to_enroll)
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if _is_duplicate_enrollment(e):
+            raise EnrollmentError(409, "Some students were enrolled concurrently; retry to skip them") from e
+        raise
+    except Exception:
+        db.rollback()
+        raise
+    return {
+        "course_id": course_id,
+        "enrolled": [
+            _result(enrollment_id, student_id, course_id, invoice_id, price)
+            for student_id, enrollment_id, invoice_id in zip(to_enroll, enrollment_ids, invoice_ids)
+        ],
+        "skipped_student_ids": sorted(skipped),
+    }
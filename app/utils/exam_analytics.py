@@ -0,0 +1,326 @@
+# app/utils/exam_analytics.py
+import logging
+import math
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import case, delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models import models
+from app.utils import grading
+from app.utils.sql import upsert_insert
+
+logger = logging.getLogger(__name__)
+
+SCORE_BINS = 10  # ช่วงละ 10 คะแนน
+
+
+def score_bin(score: float) -> int:
+    return min(int(float(score) // (100 / SCORE_BINS)), SCORE_BINS - 1)
+
+
+def _ensure_rows(db: Session, model, rows: list):
+    # สร้างแถวตัวนับที่ยังไม่มี (ค่าเริ่มต้น 0) แล้วค่อย UPDATE x = x + n แบบ atomic
+    if not rows:
+        return
+    stmt = upsert_insert(db, model)
+    if stmt is not None:
+        db.execute(stmt.values(rows).on_conflict_do_nothing())
+        return
+    keys = [column.name for column in model.__table__.primary_key.columns]
+    existing = {
+        tuple(row) for row in db.execute(select(*model.__table__.primary_key.columns).where(
+            model.__table__.primary_key.columns[keys[0]].in_([row[keys[0]] for row in rows])
+        ))
+    }
+    missing = [row for row in rows if tuple(row[key] for key in keys) not in existing]
+    if missing:
+        db.execute(insert(model), missing)
+
+
+def record_attempt(db: Session, student_exam: models.StudentExam):
+    """Fold one completed attempt into the summary tables (caller commits).
+
+    Counts, p-values, distractor picks and the score distribution stay exact;
+    discrimination needs the whole ranking and is refreshed by rebuild_exam_stats.
+    """
+    exam_id = student_exam.exam_id
+    key = grading.get_answer_key(db, exam_id)
+    answers = db.execute(
+        select(models.StudentAnswer.question_id, models.StudentAnswer.choice_id, models.StudentAnswer.is_correct)
+        .where(models.StudentAnswer.student_exam_id == student_exam.student_exam_id, ~grading.superseded(models.StudentAnswer))
+    ).all()
+    correct_questions = [question_id for question_id, _, is_correct in answers if is_correct and question_id in key.correct_choices]
+    picked = [(question_id, choice_id) for question_id, choice_id, _ in answers if choice_id is not None and question_id in key.correct_choices]
+
+    _ensure_rows(db, models.ExamScoreStat, [{"exam_id": exam_id, "attempts": 0, "score_sum": 0.0, "score_sq_sum": 0.0, "attempts_at_rebuild": 0}])
+    _ensure_rows(db, models.ExamQuestionStat, [
+        {"question_id": question_id, "exam_id": exam_id, "attempts": 0, "correct_count": 0}
+        for question_id in key.correct_choices
+    ])
+    _ensure_rows(db, models.ExamChoiceStat, [
+        {"choice_id": choice_id, "question_id": question_id, "exam_id": exam_id, "picked_count": 0}
+        for question_id, choice_id in picked
+    ])
+
+    db.execute(
+        update(models.ExamQuestionStat)
+        .where(models.ExamQuestionStat.exam_id == exam_id)
+        .values(attempts=models.ExamQuestionStat.attempts + 1)
+    )
+    if correct_questions:
+        db.execute(
+            update(models.ExamQuestionStat)
+            .where(models.ExamQuestionStat.question_id.in_(correct_questions))
+            .values(correct_count=models.ExamQuestionStat.correct_count + 1)
+        )
+    if picked:
+        db.execute(
+            update(models.ExamChoiceStat)
+            .where(models.ExamChoiceStat.choice_id.in_([choice_id for _, choice_id in picked]))
+            .values(picked_count=models.ExamChoiceStat.picked_count + 1)
+        )
+
+    if student_exam.score is not None:
+        score = float(student_exam.score)
+        stat = models.ExamScoreStat
+        db.execute(
+            update(stat)
+            .where(stat.exam_id == exam_id)
+            .values(
+                attempts=stat.attempts + 1,
+                score_sum=stat.score_sum + score,
+                score_sq_sum=stat.score_sq_sum + score * score,
+                min_score=case((stat.min_score.is_(None) | (stat.min_score > score), score), else_=stat.min_score),
+                max_score=case((stat.max_score.is_(None) | (stat.max_score < score), score), else_=stat.max_score),
+            )
+        )
+        bin_no = score_bin(score)
+        _ensure_rows(db, models.ExamScoreBin, [{"exam_id": exam_id, "bin_no": bin_no, "count": 0}])
+        db.execute(
+            update(models.ExamScoreBin)
+            .where(models.ExamScoreBin.exam_id == exam_id, models.ExamScoreBin.bin_no == bin_no)
+            .values(count=models.ExamScoreBin.count + 1)
+        )
+
+
+def needs_rebuild(db: Session, exam_id: int):
+    stat = db.get(models.ExamScoreStat, exam_id)
+    if stat is None:
+        return False
+    return (stat.attempts or 0) - (stat.attempts_at_rebuild or 0) >= settings.ANALYTICS_REBUILD_EVERY
+
+
+def compute_exam_stats(attempts: pd.DataFrame, answers: pd.DataFrame, choices: pd.DataFrame, fraction: float):
+    """Vectorized item analysis.
+
+    attempts: student_exam_id, score / answers: student_exam_id, question_id,
+    choice_id, is_correct / choices: question_id, choice_id (every question of the
+    exam, choice_id empty for questions without choices).
+    """
+    question_ids = choices["question_id"].drop_duplicates().to_numpy()
+    choices = choices.dropna(subset=["choice_id"]).astype({"choice_id": int})
+    n = len(attempts)
+
+    # เมทริกซ์ attempt x question (ข้อที่ไม่ตอบ = ผิด)
+    correct = (
+        answers.assign(is_correct=answers["is_correct"].fillna(False).astype(bool))
+        .pivot_table(index="student_exam_id", columns="question_id", values="is_correct", aggfunc="max", fill_value=False)
+        .reindex(index=attempts["student_exam_id"], columns=question_ids, fill_value=False)
+        .astype(np.int8)
+    )
+    correct_count = correct.sum(axis=0)
+
+    # ดัชนีอำนาจจำแนก: แบ่งกลุ่มสูง/ต่ำตามคะแนนรวม
+    discrimination = pd.Series(np.nan, index=question_ids)
+    group = int(round(n * fraction))
+    if n >= 2 and group >= 1:
+        order = attempts["score"].fillna(0).to_numpy().argsort(kind="stable")
+        lower = correct.iloc[order[:group]].mean(axis=0)
+        upper = correct.iloc[order[-group:]].mean(axis=0)
+        discrimination = (upper - lower).round(4)
+
+    picked = (
+        answers.dropna(subset=["choice_id"])
+        .groupby("choice_id").size()
+        .reindex(choices["choice_id"], fill_value=0)
+    )
+
+    scores = attempts["score"].dropna().astype(float)
+    bins = np.minimum((scores.to_numpy() // (100 / SCORE_BINS)).astype(int), SCORE_BINS - 1)
+    histogram = np.bincount(bins, minlength=SCORE_BINS) if len(scores) else np.zeros(SCORE_BINS, dtype=int)
+
+    return {
+        "questions": [
+            {
+                "question_id": int(question_id),
+                "attempts": n,
+                "correct_count": int(correct_count[question_id]),
+                "discrimination": None if pd.isna(discrimination[question_id]) else float(discrimination[question_id]),
+            }
+            for question_id in question_ids
+        ],
+        "choices": [
+            {"choice_id": int(choice_id), "question_id": int(question_id), "picked_count": int(picked[choice_id])}
+            for question_id, choice_id in choices[["question_id", "choice_id"]].itertuples(index=False)
+        ],
+        "score": {
+            "attempts": int(len(scores)),
+            "score_sum": float(scores.sum()),
+            "score_sq_sum": float((scores ** 2).sum()),
+            "min_score": float(scores.min()) if len(scores) else None,
+            "max_score": float(scores.max()) if len(scores) else None,
+        },
+        "bins": [{"bin_no": bin_no, "count": int(count)} for bin_no, count in enumerate(histogram) if count],
+    }
+
+
+def rebuild_exam_stats(db: Session, exam_id: int):
+    """Recompute every statistic of an exam from completed attempts and replace its summary rows."""
+    started = time.perf_counter()
+    connection = db.connection()
+    attempts = pd.read_sql(
+        select(models.StudentExam.student_exam_id, models.StudentExam.score)
+        .where(models.StudentExam.exam_id == exam_id, models.StudentExam.status == "completed"),
+        connection,
+    )
+    answers = pd.read_sql(
+        select(
+            models.StudentAnswer.student_exam_id,
+            models.StudentAnswer.question_id,
+            models.StudentAnswer.choice_id,
+            models.StudentAnswer.is_correct,
+        )
+        .join(models.StudentExam, models.StudentExam.student_exam_id == models.StudentAnswer.student_exam_id)
+        .join(models.Question, models.Question.question_id == models.StudentAnswer.question_id)
+        .where(
+            models.StudentExam.exam_id == exam_id,
+            models.StudentExam.status == "completed",
+            models.Question.exam_id == exam_id,
+            ~grading.superseded(models.StudentAnswer),
+        ),
+        connection,
+    )
+    choices = pd.read_sql(
+        select(models.Question.question_id, models.Choice.choice_id)
+        .outerjoin(models.Choice, models.Choice.question_id == models.Question.question_id)
+        .where(models.Question.exam_id == exam_id)
+        .order_by(models.Question.question_id, models.Choice.choice_id),
+        connection,
+    )
+    loaded = time.perf_counter()
+    attempts["score"] = pd.to_numeric(attempts["score"], errors="coerce")
+    stats = compute_exam_stats(attempts, answers, choices, settings.ANALYTICS_UPPER_LOWER_FRACTION)
+    computed = time.perf_counter()
+
+    for model in (models.ExamChoiceStat, models.ExamQuestionStat, models.ExamScoreBin, models.ExamScoreStat):
+        db.execute(delete(model).where(model.exam_id == exam_id))
+    if stats["questions"]:
+        db.execute(insert(models.ExamQuestionStat), [{**row, "exam_id": exam_id} for row in stats["questions"]])
+    if stats["choices"]:
+        db.execute(insert(models.ExamChoiceStat), [{**row, "exam_id": exam_id} for row in stats["choices"]])
+    if stats["bins"]:
+        db.execute(insert(models.ExamScoreBin), [{**row, "exam_id": exam_id} for row in stats["bins"]])
+    db.add(models.ExamScoreStat(
+        exam_id=exam_id,
+        attempts_at_rebuild=stats["score"]["attempts"],
+        rebuilt_at=datetime.utcnow(),
+        **stats["score"],
+    ))
+    db.commit()
+    return {
+        "exam_id": exam_id,
+        "attempts": len(attempts),
+        "answers": len(answers),
+        "timings_ms": {
+            "load": round((loaded - started) * 1000, 1),
+            "compute": round((computed - loaded) * 1000, 1),
+            "store": round((time.perf_counter() - computed) * 1000, 1),
+        },
+    }
+
+
+def rebuild_in_background(exam_id: int):
+    db = SessionLocal()
+    try:
+        rebuild_exam_stats(db, exam_id)
+    except Exception:
+        db.rollback()
+        logger.exception("Rebuilding analytics for exam %s failed", exam_id)
+    finally:
+        db.close()
+
+
+def get_exam_analytics(db: Session, exam_id: int):
+    stat = db.get(models.ExamScoreStat, exam_id)
+    questions = (
+        db.query(models.ExamQuestionStat)
+        .filter(models.ExamQuestionStat.exam_id == exam_id)
+        .order_by(models.ExamQuestionStat.question_id)
+        .all()
+    )
+    choice_rows = (
+        db.query(models.ExamChoiceStat)
+        .filter(models.ExamChoiceStat.exam_id == exam_id)
+        .order_by(models.ExamChoiceStat.choice_id)
+        .all()
+    )
+    bins = dict(
+        db.query(models.ExamScoreBin.bin_no, models.ExamScoreBin.count)
+        .filter(models.ExamScoreBin.exam_id == exam_id)
+        .all()
+    )
+    key = grading.get_answer_key(db, exam_id)
+
+    choices_by_question = {}
+    for row in choice_rows:
+        choices_by_question.setdefault(row.question_id, []).append(row)
+
+    attempts = stat.attempts if stat else 0
+    mean = stddev = None
+    if attempts:
+        mean = stat.score_sum / attempts
+        stddev = math.sqrt(max(stat.score_sq_sum / attempts - mean * mean, 0.0))
+    width = 100 // SCORE_BINS
+    return {
+        "exam_id": exam_id,
+        "attempts": attempts,
+        "mean_score": round(mean, 2) if mean is not None else None,
+        "stddev_score": round(stddev, 2) if stddev is not None else None,
+        "min_score": stat.min_score if stat else None,
+        "max_score": stat.max_score if stat else None,
+        "distribution": [
+            {
+                "bin_no": bin_no,
+                "label": f"{bin_no * width}-{100 if bin_no == SCORE_BINS - 1 else bin_no * width + width - 1}",
+                "count": bins.get(bin_no, 0),
+            }
+            for bin_no in range(SCORE_BINS)
+        ],
+        "questions": [
+            {
+                "question_id": question.question_id,
+                "attempts": question.attempts,
+                "correct_count": question.correct_count,
+                "p_value": round(question.correct_count / question.attempts, 4) if question.attempts else None,
+                "discrimination": question.discrimination,
+                "choices": [
+                    {
+                        "choice_id": choice.choice_id,
+                        "picked_count": choice.picked_count,
+                        "rate": round(choice.picked_count / question.attempts, 4) if question.attempts else None,
+                        "is_correct": choice.choice_id in key.correct_choices.get(question.question_id, ()),
+                    }
+                    for choice in choices_by_question.get(question.question_id, [])
+                ],
+            }
+            for question in questions
+        ],
+        "attempts_at_rebuild": stat.attempts_at_rebuild if stat else 0,
+        "rebuilt_at": stat.rebuilt_at if stat else None,
+    }
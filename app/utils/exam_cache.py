@@ -0,0 +1,123 @@
+# app/utils/exam_cache.py
+import threading
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session, selectinload
+
+from app.core.config import settings
+from app.models import models
+from app.schemas import schemas
+from app.utils.cache import TTLCache
+
+# version ต่อ exam: ทุกครั้งที่ exam/question/choice เปลี่ยน จะ bump version
+# cache ที่ผูกกับ (exam_id, version) เก่าจึงไม่ถูกใช้อีก
+_versions = {}
+_versions_lock = threading.Lock()
+# lock แบบ striped จำนวนคงที่: exam_id ที่ไม่มีจริงก็ไม่ทำให้ dict ของ lock โตไม่สิ้นสุด
+_build_locks = [threading.Lock() for _ in range(64)]
+
+detail_cache = TTLCache(maxsize=settings.EXAM_DETAIL_CACHE_SIZE, ttl=settings.EXAM_DETAIL_CACHE_TTL)
+
+_BUMP_KEY = "exam_cache_bump"
+_CHOICE_QUESTIONS_KEY = "exam_cache_choice_questions"
+
+
+def exam_version(exam_id: int) -> int:
+    return _versions.get(exam_id, 0)
+
+
+def bump_exam_version(*exam_ids):
+    with _versions_lock:
+        for exam_id in exam_ids:
+            if exam_id is not None:
+                _versions[exam_id] = _versions.get(exam_id, 0) + 1
+
+
+def _build_lock(exam_id: int):
+    return _build_locks[exam_id % len(_build_locks)]
+
+
+def load_exam_tree(db: Session, exam_id: int):
+    # โหลด exam + questions + choices ด้วย 3 query (selectin) แทน 1 + N + M
+    return (
+        db.query(models.Exam)
+        .options(selectinload(models.Exam.questions).selectinload(models.Question.choices))
+        .filter(models.Exam.exam_id == exam_id)
+        .first()
+    )
+
+
+def get_exam_detail_json(db: Session, exam_id: int):
+    key = (exam_id, exam_version(exam_id))
+    body = detail_cache.get(key)
+    if body is not None:
+        return body
+    # นักเรียนเปิดข้อสอบพร้อมกันทั้งห้อง: ให้ request แรกสร้าง cache ที่เหลือรอใช้ผลเดียวกัน
+    with _build_lock(exam_id):
+        body = detail_cache.get(key)
+        if body is not None:
+            return body
+        exam = load_exam_tree(db, exam_id)
+        if exam is None:
+            return None
+        body = schemas.ExamDetail.model_validate(exam, from_attributes=True).model_dump_json().encode()
+        detail_cache.set(key, body)
+        return body
+
+
+def get_stats():
+    return {**detail_cache.stats(), "tracked_exams": len(_versions)}
+
+
+# ----------------- invalidation อัตโนมัติเมื่อแก้ไขผ่าน ORM -----------------
+
+def _mark(target, exam_id):
+    session = object_session(target)
+    if session is not None and exam_id is not None:
+        session.info.setdefault(_BUMP_KEY, set()).add(exam_id)
+
+
+def _exam_changed(mapper, connection, target):
+    _mark(target, target.exam_id)
+
+
+def _question_changed(mapper, connection, target):
+    _mark(target, target.exam_id)
+
+
+def _choice_changed(mapper, connection, target):
+    # choice ไม่มี exam_id: เก็บ question_id ไว้ แล้วหา exam ทีเดียวหลัง flush (ไม่ query ทีละแถว)
+    session = object_session(target)
+    if session is not None and target.question_id is not None:
+        session.info.setdefault(_CHOICE_QUESTIONS_KEY, set()).add(target.question_id)
+
+
+for _event in ("after_insert", "after_update", "after_delete"):
+    event.listen(models.Exam, _event, _exam_changed)
+    event.listen(models.Question, _event, _question_changed)
+    event.listen(models.Choice, _event, _choice_changed)
+
+
+@event.listens_for(Session, "after_flush")
+def _resolve_choice_questions(session, flush_context):
+    question_ids = session.info.pop(_CHOICE_QUESTIONS_KEY, None)
+    if not question_ids:
+        return
+    exam_ids = session.connection().execute(
+        select(models.Question.exam_id).where(models.Question.question_id.in_(question_ids)).distinct()
+    ).scalars()
+    session.info.setdefault(_BUMP_KEY, set()).update(exam_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session):
+    # bump หลัง commit เท่านั้น กัน reader อ่านข้อมูลก่อน commit แล้ว cache ไว้ใต้ version ใหม่
+    exam_ids = session.info.pop(_BUMP_KEY, None)
+    if exam_ids:
+        bump_exam_version(*exam_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_BUMP_KEY, None)
+    session.info.pop(_CHOICE_QUESTIONS_KEY, None)
@@ -0,0 +1,288 @@
+# app/utils/exam_import.py
+import time
+from collections import defaultdict
+
+import pandas as pd
+from fastapi import HTTPException
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from app.models import models
+from app.utils.exam_cache import bump_exam_version
+
+REQUIRED_COLUMNS = ['subject', 'grade', 'question_text', 'answer']
+
+
+def _clean(value):
+    # pandas ใช้ NaN แทนช่องว่าง ให้แปลงเป็น None
+    if value is None:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def _normalize_answer(value):
+    # คำตอบที่อ่านจาก Excel มักเป็น float เช่น 2.0 -> "2"
+    value = _clean(value)
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def exam_name(subject, grade):
+    return f"{subject} {grade}"
+
+
+def validate_columns(columns):
+    columns = list(columns)
+    if not all(col in columns for col in REQUIRED_COLUMNS):
+        raise HTTPException(status_code=400, detail=f"Missing required columns: {REQUIRED_COLUMNS}")
+    choice_cols = [col for col in columns if str(col).startswith('choice')]
+    if not choice_cols:
+        raise HTTPException(status_code=400, detail="No choice columns found (choice1, choice2, ...)")
+    return choice_cols
+
+
+def used_choice_columns(frames):
+    """Choice columns that hold a value in at least one row of `frames`; all-empty columns are dropped.
+
+    Both the in-memory and the streaming import number choices from this list,
+    so an answer like "2" picks the same column in either mode.
+    """
+    choice_cols, used = None, set()
+    for frame in frames:
+        if choice_cols is None:
+            choice_cols = validate_columns(frame.columns)
+        used.update(col for col in choice_cols if frame[col].notnull().any())
+    if choice_cols is None:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    choice_cols = [col for col in choice_cols if col in used]
+    if not choice_cols:
+        raise HTTPException(status_code=400, detail="No choice columns found (choice1, choice2, ...)")
+    return choice_cols
+
+
+class ExamImporter:
+    """Set-based importer: a few bulk queries per chunk instead of per-row round-trips."""
+
+    def __init__(self, db: Session, choice_cols, chunk_size: int = 1000):
+        self.db = db
+        self.choice_cols = list(choice_cols)
+        self.chunk_size = max(1, chunk_size)
+        self.exam_ids = {}                      # exam name -> exam_id
+        self.existing_questions = defaultdict(set)  # exam_id -> {question_text}
+        self.counts = {
+            "rows": 0,
+            "exams_created": 0,
+            "questions_inserted": 0,
+            "choices_inserted": 0,
+            "duplicates_skipped": 0,
+            "invalid_skipped": 0,
+        }
+        self.timings = defaultdict(float)
+        self.touched_exam_ids = set()
+
+    def _timed(self, phase, started):
+        self.timings[phase] += time.perf_counter() - started
+
+    def _resolve_exams(self, names):
+        # หา exam ที่มีอยู่แล้วด้วย query เดียว แล้วสร้างที่ยังไม่มีแบบ bulk
+        missing = [name for name in names if name not in self.exam_ids]
+        if not missing:
+            return []
+        rows = self.db.execute(
+            select(models.Exam.name, models.Exam.exam_id).where(models.Exam.name.in_(missing))
+        ).all()
+        for name, exam_id in rows:
+            self.exam_ids.setdefault(name, exam_id)
+        to_create = [name for name in missing if name not in self.exam_ids]
+        if to_create:
+            created = self.db.execute(
+                insert(models.Exam).returning(models.Exam.name, models.Exam.exam_id, sort_by_parameter_order=True),
+                [{"name": name} for name in to_create],
+            ).all()
+            for name, exam_id in created:
+                self.exam_ids[name] = exam_id
+            self.counts["exams_created"] += len(created)
+        # exam ที่เพิ่งสร้างไม่มีโจทย์เดิม ต้องโหลดเฉพาะ exam ที่มีอยู่แล้ว
+        return [self.exam_ids[name] for name in missing if name not in to_create]
+
+    def _load_existing_questions(self, exam_ids):
+        if not exam_ids:
+            return
+        rows = self.db.execute(
+            select(models.Question.exam_id, models.Question.question_text)
+            .where(models.Question.exam_id.in_(exam_ids))
+        ).all()
+        for exam_id, text in rows:
+            self.existing_questions[exam_id].add(text)
+
+    def import_frame(self, df: pd.DataFrame):
+        started = time.perf_counter()
+        records = df.to_dict("records")
+        self.counts["rows"] += len(records)
+
+        names = []
+        for record in records:
+            subject, grade = _clean(record.get('subject')), _clean(record.get('grade'))
+            record['_exam_name'] = exam_name(subject, grade) if subject is not None and grade is not None else None
+            if record['_exam_name'] is not None:
+                names.append(record['_exam_name'])
+        self._timed("parse", started)
+
+        started = time.perf_counter()
+        known_exam_ids = self._resolve_exams(list(dict.fromkeys(names)))
+        self._timed("resolve_exams", started)
+
+        started = time.perf_counter()
+        self._load_existing_questions(known_exam_ids)
+        self._timed("load_existing_questions", started)
+
+        # เตรียมแถว question / choice และตัดโจทย์ซ้ำ (ทั้งใน DB และในไฟล์เดียวกัน)
+        started = time.perf_counter()
+        question_rows, choice_groups = [], []
+        for record in records:
+            text = _clean(record.get('question_text'))
+            if record['_exam_name'] is None or text is None:
+                self.counts["invalid_skipped"] += 1
+                continue
+            exam_id = self.exam_ids[record['_exam_name']]
+            seen = self.existing_questions[exam_id]
+            if text in seen:
+                self.counts["duplicates_skipped"] += 1
+                continue
+            seen.add(text)
+            question_rows.append({
+                "exam_id": exam_id,
+                "question_text": text,
+                "question_type": _clean(record.get('question_type')) or 'normal',
+                "media_url": _clean(record.get('image_url')),
+            })
+            answer = _normalize_answer(record.get('answer'))
+            choices = []
+            for i, col in enumerate(self.choice_cols, 1):
+                choice_text = _clean(record.get(col))
+                if choice_text is None:
+                    continue
+                choices.append({
+                    "choice_text": str(choice_text),
+                    "is_correct": str(i) == answer or col == f'choice{answer}',
+                })
+            choice_groups.append(choices)
+        self._timed("prepare_rows", started)
+
+        for offset in range(0, len(question_rows), self.chunk_size):
+            batch = question_rows[offset:offset + self.chunk_size]
+            started = time.perf_counter()
+            question_ids = self.db.execute(
+                insert(models.Question).returning(models.Question.question_id, sort_by_parameter_order=True),
+                batch,
+            ).scalars().all()
+            self.counts["questions_inserted"] += len(question_ids)
+            self.touched_exam_ids.update(row["exam_id"] for row in batch)
+            self._timed("insert_questions", started)
+
+            started = time.perf_counter()
+            choice_rows = []
+            for question_id, choices in zip(question_ids, choice_groups[offset:offset + self.chunk_size]):
+                for choice in choices:
+                    choice_rows.append({"question_id": question_id, **choice})
+            if choice_rows:
+                self.db.execute(insert(models.Choice), choice_rows)
+                self.counts["choices_inserted"] += len(choice_rows)
+            self._timed("insert_choices", started)
+
+    def commit(self):
+        started = time.perf_counter()
+        self.db.commit()
+        self._timed("commit", started)
+        # bulk insert ไม่ผ่าน ORM event จึงต้อง bump cache ของ exam เอง
+        bump_exam_version(*self.touched_exam_ids)
+        self.touched_exam_ids.clear()
+
+    def affected_exam_ids(self):
+        return list(self.exam_ids.values())
+
+    def result(self):
+        return {
+            "counts": dict(self.counts),
+            "timings_ms": {phase: round(seconds * 1000, 2) for phase, seconds in self.timings.items()},
+        }
+
+
+def import_dataframe(db: Session, df: pd.DataFrame, chunk_size: int = 1000):
+    # ตัด column choice ที่ว่างทั้ง column ออก (เหมือนเดิม)
+    importer = ExamImporter(db, used_choice_columns([df]), chunk_size=chunk_size)
+    try:
+        importer.import_frame(df)
+        importer.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return importer
+
+
+# ----------------- Streaming import (อ่านไฟล์ทีละ chunk) -----------------
+
+def iter_csv_chunks(fileobj, chunk_size: int = 1000):
+    # pandas อ่าน CSV ทีละ chunk ไม่ต้องโหลดทั้งไฟล์เข้า memory
+    for chunk in pd.read_csv(fileobj, chunksize=chunk_size):
+        yield chunk
+
+
+def iter_xlsx_chunks(fileobj, chunk_size: int = 1000):
+    from openpyxl import load_workbook
+
+    # read_only mode ของ openpyxl อ่านแถวแบบ lazy จากไฟล์ zip
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(col).strip() if col is not None else f"unnamed_{i}" for i, col in enumerate(header)]
+        buffer = []
+        for row in rows:
+            if row is None or all(value is None for value in row):
+                continue
+            buffer.append(row)
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame.from_records(buffer, columns=columns)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame.from_records(buffer, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_upload_chunks(filename: str, fileobj, chunk_size: int = 1000):
+    if filename.endswith('.xlsx'):
+        return iter_xlsx_chunks(fileobj, chunk_size)
+    if filename.endswith('.csv'):
+        return iter_csv_chunks(fileobj, chunk_size)
+    raise HTTPException(status_code=400, detail="Only .xlsx, .csv, or Google Sheet URL are supported")
+
+
+def import_chunks(db: Session, filename: str, fileobj, chunk_size: int = 1000):
+    # validate + persist ทีละ chunk แล้ว commit ทันที ทำให้ memory คงที่ไม่ขึ้นกับขนาดไฟล์
+    # อ่านรอบแรกเพื่อหา column choice ที่ว่างทั้งไฟล์ (ตัดออกแบบเดียวกับ import_dataframe) แล้วค่อย import รอบสอง
+    choice_cols = used_choice_columns(iter_upload_chunks(filename, fileobj, chunk_size))
+    fileobj.seek(0)
+    importer = ExamImporter(db, choice_cols, chunk_size=chunk_size)
+    try:
+        for chunk in iter_upload_chunks(filename, fileobj, chunk_size):
+            importer.import_frame(chunk)
+            importer.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return importer
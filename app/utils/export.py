@@ -0,0 +1,116 @@
+# app/utils/export.py
+import csv
+import io
+import tempfile
+from datetime import date, datetime, timedelta
+
+from openpyxl import Workbook
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.database import engine
+from app.models import models
+
+# dataset -> (model, คอลัมน์วันที่สำหรับกรอง, คอลัมน์ที่ export ได้ตามลำดับ)
+DATASETS = {
+    "invoices": (
+        models.Invoice,
+        "invoice_date",
+        ["invoice_id", "student_id", "enrollment_id", "invoice_date", "due_date", "total_amount", "status", "description", "created_at"],
+    ),
+    "payments": (
+        models.Payment,
+        "payment_date",
+        ["payment_id", "enrollment_id", "invoice_id", "amount", "payment_date", "payment_method", "status", "payment_status", "slip_url"],
+    ),
+    "income": (
+        models.Income,
+        "income_date",
+        ["income_id", "payment_id", "income_date", "income_type", "amount", "description", "created_at"],
+    ),
+    "expense": (
+        models.Expense,
+        "expense_date",
+        ["expense_id", "expense_date", "expense_type", "amount", "vendor", "description", "created_at"],
+    ),
+}
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def resolve_columns(dataset: str, columns: str = None):
+    _, _, allowed = DATASETS[dataset]
+    if not columns:
+        return allowed
+    selected = [column.strip() for column in columns.split(",") if column.strip()]
+    unknown = [column for column in selected if column not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown columns for {dataset}: {unknown}. Allowed: {allowed}")
+    return selected
+
+
+def build_query(dataset: str, columns: list, start: date = None, end: date = None):
+    model, date_attr, _ = DATASETS[dataset]
+    table = model.__table__
+    date_col = table.c[date_attr]
+    query = select(*(table.c[column] for column in columns)).order_by(date_col, *table.primary_key.columns)
+    if start:
+        query = query.where(date_col >= datetime.combine(start, datetime.min.time()))
+    if end:
+        query = query.where(date_col < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    return query
+
+
+def iter_partitions(query):
+    # server-side cursor: ดึงทีละ EXPORT_BATCH_SIZE แถว ไม่โหลดทั้งตารางเข้าหน่วยความจำ
+    with engine.connect() as connection:
+        result = connection.execution_options(
+            stream_results=True, yield_per=settings.EXPORT_BATCH_SIZE
+        ).execute(query)
+        for rows in result.partitions():
+            yield rows
+
+
+def stream_csv(query, columns: list):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")  # BOM ให้ Excel อ่านภาษาไทยได้ถูกต้อง
+    writer.writerow(columns)
+    yield buffer.getvalue().encode("utf-8")
+    for rows in iter_partitions(query):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+
+
+def stream_xlsx(query, columns: list, title: str):
+    # xlsx เป็น zip จึงต้องเขียนให้ครบก่อนส่ง; write_only + ไฟล์ชั่วคราวทำให้หน่วยความจำคงที่
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title)
+    sheet.append(columns)
+    for rows in iter_partitions(query):
+        for row in rows:
+            sheet.append(list(row))
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+
+
+def export_stream(dataset: str, fmt: str, columns: list, start: date = None, end: date = None):
+    query = build_query(dataset, columns, start, end)
+    if fmt == "xlsx":
+        return stream_xlsx(query, columns, dataset)
+    return stream_csv(query, columns)
+
+
+def export_filename(dataset: str, fmt: str, start: date = None, end: date = None):
+    return f"{dataset}_{start.isoformat() if start else 'all'}_{end.isoformat() if end else 'all'}.{fmt}"
@@ -0,0 +1,159 @@
+# app/utils/finance_rollup.py
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, event, func, insert, inspect, literal, select, update
+from sqlalchemy.orm import Session
+
+from app.models import models
+from app.utils.sql import upsert_insert
+
+Rollup = models.FinanceDailyRollup
+
+# kind -> (model, date column, type column)
+SOURCES = {
+    "income": (models.Income, "income_date", "income_type"),
+    "expense": (models.Expense, "expense_date", "expense_type"),
+}
+
+
+def _day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _apply(connection, kind: str, day, category, amount: float, count: int):
+    if day is None:
+        return
+    row = {"day": _day(day), "kind": kind, "category": category or "", "total": amount or 0.0, "count": count}
+    stmt = upsert_insert(connection, Rollup)
+    if stmt is not None:
+        connection.execute(
+            stmt.values(row).on_conflict_do_update(
+                index_elements=["day", "kind", "category"],
+                set_={"total": Rollup.total + stmt.excluded.total, "count": Rollup.count + stmt.excluded.count},
+            )
+        )
+        return
+    result = connection.execute(
+        update(Rollup)
+        .where(Rollup.day == row["day"], Rollup.kind == kind, Rollup.category == row["category"])
+        .values(total=Rollup.total + row["total"], count=Rollup.count + count)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(Rollup).values(row))
+
+
+def _previous(target, attr: str):
+    history = inspect(target).attrs[attr].history
+    return history.deleted[0] if history.deleted else getattr(target, attr)
+
+
+# ----------------- อัปเดต rollup ใน transaction เดียวกับแถวที่เปลี่ยน -----------------
+# หมายเหตุ: query.update()/delete() แบบ bulk ไม่ผ่าน event เหล่านี้ ต้อง backfill ช่วงวันที่นั้นเอง
+
+def _listen(kind: str):
+    model, date_attr, type_attr = SOURCES[kind]
+
+    def after_insert(mapper, connection, target):
+        _apply(connection, kind, getattr(target, date_attr), getattr(target, type_attr), target.amount, 1)
+
+    def after_update(mapper, connection, target):
+        old = (_previous(target, date_attr), _previous(target, type_attr), _previous(target, "amount"))
+        new = (getattr(target, date_attr), getattr(target, type_attr), target.amount)
+        if old == new:
+            return
+        _apply(connection, kind, old[0], old[1], -(old[2] or 0.0), -1)
+        _apply(connection, kind, new[0], new[1], new[2], 1)
+
+    def after_delete(mapper, connection, target):
+        _apply(connection, kind, _previous(target, date_attr), _previous(target, type_attr), -(_previous(target, "amount") or 0.0), -1)
+
+    event.listen(model, "after_insert", after_insert)
+    event.listen(model, "after_update", after_update)
+    event.listen(model, "after_delete", after_delete)
+
+
+for _kind in SOURCES:
+    _listen(_kind)
+
+
+def backfill(db: Session, start: date = None, end: date = None):
+    """Rebuild the rollup from income/expense history with one INSERT ... SELECT per kind."""
+    counts = {}
+    delete_stmt = delete(Rollup)
+    if start:
+        delete_stmt = delete_stmt.where(Rollup.day >= start)
+    if end:
+        delete_stmt = delete_stmt.where(Rollup.day <= end)
+    db.execute(delete_stmt)
+
+    for kind, (model, date_attr, type_attr) in SOURCES.items():
+        date_col = getattr(model, date_attr)
+        day = func.date(date_col)
+        category = func.coalesce(getattr(model, type_attr), "")
+        source = (
+            select(day, literal(kind), category, func.sum(model.amount), func.count())
+            .group_by(day, category)
+        )
+        if start:
+            source = source.where(date_col >= datetime.combine(start, datetime.min.time()))
+        if end:
+            source = source.where(date_col < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+        result = db.execute(
+            insert(Rollup).from_select(["day", "kind", "category", "total", "count"], source)
+        )
+        counts[kind] = result.rowcount
+    db.commit()
+    return counts
+
+
+def _month(day: date):
+    return day.strftime("%Y-%m")
+
+
+def summarize(db: Session, start: date = None, end: date = None, group_by: str = "month"):
+    filters = []
+    if start:
+        filters.append(Rollup.day >= start)
+    if end:
+        filters.append(Rollup.day <= end)
+
+    periods = {}
+    for day, kind, total in db.execute(
+        select(Rollup.day, Rollup.kind, func.sum(Rollup.total))
+        .where(*filters)
+        .group_by(Rollup.day, Rollup.kind)
+        .order_by(Rollup.day)
+    ):
+        day = day if isinstance(day, date) else date.fromisoformat(day)
+        key = day.isoformat() if group_by == "day" else _month(day)
+        row = periods.setdefault(key, {"period": key, "income": 0.0, "expense": 0.0})
+        row[kind] += total or 0.0
+
+    by_type = {"income": [], "expense": []}
+    for kind, category, total, count in db.execute(
+        select(Rollup.kind, Rollup.category, func.sum(Rollup.total), func.sum(Rollup.count))
+        .where(*filters)
+        .group_by(Rollup.kind, Rollup.category)
+        .having(func.sum(Rollup.count) != 0)
+        .order_by(Rollup.kind, func.sum(Rollup.total).desc())
+    ):
+        by_type[kind].append({"category": category or None, "total": round(total or 0.0, 2), "count": count})
+
+    rows = []
+    for row in periods.values():
+        row["income"] = round(row["income"], 2)
+        row["expense"] = round(row["expense"], 2)
+        row["net"] = round(row["income"] - row["expense"], 2)
+        rows.append(row)
+    income_total = round(sum(row["income"] for row in rows), 2)
+    expense_total = round(sum(row["expense"] for row in rows), 2)
+    return {
+        "start": start,
+        "end": end,
+        "group_by": group_by,
+        "income_total": income_total,
+        "expense_total": expense_total,
+        "net": round(income_total - expense_total, 2),
+        "periods": rows,
+        "by_type": by_type,
+    }
@@ -0,0 +1,305 @@
+# app/utils/grading.py
+import time
+from datetime import datetime
+
+from sqlalchemy import Numeric, and_, case, cast, exists, func, or_, select, update
+from sqlalchemy.orm import Session, aliased
+
+from app.core.config import settings
+from app.models import models
+from app.utils.cache import TTLCache
+from app.utils.exam_cache import bump_exam_version, exam_version
+from app.utils.sql import has_unique, upsert_insert
+
+
+class AnswerKey:
+    """Precomputed per-exam key: question_id -> correct choice ids (and texts for fill-in)."""
+
+    __slots__ = ("exam_id", "version", "correct_choices", "correct_texts")
+
+    def __init__(self, exam_id: int, version: int, correct_choices: dict, correct_texts: dict):
+        self.exam_id = exam_id
+        self.version = version
+        self.correct_choices = correct_choices
+        self.correct_texts = correct_texts
+
+    @property
+    def question_count(self):
+        return len(self.correct_choices)
+
+    def grade(self, question_id: int, choice_id=None, answer_text=None):
+        # O(1): None = ตรวจไม่ได้ (ไม่ใช่โจทย์ของ exam นี้ หรือเป็นข้อเขียน)
+        correct = self.correct_choices.get(question_id)
+        if correct is None:
+            return None
+        if choice_id is not None:
+            return choice_id in correct
+        if answer_text is not None and self.correct_texts.get(question_id):
+            return _normalize_text(answer_text) in self.correct_texts[question_id]
+        return None if not correct else False
+
+
+def _normalize_text(text: str):
+    return " ".join(str(text).split()).lower()
+
+
+# (exam_id, version) -> AnswerKey: version ช่วยให้ worker ที่แก้เฉลยเห็นผลทันที
+# ส่วน worker อื่นไม่รู้ version ใหม่ จึงต้องมี TTL ให้ key เก่าหมดอายุเอง
+_keys = TTLCache(maxsize=settings.GRADING_ANSWER_KEY_CACHE_SIZE, ttl=settings.GRADING_ANSWER_KEY_TTL)
+
+
+def build_answer_key(db: Session, exam_id: int):
+    version = exam_version(exam_id)
+    rows = db.execute(
+        select(models.Question.question_id, models.Choice.choice_id, models.Choice.choice_text)
+        .outerjoin(models.Choice, and_(
+            models.Choice.question_id == models.Question.question_id,
+            models.Choice.is_correct.is_(True),
+        ))
+        .where(models.Question.exam_id == exam_id)
+    ).all()
+    correct_choices, correct_texts = {}, {}
+    for question_id, choice_id, choice_text in rows:
+        correct_choices.setdefault(question_id, set())
+        if choice_id is not None:
+            correct_choices[question_id].add(choice_id)
+            correct_texts.setdefault(question_id, set()).add(_normalize_text(choice_text))
+    return AnswerKey(
+        exam_id,
+        version,
+        {question_id: frozenset(ids) for question_id, ids in correct_choices.items()},
+        {question_id: frozenset(texts) for question_id, texts in correct_texts.items()},
+    )
+
+
+def get_answer_key(db: Session, exam_id: int):
+    # key ผูกกับ version ของ exam ใน exam_cache: choice เปลี่ยน -> version เปลี่ยน -> สร้าง key ใหม่
+    key = _keys.get((exam_id, exam_version(exam_id)))
+    if key is not None:
+        return key
+    key = build_answer_key(db, exam_id)
+    _keys.set((exam_id, key.version), key)
+    return key
+
+
+def get_stats():
+    return _keys.stats()
+
+
+ANSWER_CONSTRAINT = "uq_student_answer_question"
+_ANSWER_CONSTRAINT_RECHECK = 60  # วินาที: ยังไม่มี constraint ให้ตรวจใหม่เป็นระยะ (หลังรัน script แล้วใช้ได้เอง)
+_answer_constraint = {"ready": False, "checked_at": None}
+
+
+def has_answer_constraint(db: Session) -> bool:
+    """True once student_answers has a unique (student_exam_id, question_id) constraint or index.
+
+    create_all does not add constraints to an existing table, so ON CONFLICT is only
+    safe after scripts/add_student_answer_constraint.py has run.
+    """
+    if _answer_constraint["ready"]:
+        return True
+    checked_at = _answer_constraint["checked_at"]
+    if checked_at is not None and time.monotonic() - checked_at < _ANSWER_CONSTRAINT_RECHECK:
+        return False
+    _answer_constraint["ready"] = answer_constraint_exists(db.connection())
+    _answer_constraint["checked_at"] = time.monotonic()
+    return _answer_constraint["ready"]
+
+
+def answer_constraint_exists(connection) -> bool:
+    return has_unique(connection, models.StudentAnswer.__tablename__, ["student_exam_id", "question_id"])
+
+
+def superseded(answer):
+    """Condition: a newer row exists for the same (student_exam_id, question_id).
+
+    Only legacy duplicates (before the unique constraint) match; `answer` is
+    StudentAnswer or its table columns, so it works in ORM and Core queries.
+    """
+    newer = aliased(models.StudentAnswer)
+    written = func.coalesce(answer.updated_at, answer.created_at)
+    newer_written = func.coalesce(newer.updated_at, newer.created_at)
+    return exists().where(
+        newer.student_exam_id == answer.student_exam_id,
+        newer.question_id == answer.question_id,
+        or_(
+            newer_written > written,
+            and_(newer_written == written, newer.student_answer_id > answer.student_answer_id),
+            and_(written.is_(None), newer_written.isnot(None)),
+        ),
+    )
+
+
+def _update_or_insert(db: Session, student_exam_id: int, rows: list):
+    # ทางเดิมก่อนมี constraint: select แถวที่มีอยู่แล้ว update หรือ insert ทีละข้อ
+    existing = {}
+    for answer in (
+        db.query(models.StudentAnswer)
+        .filter(
+            models.StudentAnswer.student_exam_id == student_exam_id,
+            models.StudentAnswer.question_id.in_([row["question_id"] for row in rows]),
+        )
+        .order_by(models.StudentAnswer.updated_at, models.StudentAnswer.student_answer_id)
+    ):
+        existing[answer.question_id] = answer  # มีแถวซ้ำ (ก่อน dedupe): แก้แถวล่าสุด
+    for row in rows:
+        answer = existing.get(row["question_id"])
+        if answer is None:
+            db.add(models.StudentAnswer(**row))
+        elif answer.updated_at is None or answer.updated_at <= row["updated_at"]:
+            for field in ("choice_id", "answer_text", "is_correct", "updated_at"):
+                setattr(answer, field, row[field])
+
+
+def upsert_answers(db: Session, student_exam: models.StudentExam, answers, written_at: dict = None):
+    """Grade and upsert answers on (student_exam_id, question_id) in one statement.
+
+    Re-sending the same batch leaves the same rows behind, so client retries are
+    safe. `written_at` (question_id -> datetime) stamps delayed writes such as
+    autosave flushes; a row is never overwritten by an older write.
+    Returns the saved StudentAnswer rows in request order.
+    """
+    key = get_answer_key(db, student_exam.exam_id)
+    unknown = sorted({answer.question_id for answer in answers if answer.question_id not in key.correct_choices})
+    if unknown:
+        raise ValueError(f"Questions not in this exam: {unknown}")
+
+    # question ซ้ำใน batch เดียวกัน: ใช้คำตอบล่าสุด (ON CONFLICT แก้แถวเดิมซ้ำใน statement เดียวไม่ได้)
+    latest = {answer.question_id: answer for answer in answers}
+    if not latest:
+        return []
+    now = datetime.utcnow()
+    rows = [
+        {
+            "student_exam_id": student_exam.student_exam_id,
+            "question_id": answer.question_id,
+            "choice_id": answer.choice_id,
+            "answer_text": answer.answer_text,
+            "is_correct": key.grade(answer.question_id, answer.choice_id, answer.answer_text),
+            "created_at": now,
+            "updated_at": (written_at or {}).get(answer.question_id, now),
+        }
+        for answer in latest.values()
+    ]
+
+    stmt = upsert_insert(db, models.StudentAnswer)
+    if stmt is None or not has_answer_constraint(db):
+        # dialect อื่น หรือฐานข้อมูลเดิมที่ยังไม่ได้เพิ่ม constraint: ON CONFLICT ใช้ไม่ได้
+        _update_or_insert(db, student_exam.student_exam_id, rows)
+    else:
+        db.execute(
+            stmt.values(rows).on_conflict_do_update(
+                index_elements=["student_exam_id", "question_id"],
+                set_={
+                    "choice_id": stmt.excluded.choice_id,
+                    "answer_text": stmt.excluded.answer_text,
+                    "is_correct": stmt.excluded.is_correct,
+                    "updated_at": stmt.excluded.updated_at,
+                },
+                where=models.StudentAnswer.updated_at <= stmt.excluded.updated_at,
+            )
+        )
+    db.commit()
+
+    saved = {
+        row.question_id: row
+        for row in db.query(models.StudentAnswer)
+        .filter(
+            models.StudentAnswer.student_exam_id == student_exam.student_exam_id,
+            models.StudentAnswer.question_id.in_(list(latest)),
+        )
+        .order_by(models.StudentAnswer.updated_at, models.StudentAnswer.student_answer_id)
+    }
+    return [saved[question_id] for question_id in latest]
+
+
+def score_student_exam(db: Session, student_exam: models.StudentExam, key: AnswerKey):
+    # คะแนนจาก aggregate query เดียว (ร้อยละของข้อที่ถูก) นับเฉพาะคำตอบล่าสุดของแต่ละข้อ
+    correct = db.execute(
+        select(func.count()).where(
+            models.StudentAnswer.student_exam_id == student_exam.student_exam_id,
+            models.StudentAnswer.is_correct.is_(True),
+            ~superseded(models.StudentAnswer),
+        )
+    ).scalar_one()
+    if not key.question_count:
+        return None
+    return round(correct * 100.0 / key.question_count, 2)
+
+
+def finish_student_exam(db: Session, student_exam: models.StudentExam) -> bool:
+    """Claim the finish and score the attempt; False if another request already finished it.
+
+    The claim is a conditional UPDATE, so of two concurrent finish requests only
+    one gets the row (the other waits on the row lock, then matches nothing).
+    Does not commit: the caller updates the exam summary in the same transaction.
+    """
+    finished_at = datetime.utcnow()
+    claimed = db.execute(
+        update(models.StudentExam)
+        .where(
+            models.StudentExam.student_exam_id == student_exam.student_exam_id,
+            or_(models.StudentExam.status.is_(None), models.StudentExam.status != "completed"),
+        )
+        .values(status="completed", finished_at=finished_at)
+    ).rowcount
+    if not claimed:
+        return False
+    key = get_answer_key(db, student_exam.exam_id)
+    student_exam.score = score_student_exam(db, student_exam, key)
+    db.flush()
+    return True
+
+
+def regrade_exam(db: Session, exam_id: int, batch_size: int = None):
+    # แก้เฉลยแล้วตรวจใหม่ทั้ง exam: ทำเป็น batch ของ student_exam เพื่อไม่ให้ transaction ใหญ่เกินไป
+    batch_size = batch_size or settings.GRADING_BATCH_SIZE
+    bump_exam_version(exam_id)
+    key = get_answer_key(db, exam_id)
+
+    answer = models.StudentAnswer.__table__
+    is_correct_choice = exists().where(
+        models.Choice.choice_id == answer.c.choice_id,
+        models.Choice.question_id == answer.c.question_id,
+        models.Choice.is_correct.is_(True),
+    )
+    correct_count = (
+        select(func.count())
+        .where(
+            answer.c.student_exam_id == models.StudentExam.student_exam_id,
+            answer.c.is_correct.is_(True),
+            ~superseded(answer.c),
+        )
+        .scalar_subquery()
+    )
+
+    stats = {"student_exams": 0, "answers": 0, "batches": 0}
+    last_id = 0
+    while True:
+        ids = db.execute(
+            select(models.StudentExam.student_exam_id)
+            .where(models.StudentExam.exam_id == exam_id, models.StudentExam.student_exam_id > last_id)
+            .order_by(models.StudentExam.student_exam_id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        result = db.execute(
+            update(answer)
+            .where(answer.c.student_exam_id.in_(ids), answer.c.choice_id.isnot(None))
+            .values(is_correct=case((is_correct_choice, True), else_=False))
+        )
+        if key.question_count:
+            db.execute(
+                update(models.StudentExam)
+                .where(models.StudentExam.student_exam_id.in_(ids), models.StudentExam.status == "completed")
+                .values(score=func.round(cast(correct_count, Numeric(10, 4)) * 100 / key.question_count, 2))
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+        stats["student_exams"] += len(ids)
+        stats["answers"] += result.rowcount
+        stats["batches"] += 1
+        last_id = ids[-1]
+    return stats
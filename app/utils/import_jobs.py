@@ -0,0 +1,252 @@
+# app/utils/import_jobs.py
+import logging
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models.models import ImportJob
+from app.utils.exam_import import ExamImporter, iter_upload_chunks, used_choice_columns
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMPORT_JOB_WORKERS, thread_name_prefix="exam-import")
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        # job ที่ยังไม่เสร็จจะถูก resume ตอน start ครั้งถัดไป
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def submit_import_job(db: Session, file: UploadFile, user_id=None):
+    if not (file.filename.endswith('.xlsx') or file.filename.endswith('.csv')):
+        raise HTTPException(status_code=400, detail="Only .xlsx or .csv files can be imported in background")
+    # เก็บไฟล์ลง disk ก่อน เพื่อให้ job ทำงานต่อได้แม้ worker restart
+    os.makedirs(settings.IMPORT_UPLOAD_DIR, exist_ok=True)
+    ext = os.path.splitext(file.filename)[1]
+    file_path = os.path.join(settings.IMPORT_UPLOAD_DIR, f"{uuid.uuid4().hex}{ext}")
+    with open(file_path, "wb") as out:
+        shutil.copyfileobj(file.file, out)
+
+    job = ImportJob(filename=file.filename, file_path=file_path, status="queued", created_by=user_id)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    get_executor().submit(run_import_job, job.job_id)
+    return job
+
+
+def _requeue_stale(db: Session, *criteria):
+    # compare-and-set: ส่งกลับเข้าคิวเฉพาะ job ที่ heartbeat ขาดไปนานเกินกำหนดจริง ๆ
+    # worker ที่ยังทำงานอยู่จะต่ออายุ heartbeat_at เสมอ จึงไม่ถูกแย่ง job
+    stale_before = datetime.utcnow() - timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS)
+    result = db.execute(
+        update(ImportJob)
+        .where(ImportJob.status == "running", ImportJob.heartbeat_at < stale_before, *criteria)
+        .values(status="queued", lease_id=None)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def get_import_job(db: Session, job_id: int):
+    job = db.query(ImportJob).filter(ImportJob.job_id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    if job.status == "running" and _requeue_stale(db, ImportJob.job_id == job_id):
+        db.refresh(job)
+        get_executor().submit(run_import_job, job.job_id)
+    return job
+
+
+def cancel_import_job(db: Session, job_id: int):
+    job = db.query(ImportJob).filter(ImportJob.job_id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    if job.status == "queued":
+        job.status = "cancelled"
+        job.finished_at = datetime.utcnow()
+    elif job.status == "running":
+        # worker จะเช็ค flag นี้ระหว่าง chunk แล้วหยุดเอง
+        job.cancel_requested = True
+    else:
+        raise HTTPException(status_code=400, detail=f"Import job is already {job.status}")
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def _claim_job(db: Session, job_id: int):
+    # claim แบบ atomic กันไม่ให้ 2 worker รัน job เดียวกัน คืน lease token ของ worker นี้
+    lease_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    result = db.execute(
+        update(ImportJob)
+        .where(ImportJob.job_id == job_id, ImportJob.status == "queued")
+        .values(status="running", lease_id=lease_id, heartbeat_at=now, started_at=now, updated_at=now)
+    )
+    db.commit()
+    return lease_id if result.rowcount == 1 else None
+
+
+def _owned(job_id: int, lease_id: str):
+    return update(ImportJob).where(ImportJob.job_id == job_id, ImportJob.lease_id == lease_id)
+
+
+def _save_progress(db: Session, job_id: int, lease_id: str, counts):
+    """Write chunk progress only while this worker still holds the lease.
+
+    Returns the job's cancel flag, or None when the lease was lost (the job was
+    requeued and another worker owns it now).
+    """
+    return db.execute(
+        _owned(job_id, lease_id)
+        .values(
+            rows_done=counts["rows"],
+            rows_skipped=counts["duplicates_skipped"],
+            rows_invalid=counts["invalid_skipped"],
+            questions_inserted=counts["questions_inserted"],
+            heartbeat_at=datetime.utcnow(),
+        )
+        .returning(ImportJob.cancel_requested)
+    ).scalar()
+
+
+class _Heartbeat:
+    """Renews the job lease from a side thread, so a long chunk is not mistaken for a dead worker."""
+
+    def __init__(self, job_id: int, lease_id: str):
+        self.job_id = job_id
+        self.lease_id = lease_id
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"exam-import-heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(settings.IMPORT_JOB_HEARTBEAT_SECONDS):
+            db = SessionLocal()
+            try:
+                result = db.execute(_owned(self.job_id, self.lease_id).values(heartbeat_at=datetime.utcnow()))
+                db.commit()
+                if result.rowcount == 0:
+                    return
+            except Exception:
+                logger.exception("Import job %s heartbeat failed", self.job_id)
+            finally:
+                db.close()
+
+
+def _finish(db: Session, job: ImportJob, lease_id: str, status: str, error=None):
+    result = db.execute(
+        _owned(job.job_id, lease_id)
+        .values(status=status, error=error, finished_at=datetime.utcnow(), lease_id=None)
+    )
+    db.commit()
+    if result.rowcount == 0:
+        # job ถูกส่งกลับเข้าคิวไปแล้ว worker ที่ถือ lease ใหม่จะจัดการไฟล์เอง
+        return
+    # ทุกสถานะสุดท้าย (รวม failed) ไม่ถูก resume อีก: ลบไฟล์ที่อัปโหลดทิ้ง
+    try:
+        os.remove(job.file_path)
+    except OSError:
+        pass
+
+
+def run_import_job(job_id: int):
+    db = SessionLocal()
+    try:
+        lease_id = _claim_job(db, job_id)
+        if lease_id is None:
+            return
+        job = db.query(ImportJob).filter(ImportJob.job_id == job_id).first()
+        with _Heartbeat(job_id, lease_id):
+            _run_claimed(db, job, lease_id)
+    finally:
+        db.close()
+
+
+def _run_claimed(db: Session, job: ImportJob, lease_id: str):
+    chunk_size = settings.EXAM_IMPORT_CHUNK_SIZE
+    # progress ถูก commit พร้อมข้อมูลของแต่ละ chunk จึงเป็น checkpoint ที่แม่นยำ:
+    # รันซ้ำแล้วข้ามแถวที่ import ไปแล้ว และนับต่อจากค่าเดิม
+    resume_from = job.rows_done or 0
+    try:
+        with open(job.file_path, "rb") as fileobj:
+            # รอบแรกหา column choice ที่ใช้จริงทั้งไฟล์ ให้เลขตัวเลือกตรงกับการ import แบบไม่ stream
+            choice_cols = used_choice_columns(iter_upload_chunks(job.filename, fileobj, chunk_size=chunk_size))
+            fileobj.seek(0)
+            importer = ExamImporter(db, choice_cols, chunk_size=chunk_size)
+            importer.counts.update(
+                rows=resume_from,
+                duplicates_skipped=job.rows_skipped or 0,
+                invalid_skipped=job.rows_invalid or 0,
+                questions_inserted=job.questions_inserted or 0,
+            )
+            for chunk in iter_upload_chunks(job.filename, fileobj, chunk_size=chunk_size):
+                if resume_from:
+                    skipped = min(resume_from, len(chunk))
+                    resume_from -= skipped
+                    chunk = chunk.iloc[skipped:]
+                    if chunk.empty:
+                        continue
+                importer.import_frame(chunk)
+                cancel_requested = _save_progress(db, job.job_id, lease_id, importer.counts)
+                if cancel_requested is None:
+                    # lease หลุด: ทิ้ง chunk นี้ ไม่ให้ 2 worker insert โจทย์ชุดเดียวกัน
+                    db.rollback()
+                    logger.warning("Import job %s was requeued while running; stopping this worker", job.job_id)
+                    return
+                # commit ข้อมูล chunk นี้พร้อม progress ใน transaction เดียว
+                importer.commit()
+                if cancel_requested:
+                    _finish(db, job, lease_id, "cancelled")
+                    return
+    except HTTPException as e:
+        db.rollback()
+        _finish(db, job, lease_id, "failed", str(e.detail))
+        return
+    except Exception as e:
+        logger.exception("Import job %s failed", job.job_id)
+        db.rollback()
+        _finish(db, job, lease_id, "failed", str(e))
+        return
+    _finish(db, job, lease_id, "completed")
+
+
+def resume_pending_jobs():
+    # เรียกตอน startup: ส่ง job ที่ค้างอยู่ (รวมถึง job ที่ worker ตายกลางทาง) กลับเข้าคิว
+    # job ที่รันต่อจะเริ่มจาก checkpoint (rows_done) ของ chunk สุดท้ายที่ commit แล้ว
+    db = SessionLocal()
+    try:
+        _requeue_stale(db)
+        job_ids = [job_id for (job_id,) in db.query(ImportJob.job_id).filter(ImportJob.status == "queued").all()]
+    finally:
+        db.close()
+    for job_id in job_ids:
+        get_executor().submit(run_import_job, job_id)
+    return job_ids
@@ -0,0 +1,362 @@
+# app/utils/invoice_scheduler.py
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import and_, func, or_, select, text, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database import SessionLocal, engine
+from app.models.models import Invoice, InvoiceReminder, Payment, Student, User
+from app.utils.line_broadcast import get_token_bucket
+from app.utils.line_utils import asend_line_message
+from app.utils.reconciliation import counts_as_paid
+from app.utils.sql import upsert_insert
+
+logger = logging.getLogger(__name__)
+
+REMINDER_TEXT = {
+    "due_soon": "แจ้งเตือน: ใบแจ้งหนี้ #{invoice_id} ยอด {amount:,.2f} บาท ครบกำหนดชำระวันที่ {due_date:%d/%m/%Y}",
+    "overdue": "ใบแจ้งหนี้ #{invoice_id} ยอด {amount:,.2f} บาท เลยกำหนดชำระ (วันที่ {due_date:%d/%m/%Y}) กรุณาชำระโดยเร็ว",
+}
+
+
+UNPAID_STATUSES = ("pending", "partial")  # ก่อนเลยกำหนด: ใบที่จ่ายมาบางส่วนก็ต้องถูกเตือนและกลายเป็น overdue เหมือนกัน
+
+
+def _outstanding():
+    # ยอดที่ยังค้าง (ใบที่จ่ายมาบางส่วนไม่ควรถูกทวงเต็มจำนวน)
+    paid = (
+        select(func.coalesce(func.sum(Payment.amount), 0.0))
+        .where(Payment.invoice_id == Invoice.invoice_id, counts_as_paid())
+        .scalar_subquery()
+    )
+    return (Invoice.total_amount - paid).label("outstanding")
+
+
+def _mark_overdue(db: Session, now: datetime, dry_run: bool, report: dict):
+    # keyset batch บน index (status, due_date): pending/partial ที่เลยกำหนด -> overdue
+    last_id = 0
+    while True:
+        ids = db.execute(
+            select(Invoice.invoice_id)
+            .where(Invoice.status.in_(UNPAID_STATUSES), Invoice.due_date < now, Invoice.invoice_id > last_id)
+            .order_by(Invoice.invoice_id)
+            .limit(settings.INVOICE_SWEEP_BATCH_SIZE)
+        ).scalars().all()
+        if not ids:
+            return
+        if not dry_run:
+            db.execute(
+                update(Invoice)
+                .where(Invoice.invoice_id.in_(ids), Invoice.status.in_(UNPAID_STATUSES))
+                .values(status="overdue")
+            )
+            db.commit()
+        report["overdue_marked"] += len(ids)
+        report["batches"] += 1
+        last_id = ids[-1]
+
+
+def _retryable(now: datetime):
+    # reminder ที่ claim ใหม่ได้: failed ที่ถึงเวลาลองใหม่ หรือ queued ที่ worker เดิมหยุด heartbeat ไปแล้ว
+    return or_(
+        and_(
+            InvoiceReminder.status == "failed",
+            InvoiceReminder.attempts < settings.INVOICE_REMINDER_MAX_ATTEMPTS,
+            InvoiceReminder.next_attempt_at <= now,
+        ),
+        and_(
+            InvoiceReminder.status == "queued",
+            InvoiceReminder.heartbeat_at < now - timedelta(seconds=settings.INVOICE_REMINDER_STALE_SECONDS),
+        ),
+    )
+
+
+def _claim_reminders(db: Session, kind: str, condition, now: datetime, dry_run: bool, report: dict):
+    """Select invoices needing a `kind` reminder and claim them with a unique reminder row."""
+    jobs = []
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(Invoice.invoice_id, _outstanding(), Invoice.due_date, User.line_user_id, InvoiceReminder.reminder_id)
+            .join(Student, Student.student_id == Invoice.student_id)
+            # ส่งเฉพาะนักเรียนที่ line_id ตรงกับ userId ที่ยืนยันแล้วจาก LINE Login (เหมือน line_broadcast)
+            .join(User, User.line_user_id == Student.line_id)
+            .outerjoin(InvoiceReminder, and_(
+                InvoiceReminder.invoice_id == Invoice.invoice_id,
+                InvoiceReminder.kind == kind,
+            ))
+            .where(condition, or_(InvoiceReminder.reminder_id.is_(None), _retryable(now)), Invoice.invoice_id > last_id)
+            .order_by(Invoice.invoice_id)
+            .limit(settings.INVOICE_SWEEP_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return jobs
+        last_id = rows[-1].invoice_id
+        report["batches"] += 1
+        if dry_run:
+            report[f"{kind}_reminders"] += len(rows)
+            continue
+        returning = (InvoiceReminder.invoice_id, InvoiceReminder.reminder_id, InvoiceReminder.attempts)
+        claimed = {}
+        new = [row for row in rows if row.reminder_id is None]
+        if new:
+            # ON CONFLICT DO NOTHING + RETURNING: ได้เฉพาะแถวที่เรา claim ได้จริง (กันส่งซ้ำถ้ามีคน sweep พร้อมกัน)
+            stmt = upsert_insert(db, InvoiceReminder)
+            for claim in db.execute(
+                stmt.values([
+                    {"invoice_id": row.invoice_id, "kind": kind, "status": "queued", "attempts": 1, "heartbeat_at": now, "created_at": now}
+                    for row in new
+                ]).on_conflict_do_nothing().returning(*returning)
+            ):
+                claimed[claim.invoice_id] = claim
+        retry_ids = [row.reminder_id for row in rows if row.reminder_id is not None]
+        if retry_ids:
+            # compare-and-set: เงื่อนไข retry ต้องยังจริงตอน update ไม่อย่างนั้นอีก sweep claim ไปแล้ว
+            for claim in db.execute(
+                update(InvoiceReminder)
+                .where(InvoiceReminder.reminder_id.in_(retry_ids), _retryable(now))
+                .values(status="queued", attempts=InvoiceReminder.attempts + 1, heartbeat_at=now, next_attempt_at=None)
+                .returning(*returning)
+                .execution_options(synchronize_session=False)
+            ):
+                claimed[claim.invoice_id] = claim
+        db.commit()
+        for row in rows:
+            claim = claimed.get(row.invoice_id)
+            if claim is not None:
+                jobs.append({
+                    "reminder_id": claim.reminder_id,
+                    "attempts": claim.attempts,
+                    "invoice_id": row.invoice_id,
+                    "kind": kind,
+                    "line_user_id": row.line_user_id,
+                    "message": REMINDER_TEXT[kind].format(
+                        invoice_id=row.invoice_id, amount=row.outstanding or 0.0, due_date=row.due_date
+                    ),
+                })
+        report[f"{kind}_reminders"] += len(claimed)
+
+
+def sweep(dry_run: bool = False, now: datetime = None):
+    """Transition overdue invoices and claim reminders. Returns (report, reminder jobs)."""
+    now = now or datetime.utcnow()
+    report = {"dry_run": dry_run, "overdue_marked": 0, "due_soon_reminders": 0, "overdue_reminders": 0, "batches": 0}
+    db = SessionLocal()
+    try:
+        _mark_overdue(db, now, dry_run, report)
+        due_soon = and_(
+            Invoice.status.in_(UNPAID_STATUSES),
+            Invoice.due_date >= now,
+            Invoice.due_date < now + timedelta(days=settings.INVOICE_REMINDER_DAYS_BEFORE),
+        )
+        # dry run ไม่ได้เปลี่ยนสถานะจริง จึงนับ pending/partial ที่เลยกำหนดเป็น overdue ด้วย
+        overdue = and_(Invoice.status.in_(UNPAID_STATUSES + ("overdue",) if dry_run else ("overdue",)), Invoice.due_date < now)
+        jobs = _claim_reminders(db, "due_soon", due_soon, now, dry_run, report)
+        jobs += _claim_reminders(db, "overdue", overdue, now, dry_run, report)
+        return report, jobs
+    finally:
+        db.close()
+
+
+def _touch_claims(reminder_ids):
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(InvoiceReminder)
+            .where(InvoiceReminder.reminder_id.in_(reminder_ids), InvoiceReminder.status == "queued")
+            .values(heartbeat_at=datetime.utcnow())
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _retry_at(now: datetime, attempts: int):
+    # exponential backoff: 1x, 2x, 4x, ... ของ INVOICE_REMINDER_RETRY_SECONDS (มีเพดาน)
+    delay = settings.INVOICE_REMINDER_RETRY_SECONDS * 2 ** max(attempts - 1, 0)
+    return now + timedelta(seconds=min(delay, settings.INVOICE_REMINDER_MAX_RETRY_SECONDS))
+
+
+def _record_results(jobs, results):
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        sent = []
+        for job in jobs:
+            error = results[job["reminder_id"]]
+            if error:
+                db.execute(
+                    update(InvoiceReminder)
+                    .where(InvoiceReminder.reminder_id == job["reminder_id"])
+                    .values(status="failed", error=error, next_attempt_at=_retry_at(now, job["attempts"]))
+                )
+            else:
+                sent.append(job["reminder_id"])
+        if sent:
+            db.execute(
+                update(InvoiceReminder)
+                .where(InvoiceReminder.reminder_id.in_(sent))
+                .values(status="sent", sent_at=now, error=None)
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+class InvoiceScheduler:
+    """Periodic invoice sweep that runs in exactly one worker (the advisory-lock holder)."""
+
+    def __init__(self):
+        self._task = None
+        self._lock_connection = None
+        self.is_leader = False
+        self.metrics = {
+            "sweeps": 0,
+            "sweep_errors": 0,
+            "last_sweep_ms": 0.0,
+            "max_sweep_ms": 0.0,
+            "total_sweep_ms": 0.0,
+            "reminders_sent": 0,
+            "reminders_failed": 0,
+            "last_sweep_at": None,
+            "last_report": None,
+        }
+
+    # ----------------- leader election -----------------
+
+    def _acquire_leadership(self):
+        if engine.dialect.name != "postgresql":
+            # SQLite/dev: มี process เดียว ถือว่าเป็น leader
+            self.is_leader = True
+            return True
+        if self._lock_connection is not None:
+            try:
+                self._lock_connection.execute(text("SELECT 1"))
+                self._lock_connection.commit()
+                return True
+            except Exception:
+                # connection หลุด = lock หลุดไปด้วย
+                logger.warning("Invoice scheduler lost its advisory lock connection")
+                self._release_leadership()
+        connection = engine.connect()
+        acquired = connection.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": settings.INVOICE_SCHEDULER_LOCK_KEY}
+        ).scalar()
+        connection.commit()  # session-level lock อยู่ต่อหลัง commit ไม่ค้าง idle in transaction
+        if acquired:
+            self._lock_connection = connection
+            self.is_leader = True
+            logger.info("Invoice scheduler leadership acquired (advisory lock %s)", settings.INVOICE_SCHEDULER_LOCK_KEY)
+        else:
+            connection.close()
+            self.is_leader = False
+        return self.is_leader
+
+    def _release_leadership(self):
+        connection, self._lock_connection = self._lock_connection, None
+        self.is_leader = False
+        if connection is None:
+            return
+        try:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": settings.INVOICE_SCHEDULER_LOCK_KEY})
+            connection.commit()
+        except Exception:
+            pass
+        finally:
+            connection.close()
+
+    # ----------------- sweep -----------------
+
+    async def _send(self, jobs):
+        semaphore = asyncio.Semaphore(settings.LINE_BROADCAST_CONCURRENCY)
+        results = {}
+
+        async def send(job):
+            async with semaphore:
+                await get_token_bucket().acquire()
+                try:
+                    status_code, body = await asend_line_message(job["line_user_id"], job["message"])
+                    error = None if status_code == 200 else f"{status_code} {body[:500]}"
+                except httpx.HTTPError as e:
+                    error = str(e) or e.__class__.__name__
+            results[job["reminder_id"]] = error
+            self.metrics["reminders_failed" if error else "reminders_sent"] += 1
+
+        heartbeat = asyncio.create_task(self._heartbeat([job["reminder_id"] for job in jobs]))
+        try:
+            await asyncio.gather(*(send(job) for job in jobs))
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+        await asyncio.to_thread(_record_results, jobs, results)
+
+    async def _heartbeat(self, reminder_ids):
+        # ต่ออายุ claim ระหว่างส่ง: sweep อื่น (รวมถึงสั่งผ่าน API) จะไม่ claim แถวที่ยังส่งอยู่ซ้ำ
+        while True:
+            await asyncio.sleep(settings.INVOICE_REMINDER_HEARTBEAT_SECONDS)
+            try:
+                await asyncio.to_thread(_touch_claims, reminder_ids)
+            except Exception:
+                logger.exception("Invoice reminder heartbeat failed")
+
+    async def run_once(self, dry_run: bool = None):
+        dry_run = settings.INVOICE_SCHEDULER_DRY_RUN if dry_run is None else dry_run
+        started = time.perf_counter()
+        try:
+            report, jobs = await asyncio.to_thread(sweep, dry_run)
+            swept = time.perf_counter()
+            if jobs:
+                await self._send(jobs)
+        except Exception:
+            self.metrics["sweep_errors"] += 1
+            raise
+        elapsed_ms = round((swept - started) * 1000, 2)
+        report["duration_ms"] = elapsed_ms
+        report["send_ms"] = round((time.perf_counter() - swept) * 1000, 2)
+        self.metrics["sweeps"] += 1
+        self.metrics["last_sweep_ms"] = elapsed_ms
+        self.metrics["max_sweep_ms"] = max(self.metrics["max_sweep_ms"], elapsed_ms)
+        self.metrics["total_sweep_ms"] += elapsed_ms
+        self.metrics["last_sweep_at"] = datetime.utcnow().isoformat()
+        self.metrics["last_report"] = report
+        return report
+
+    async def _run(self, interval: float):
+        while True:
+            try:
+                if await asyncio.to_thread(self._acquire_leadership):
+                    await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Invoice sweep failed")
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self._release_leadership)
+
+    def get_metrics(self):
+        sweeps = self.metrics["sweeps"]
+        return {
+            **self.metrics,
+            "avg_sweep_ms": round(self.metrics["total_sweep_ms"] / sweeps, 2) if sweeps else 0.0,
+            "is_leader": self.is_leader,
+            "running": self._task is not None,
+            "dry_run": settings.INVOICE_SCHEDULER_DRY_RUN,
+        }
+
+
+scheduler = InvoiceScheduler()
@@ -0,0 +1,326 @@
+# app/utils/line_broadcast.py
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from fastapi import HTTPException
+from sqlalchemy import func, insert, or_, and_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models.models import Broadcast, BroadcastRecipient, Enrollment, Student, User
+from app.utils.line_client import async_line_client, delivered
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int = 1):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+_bucket = None
+_tasks = {}  # broadcast_id -> asyncio.Task
+
+metrics = {
+    "broadcasts_run": 0,
+    "batches_sent": 0,
+    "batches_failed": 0,
+    "recipients_sent": 0,
+    "recipients_failed": 0,
+    "in_flight_batches": 0,
+    "last_run": None,
+}
+
+
+def get_token_bucket():
+    # rate limit เป็นของ channel จึงใช้ bucket เดียวร่วมกันทุก broadcast
+    global _bucket
+    if _bucket is None:
+        _bucket = TokenBucket(settings.LINE_BROADCAST_RATE_PER_SECOND, settings.LINE_BROADCAST_BURST)
+    return _bucket
+
+
+def get_metrics():
+    return dict(metrics)
+
+
+# ----------------- สร้าง broadcast และ resolve ผู้รับ -----------------
+
+def resolve_recipients(db: Session, course_ids=(), enrollment_ids=(), user_ids=(), line_user_ids=()):
+    recipients = list(line_user_ids)
+    # student.line_id เป็นช่องกรอกอิสระ: ส่งได้เฉพาะค่าที่ตรงกับ userId ที่ยืนยันแล้วจาก LINE Login (user.line_user_id)
+    if course_ids:
+        recipients += db.execute(
+            select(User.line_user_id)
+            .select_from(Student)
+            .join(User, User.line_user_id == Student.line_id)
+            .join(Enrollment, Enrollment.student_id == Student.student_id)
+            .where(Enrollment.course_id.in_(course_ids), Enrollment.status == "active")
+        ).scalars().all()
+    if enrollment_ids:
+        recipients += db.execute(
+            select(User.line_user_id)
+            .select_from(Student)
+            .join(User, User.line_user_id == Student.line_id)
+            .join(Enrollment, Enrollment.student_id == Student.student_id)
+            .where(Enrollment.enrollment_id.in_(enrollment_ids))
+        ).scalars().all()
+    if user_ids:
+        recipients += db.execute(
+            select(User.line_user_id).where(User.user_id.in_(user_ids), User.line_user_id.isnot(None))
+        ).scalars().all()
+    # ตัดค่าว่าง/ซ้ำ โดยคงลำดับเดิม
+    return list(dict.fromkeys(r for r in recipients if r))
+
+
+def create_broadcast(db: Session, data, user_id=None):
+    recipients = resolve_recipients(
+        db, data.course_ids, data.enrollment_ids, data.user_ids, data.line_user_ids
+    )
+    if not recipients:
+        raise HTTPException(status_code=400, detail="No recipients with a LINE id found")
+    broadcast = Broadcast(
+        message=data.message, status="pending", total_recipients=len(recipients), created_by=user_id
+    )
+    db.add(broadcast)
+    db.flush()
+    batch_size = settings.LINE_MULTICAST_BATCH_SIZE
+    db.execute(insert(BroadcastRecipient), [
+        {
+            "broadcast_id": broadcast.broadcast_id,
+            "line_user_id": line_user_id,
+            "batch_no": i // batch_size,
+            "status": "pending",
+        }
+        for i, line_user_id in enumerate(recipients)
+    ])
+    db.commit()
+    db.refresh(broadcast)
+    return broadcast
+
+
+def retry_failed_recipients(db: Session, broadcast_id: int):
+    broadcast = db.query(Broadcast).filter(Broadcast.broadcast_id == broadcast_id).first()
+    if not broadcast:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    if broadcast.status == "running":
+        raise HTTPException(status_code=400, detail="Broadcast is still running")
+    db.execute(
+        update(BroadcastRecipient)
+        .where(BroadcastRecipient.broadcast_id == broadcast_id, BroadcastRecipient.status == "failed")
+        .values(status="pending", error=None)
+    )
+    broadcast.status = "pending"
+    db.commit()
+    db.refresh(broadcast)
+    return broadcast
+
+
+# ----------------- ส่งข้อความ (รันบน event loop) -----------------
+
+def _claim_broadcast(broadcast_id: int):
+    # claim แบบ atomic; broadcast ที่ค้างสถานะ running นานเกินกำหนด ถือว่า worker ตายไปแล้ว
+    stale_before = datetime.utcnow() - timedelta(seconds=settings.LINE_BROADCAST_STALE_SECONDS)
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        result = db.execute(
+            update(Broadcast)
+            .where(
+                Broadcast.broadcast_id == broadcast_id,
+                or_(
+                    Broadcast.status == "pending",
+                    and_(Broadcast.status == "running", Broadcast.updated_at < stale_before),
+                ),
+            )
+            .values(status="running", started_at=func.coalesce(Broadcast.started_at, now), updated_at=now)
+        )
+        db.commit()
+        if result.rowcount != 1:
+            return None
+        message = db.execute(
+            select(Broadcast.message).where(Broadcast.broadcast_id == broadcast_id)
+        ).scalar_one()
+        rows = db.execute(
+            select(BroadcastRecipient.batch_no, BroadcastRecipient.line_user_id)
+            .where(BroadcastRecipient.broadcast_id == broadcast_id, BroadcastRecipient.status == "pending")
+            .order_by(BroadcastRecipient.batch_no)
+        ).all()
+    finally:
+        db.close()
+    batches = {}
+    for batch_no, line_user_id in rows:
+        batches.setdefault(batch_no, []).append(line_user_id)
+    return message, batches
+
+
+def _record_batch(broadcast_id: int, batch_no: int, count: int, error=None):
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        db.execute(
+            update(BroadcastRecipient)
+            .where(
+                BroadcastRecipient.broadcast_id == broadcast_id,
+                BroadcastRecipient.batch_no == batch_no,
+                BroadcastRecipient.status == "pending",
+            )
+            .values(status="failed" if error else "sent", error=error, sent_at=None if error else now)
+        )
+        counter = Broadcast.failed_count if error else Broadcast.sent_count
+        db.execute(
+            update(Broadcast)
+            .where(Broadcast.broadcast_id == broadcast_id)
+            .values({counter: counter + count, Broadcast.updated_at: now})
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _finish_broadcast(broadcast_id: int):
+    db = SessionLocal()
+    try:
+        counts = dict(db.execute(
+            select(BroadcastRecipient.status, func.count())
+            .where(BroadcastRecipient.broadcast_id == broadcast_id)
+            .group_by(BroadcastRecipient.status)
+        ).all())
+        sent, failed = counts.get("sent", 0), counts.get("failed", 0)
+        db.execute(
+            update(Broadcast)
+            .where(Broadcast.broadcast_id == broadcast_id)
+            .values(
+                status="failed" if failed and not sent else "completed",
+                sent_count=sent,
+                failed_count=failed,
+                finished_at=datetime.utcnow(),
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _send_batch(broadcast_id, batch_no, line_user_ids, messages, semaphore):
+    async with semaphore:
+        await get_token_bucket().acquire()
+        metrics["in_flight_batches"] += 1
+        try:
+            response = await async_line_client.multicast(line_user_ids, messages)
+            error = None if delivered(response) else f"{response.status_code} {response.text[:500]}"
+        except httpx.HTTPError as e:
+            error = str(e) or e.__class__.__name__
+        finally:
+            metrics["in_flight_batches"] -= 1
+    if error:
+        logger.warning("Broadcast %s batch %s failed: %s", broadcast_id, batch_no, error)
+        metrics["batches_failed"] += 1
+        metrics["recipients_failed"] += len(line_user_ids)
+    else:
+        metrics["batches_sent"] += 1
+        metrics["recipients_sent"] += len(line_user_ids)
+    await asyncio.to_thread(_record_batch, broadcast_id, batch_no, len(line_user_ids), error)
+
+
+async def run_broadcast(broadcast_id: int):
+    claimed = await asyncio.to_thread(_claim_broadcast, broadcast_id)
+    if claimed is None:
+        return
+    message, batches = claimed
+    messages = [{"type": "text", "text": message}]
+    semaphore = asyncio.Semaphore(settings.LINE_BROADCAST_CONCURRENCY)
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _send_batch(broadcast_id, batch_no, line_user_ids, messages, semaphore)
+        for batch_no, line_user_ids in batches.items()
+    ))
+    await asyncio.to_thread(_finish_broadcast, broadcast_id)
+    elapsed = time.perf_counter() - started
+    recipients = sum(len(ids) for ids in batches.values())
+    metrics["broadcasts_run"] += 1
+    metrics["last_run"] = {
+        "broadcast_id": broadcast_id,
+        "recipients": recipients,
+        "batches": len(batches),
+        "seconds": round(elapsed, 3),
+        "recipients_per_second": round(recipients / elapsed, 1) if elapsed else None,
+    }
+
+
+def schedule_broadcast(broadcast_id: int):
+    # ต้องเรียกจากใน event loop
+    if broadcast_id in _tasks:
+        return _tasks[broadcast_id]
+    task = asyncio.get_running_loop().create_task(run_broadcast(broadcast_id))
+    _tasks[broadcast_id] = task
+    task.add_done_callback(lambda _: _tasks.pop(broadcast_id, None))
+    return task
+
+
+def _pending_broadcast_ids():
+    stale_before = datetime.utcnow() - timedelta(seconds=settings.LINE_BROADCAST_STALE_SECONDS)
+    db = SessionLocal()
+    try:
+        return db.execute(
+            select(Broadcast.broadcast_id).where(or_(
+                Broadcast.status == "pending",
+                and_(Broadcast.status == "running", Broadcast.updated_at < stale_before),
+            ))
+        ).scalars().all()
+    finally:
+        db.close()
+
+
+async def resume_broadcasts():
+    # เรียกตอน startup: ส่งต่อ broadcast ที่ค้างอยู่ เฉพาะผู้รับที่ยัง pending
+    broadcast_ids = await asyncio.to_thread(_pending_broadcast_ids)
+    for broadcast_id in broadcast_ids:
+        schedule_broadcast(broadcast_id)
+    return broadcast_ids
+
+
+def _release_broadcasts(broadcast_ids):
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(Broadcast)
+            .where(Broadcast.broadcast_id.in_(broadcast_ids), Broadcast.status == "running")
+            .values(status="pending")
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+async def cancel_running_broadcasts():
+    # ตอน shutdown: ยกเลิก task ที่ค้าง แล้วคืนสถานะเป็น pending
+    # ผู้รับที่ยังไม่ได้ส่งจะถูกส่งต่อเมื่อ start รอบถัดไป
+    tasks = dict(_tasks)
+    if not tasks:
+        return
+    for task in tasks.values():
+        task.cancel()
+    await asyncio.gather(*tasks.values(), return_exceptions=True)
+    await asyncio.to_thread(_release_broadcasts, list(tasks))
@@ -0,0 +1,177 @@
+# app/utils/line_client.py
+import asyncio
+import logging
+import random
+import time
+import uuid
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+RETRY_KEY_HEADER = "X-Line-Retry-Key"
+ACCEPTED_REQUEST_HEADER = "X-Line-Accepted-Request-Id"
+
+
+def _backoff_delay(attempt: int, response=None):
+    # LINE ส่ง Retry-After มากับ 429 ได้ ถ้ามีให้ใช้ค่านั้นก่อน
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), settings.LINE_API_MAX_BACKOFF)
+            except ValueError:
+                pass
+    delay = settings.LINE_API_BACKOFF_BASE * (2 ** attempt)
+    return min(delay, settings.LINE_API_MAX_BACKOFF) * (0.5 + random.random() / 2)
+
+
+def _client_kwargs():
+    return {
+        "base_url": settings.LINE_API_BASE_URL,
+        "timeout": httpx.Timeout(settings.LINE_API_TIMEOUT, connect=settings.LINE_API_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=settings.LINE_API_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LINE_API_MAX_CONNECTIONS,
+        ),
+    }
+
+
+def _auth_headers():
+    return {"Authorization": f"Bearer {settings.LINE_CHANNEL_ACCESS_TOKEN}"}
+
+
+def _send_headers():
+    # push/multicast ไม่ idempotent: retry key เดียวกันทุก attempt ของการเรียกครั้งนี้
+    # LINE จะไม่ส่งซ้ำ และตอบ 409 + X-Line-Accepted-Request-Id ถ้า attempt ก่อนหน้าส่งสำเร็จไปแล้ว
+    return {**_auth_headers(), RETRY_KEY_HEADER: str(uuid.uuid4())}
+
+
+def delivered(response) -> bool:
+    """True if LINE accepted the message, either now or in an earlier attempt with the same retry key."""
+    if response.status_code == 200:
+        return True
+    return response.status_code == 409 and ACCEPTED_REQUEST_HEADER in response.headers
+
+
+class AsyncLineClient:
+    """Pooled keep-alive client for api.line.me with retry/backoff on 429 and 5xx."""
+
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(**_client_kwargs())
+        return self._client
+
+    async def request(self, method: str, path: str, **kwargs):
+        retries = settings.LINE_API_MAX_RETRIES
+        for attempt in range(retries + 1):
+            try:
+                response = await self.client.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if attempt >= retries:
+                    raise
+                logger.warning("LINE API %s %s failed (%s), retrying", method, path, e)
+                await asyncio.sleep(_backoff_delay(attempt))
+                continue
+            if response.status_code in RETRY_STATUS and attempt < retries:
+                await asyncio.sleep(_backoff_delay(attempt, response))
+                continue
+            return response
+
+    async def verify_id_token(self, id_token: str):
+        response = await self.request(
+            "POST", "/oauth2/v2.1/verify",
+            data={"id_token": id_token, "client_id": settings.LINE_LOGIN_CHANNEL_ID},
+        )
+        if response.status_code == 200:
+            return response.json()
+        return None
+
+    async def push_message(self, to: str, messages: list):
+        return await self.request(
+            "POST", "/v2/bot/message/push",
+            headers=_send_headers(), json={"to": to, "messages": messages},
+        )
+
+    async def multicast(self, to: list, messages: list):
+        # LINE รับได้สูงสุด 500 user id ต่อครั้ง
+        return await self.request(
+            "POST", "/v2/bot/message/multicast",
+            headers=_send_headers(), json={"to": to, "messages": messages},
+        )
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class LineClient:
+    """Sync counterpart of AsyncLineClient for code that runs in threads (sync routes, workers)."""
+
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.Client(**_client_kwargs())
+        return self._client
+
+    def request(self, method: str, path: str, **kwargs):
+        retries = settings.LINE_API_MAX_RETRIES
+        for attempt in range(retries + 1):
+            try:
+                response = self.client.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if attempt >= retries:
+                    raise
+                logger.warning("LINE API %s %s failed (%s), retrying", method, path, e)
+                time.sleep(_backoff_delay(attempt))
+                continue
+            if response.status_code in RETRY_STATUS and attempt < retries:
+                time.sleep(_backoff_delay(attempt, response))
+                continue
+            return response
+
+    def verify_id_token(self, id_token: str):
+        response = self.request(
+            "POST", "/oauth2/v2.1/verify",
+            data={"id_token": id_token, "client_id": settings.LINE_LOGIN_CHANNEL_ID},
+        )
+        if response.status_code == 200:
+            return response.json()
+        return None
+
+    def push_message(self, to: str, messages: list):
+        return self.request(
+            "POST", "/v2/bot/message/push",
+            headers=_send_headers(), json={"to": to, "messages": messages},
+        )
+
+    def multicast(self, to: list, messages: list):
+        return self.request(
+            "POST", "/v2/bot/message/multicast",
+            headers=_send_headers(), json={"to": to, "messages": messages},
+        )
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+async_line_client = AsyncLineClient()
+line_client = LineClient()
+
+
+async def close_line_clients():
+    await async_line_client.aclose()
+    line_client.close()
@@ -0,0 +1,150 @@
+# app/utils/line_token.py
+import hashlib
+import logging
+import time
+
+import httpx
+from jose import jwk, jwt, JWTError
+
+from app.core.config import settings
+from app.utils.cache import TTLCache
+from app.utils.line_client import async_line_client, line_client
+
+logger = logging.getLogger(__name__)
+
+LINE_ISSUER = "https://access.line.me"
+
+# id_token ที่ verify แล้ว เก็บจนถึง exp ของ token เอง
+token_cache = TTLCache(maxsize=settings.LINE_ID_TOKEN_CACHE_SIZE, ttl=settings.LINE_ID_TOKEN_CACHE_MAX_TTL)
+_jwks = {"keys": {}, "fetched_at": 0.0}
+
+counters = {
+    "remote_verifications": 0,
+    "local_verifications": 0,
+    "failures": 0,
+}
+
+
+def _cache_key(id_token: str):
+    return hashlib.sha256(id_token.encode()).hexdigest()
+
+
+def _cache_payload(key: str, payload: dict):
+    exp = payload.get("exp")
+    if not exp:
+        return
+    expires_at = min(float(exp), time.time() + settings.LINE_ID_TOKEN_CACHE_MAX_TTL)
+    token_cache.set(key, payload, expires_at=expires_at)
+
+
+def _set_jwks(keys: list):
+    _jwks["keys"] = {key["kid"]: key for key in keys if "kid" in key}
+    _jwks["fetched_at"] = time.time()
+
+
+def _jwks_stale(kid):
+    age = time.time() - _jwks["fetched_at"]
+    if age > settings.LINE_JWKS_CACHE_SECONDS:
+        return True
+    # kid ไม่รู้จัก: ดึงใหม่ได้ แต่ไม่ถี่กว่าที่กำหนด (กัน token ปลอมยิง JWKS รัวๆ)
+    return kid not in _jwks["keys"] and age > settings.LINE_JWKS_MIN_REFRESH_SECONDS
+
+
+def _decode_local(id_token: str, key):
+    header = jwt.get_unverified_header(id_token)
+    alg = header.get("alg")
+    if alg == "HS256":
+        # LINE Login (web) เซ็น id_token ด้วย channel secret
+        signing_key = settings.LINE_LOGIN_CHANNEL_SECRET
+    elif alg == "ES256":
+        if key is None:
+            raise JWTError("Unknown signing key")
+        signing_key = jwk.construct(key, algorithm="ES256")
+    else:
+        raise JWTError(f"Unsupported alg {alg}")
+    return jwt.decode(
+        id_token,
+        signing_key,
+        algorithms=[alg],
+        audience=settings.LINE_LOGIN_CHANNEL_ID,
+        issuer=LINE_ISSUER,
+        options={"verify_at_hash": False},
+    )
+
+
+def _verify_local(id_token: str, fetch_jwks):
+    try:
+        kid = jwt.get_unverified_header(id_token).get("kid")
+        if kid and _jwks_stale(kid):
+            fetch_jwks()
+        payload = _decode_local(id_token, _jwks["keys"].get(kid))
+    except JWTError as e:
+        logger.info("Local LINE id_token verification failed: %s", e)
+        return None
+    counters["local_verifications"] += 1
+    return payload
+
+
+def _fetch_jwks_sync():
+    try:
+        response = line_client.request("GET", settings.LINE_JWKS_PATH)
+    except httpx.HTTPError as e:
+        logger.warning("Could not fetch LINE JWKS: %s", e)
+        return
+    if response.status_code == 200:
+        _set_jwks(response.json().get("keys", []))
+
+
+async def _fetch_jwks_async():
+    try:
+        response = await async_line_client.request("GET", settings.LINE_JWKS_PATH)
+    except httpx.HTTPError as e:
+        logger.warning("Could not fetch LINE JWKS: %s", e)
+        return
+    if response.status_code == 200:
+        _set_jwks(response.json().get("keys", []))
+
+
+def verify_id_token(id_token: str):
+    key = _cache_key(id_token)
+    payload = token_cache.get(key)
+    if payload is not None:
+        return payload
+    if settings.LINE_ID_TOKEN_VERIFY_MODE == "local":
+        payload = _verify_local(id_token, _fetch_jwks_sync)
+    else:
+        counters["remote_verifications"] += 1
+        payload = line_client.verify_id_token(id_token)
+    if payload is None:
+        counters["failures"] += 1
+        return None
+    _cache_payload(key, payload)
+    return payload
+
+
+async def averify_id_token(id_token: str):
+    key = _cache_key(id_token)
+    payload = token_cache.get(key)
+    if payload is not None:
+        return payload
+    if settings.LINE_ID_TOKEN_VERIFY_MODE == "local":
+        try:
+            kid = jwt.get_unverified_header(id_token).get("kid")
+        except JWTError:
+            kid = None
+        if kid and _jwks_stale(kid):
+            await _fetch_jwks_async()
+        # ดึง JWKS มาแล้ว ส่วนที่เหลือเป็นงาน CPU ล้วน
+        payload = _verify_local(id_token, lambda: None)
+    else:
+        counters["remote_verifications"] += 1
+        payload = await async_line_client.verify_id_token(id_token)
+    if payload is None:
+        counters["failures"] += 1
+        return None
+    _cache_payload(key, payload)
+    return payload
+
+
+def get_stats():
+    return {**token_cache.stats(), **counters, "mode": settings.LINE_ID_TOKEN_VERIFY_MODE}
@@ -1,26 +1,23 @@
-import requests
-from app.core.config import settings
+from app.utils.line_client import async_line_client, delivered, line_client
+from app.utils import line_token
+
+# ใช้ client กลางที่มี connection pool + timeout + retry แทน requests.post
+# id_token ที่เคย verify แล้วจะตอบจาก cache จนกว่าจะหมดอายุ
 
 def verify_line_id_token(id_token):
-    url = "https://api.line.me/oauth2/v2.1/verify"
-    data = {
-        "id_token": id_token,
-        "client_id": settings.LINE_LOGIN_CHANNEL_ID
-    }
-    resp = requests.post(url, data=data)
-    if resp.status_code == 200:
-        return resp.json()
-    return None
+    return line_token.verify_id_token(id_token)
+
+async def averify_line_id_token(id_token):
+    return await line_token.averify_id_token(id_token)
+
+# 409 ที่มี X-Line-Accepted-Request-Id = attempt ก่อนหน้าส่งถึงแล้ว (retry key ซ้ำ) นับเป็นส่งสำเร็จ
+def _result(resp):
+    return (200 if delivered(resp) else resp.status_code), resp.text
 
 def send_line_message(line_user_id, message):
-    url = "https://api.line.me/v2/bot/message/push"
-    headers = {
-        "Authorization": f"Bearer {settings.LINE_CHANNEL_ACCESS_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "to": line_user_id,
-        "messages": [{"type": "text", "text": message}]
-    }
-    resp = requests.post(url, headers=headers, json=data)
-    return resp.status_code, resp.text
\ No newline at end of file
+    resp = line_client.push_message(line_user_id, [{"type": "text", "text": message}])
+    return _result(resp)
+
+async def asend_line_message(line_user_id, message):
+    resp = await async_line_client.push_message(line_user_id, [{"type": "text", "text": message}])
+    return _result(resp)
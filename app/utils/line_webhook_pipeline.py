@@ -0,0 +1,129 @@
+# app/utils/line_webhook_pipeline.py
+import asyncio
+import base64
+import hashlib
+import hmac
+import inspect
+import logging
+
+from app.core.config import settings
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def verify_signature(body: bytes, signature: str) -> bool:
+    # X-Line-Signature = base64(HMAC-SHA256(channel secret, request body))
+    if not signature:
+        return False
+    digest = hmac.new(settings.LINE_MESSAGING_CHANNEL_SECRET.encode(), body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode(), signature)
+
+
+class WebhookDispatcher:
+    """Bounded in-process event queue drained by a pool of worker tasks."""
+
+    def __init__(self, queue_size: int, workers: int):
+        self.queue_size = queue_size
+        self.workers = workers
+        self.handlers = {}  # event type -> [handler]
+        self.queue = None
+        self._tasks = []
+        self._seen = TTLCache(maxsize=settings.LINE_WEBHOOK_DEDUP_SIZE, ttl=settings.LINE_WEBHOOK_DEDUP_TTL)
+        self.metrics = {
+            "received": 0,
+            "enqueued": 0,
+            "duplicates": 0,
+            "rejected_signature": 0,
+            "dropped_queue_full": 0,
+            "processed": 0,
+            "unhandled": 0,
+            "handler_errors": 0,
+        }
+
+    def on(self, event_type: str):
+        def register(handler):
+            self.handlers.setdefault(event_type, []).append(handler)
+            return handler
+        return register
+
+    def enqueue(self, events: list):
+        # คืนค่า False ถ้าคิวเต็ม (ให้ router ตอบ 503 เพื่อให้ LINE redeliver)
+        for event in events:
+            self.metrics["received"] += 1
+            event_id = event.get("webhookEventId")
+            if event_id:
+                if self._seen.get(event_id) is not None:
+                    self.metrics["duplicates"] += 1
+                    continue
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.metrics["dropped_queue_full"] += 1
+                return False
+            if event_id:
+                self._seen.set(event_id, True)
+            self.metrics["enqueued"] += 1
+        return True
+
+    async def _dispatch(self, event: dict):
+        handlers = self.handlers.get(event.get("type"), [])
+        if not handlers:
+            self.metrics["unhandled"] += 1
+            logger.debug("No handler for LINE event type %s", event.get("type"))
+            return
+        for handler in handlers:
+            try:
+                if inspect.iscoroutinefunction(handler):
+                    await handler(event)
+                else:
+                    # handler แบบ sync (เช่นเขียน DB) รันใน thread
+                    await asyncio.to_thread(handler, event)
+            except Exception:
+                self.metrics["handler_errors"] += 1
+                logger.exception("LINE webhook handler %s failed", getattr(handler, "__name__", handler))
+
+    async def _worker(self):
+        while True:
+            event = await self.queue.get()
+            try:
+                await self._dispatch(event)
+                self.metrics["processed"] += 1
+            finally:
+                self.queue.task_done()
+
+    def start(self):
+        if self._tasks:
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float):
+        # drain event ที่ค้างในคิวก่อน แล้วค่อยหยุด worker
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("LINE webhook queue not drained, %s events dropped", self.queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def get_metrics(self):
+        return {
+            **self.metrics,
+            "queue_size": self.queue.qsize() if self.queue is not None else 0,
+            "workers": len(self._tasks),
+        }
+
+
+dispatcher = WebhookDispatcher(settings.LINE_WEBHOOK_QUEUE_SIZE, settings.LINE_WEBHOOK_WORKERS)
+
+
+@dispatcher.on("follow")
+@dispatcher.on("unfollow")
+async def log_follow_event(event: dict):
+    logger.info("LINE %s from %s", event.get("type"), event.get("source", {}).get("userId"))
@@ -0,0 +1,225 @@
+# app/utils/reconciliation.py
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, case, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import Income, Invoice, Payment
+
+OPEN_STATUSES = ("pending", "overdue", "partial")
+VERIFIED_STATUSES = ("verified", "approved")  # Payment.status ของสลิปที่ตรวจแล้ว: เท่านั้นที่นับเป็นยอดชำระ
+TOLERANCE = 0.005  # ยอดต่างกันไม่เกินครึ่งสตางค์ถือว่าเท่ากัน
+
+
+def is_verified(payment: Payment) -> bool:
+    return (payment.status or "").lower() in VERIFIED_STATUSES
+
+
+def counts_as_paid():
+    # สลิปที่ถูกปฏิเสธ/ยังไม่ตรวจไม่นับ แม้จะเคยถูก reconcile ไว้ก่อนหน้า
+    return and_(Payment.payment_status == "reconciled", func.lower(Payment.status).in_(VERIFIED_STATUSES))
+
+
+def _paid_totals(db: Session, invoice_ids):
+    if not invoice_ids:
+        return {}
+    return dict(db.execute(
+        select(Payment.invoice_id, func.coalesce(func.sum(Payment.amount), 0.0))
+        .where(Payment.invoice_id.in_(list(invoice_ids)), counts_as_paid())
+        .group_by(Payment.invoice_id)
+    ).all())
+
+
+def _invoice_status(invoice: Invoice, paid: float):
+    if paid >= (invoice.total_amount or 0.0) - TOLERANCE:
+        return "paid"
+    # ยังจ่ายไม่ครบและเลยกำหนดแล้วเป็น overdue เสมอ (รวมใบที่จ่ายมาบางส่วน) ให้ตรงกับ sweep ของ invoice_scheduler
+    if invoice.due_date and invoice.due_date < datetime.utcnow():
+        return "overdue"
+    return "partial" if paid > TOLERANCE else "pending"
+
+
+def _in_window(invoice: Invoice, paid_at: datetime):
+    window = timedelta(days=settings.RECONCILE_DATE_WINDOW_DAYS)
+    if invoice.invoice_date and paid_at < invoice.invoice_date - window:
+        return False
+    if invoice.due_date and paid_at > invoice.due_date + window:
+        return False
+    return True
+
+
+def _pick_invoice(payment: Payment, candidates, paid: dict):
+    """Exact outstanding amount first, otherwise the oldest open invoice (FIFO)."""
+    paid_at = payment.payment_date or datetime.utcnow()
+    open_invoices = [
+        invoice for invoice in candidates
+        if invoice.status in OPEN_STATUSES and _in_window(invoice, paid_at)
+    ]
+    for invoice in open_invoices:
+        outstanding = (invoice.total_amount or 0.0) - paid.get(invoice.invoice_id, 0.0)
+        if abs(outstanding - (payment.amount or 0.0)) <= TOLERANCE:
+            return invoice
+    return open_invoices[0] if open_invoices else None
+
+
+def _explicit_invoice(payment: Payment, by_id: dict):
+    # invoice ที่ระบุมาเองต้องเป็นของ enrollment เดียวกันและยังค้างชำระอยู่
+    invoice = by_id.get(payment.invoice_id)
+    if invoice is None or invoice.enrollment_id != payment.enrollment_id or invoice.status not in OPEN_STATUSES:
+        return None
+    return invoice
+
+
+def reconcile_payments(db: Session, payments):
+    """Match payments to invoices, update invoice status and create Income rows.
+
+    Works on the caller's transaction and does not commit, so the matching,
+    status changes and income rows land together or not at all. Only payments
+    whose slip is verified/approved are matched; the rest stay pending (or
+    rejected) and never touch an invoice. A payment larger than the matched
+    invoice's outstanding amount is marked overpaid and left for staff.
+    """
+    report = {"payments": len(payments), "reconciled": 0, "unmatched": 0, "overpaid": 0, "unverified": 0, "invoices_paid": 0, "invoices_partial": 0, "incomes_created": 0}
+    unverified = [payment for payment in payments if not is_verified(payment)]
+    for payment in unverified:
+        payment.payment_status = "rejected" if (payment.status or "").lower() == "rejected" else "pending"
+    report["unverified"] = len(unverified)
+    payments = [payment for payment in payments if is_verified(payment)]
+    if not payments:
+        db.flush()
+        return report
+
+    explicit_ids = {payment.invoice_id for payment in payments if payment.invoice_id}
+    enrollment_ids = {payment.enrollment_id for payment in payments if payment.enrollment_id}
+    # invoice ที่เกี่ยวข้องทั้ง batch ใน query เดียว (lock ไว้กันการ reconcile ซ้อนกัน)
+    invoices = db.execute(
+        select(Invoice)
+        .where(or_(
+            Invoice.invoice_id.in_(list(explicit_ids)),
+            Invoice.enrollment_id.in_(list(enrollment_ids)) & Invoice.status.in_(OPEN_STATUSES),
+        ))
+        .order_by(Invoice.due_date, Invoice.invoice_id)
+        .with_for_update()
+    ).scalars().all()
+    by_id = {invoice.invoice_id: invoice for invoice in invoices}
+    by_enrollment = {}
+    for invoice in invoices:
+        by_enrollment.setdefault(invoice.enrollment_id, []).append(invoice)
+    paid = _paid_totals(db, by_id)
+    has_income = set(db.execute(
+        select(Income.payment_id).where(Income.payment_id.in_([payment.payment_id for payment in payments]))
+    ).scalars())
+
+    touched = set()
+    for payment in payments:
+        if payment.invoice_id:
+            invoice = _explicit_invoice(payment, by_id)
+        else:
+            invoice = _pick_invoice(payment, by_enrollment.get(payment.enrollment_id, []), paid)
+        if invoice is None:
+            payment.payment_status = "unmatched"
+            report["unmatched"] += 1
+            continue
+        outstanding = (invoice.total_amount or 0.0) - paid.get(invoice.invoice_id, 0.0)
+        if (payment.amount or 0.0) > outstanding + TOLERANCE:
+            # ยอดเกินที่ค้างอยู่: ไม่ลงบัญชีอัตโนมัติ ให้เจ้าหน้าที่คืนเงินหรือแบ่งเข้าหลายใบเอง
+            payment.payment_status = "overpaid"
+            report["overpaid"] += 1
+            continue
+
+        payment.invoice_id = invoice.invoice_id
+        payment.payment_status = "reconciled"
+        paid[invoice.invoice_id] = paid.get(invoice.invoice_id, 0.0) + (payment.amount or 0.0)
+        invoice.status = _invoice_status(invoice, paid[invoice.invoice_id])
+        touched.add(invoice.invoice_id)
+        report["reconciled"] += 1
+        if payment.payment_id not in has_income:
+            # ORM add (ไม่ใช่ bulk insert) เพื่อให้ finance rollup อัปเดตตาม
+            db.add(Income(
+                payment_id=payment.payment_id,
+                income_date=payment.payment_date or datetime.utcnow(),
+                income_type=settings.RECONCILE_INCOME_TYPE,
+                amount=payment.amount or 0.0,
+                description=f"Payment #{payment.payment_id} for invoice #{invoice.invoice_id}",
+            ))
+            has_income.add(payment.payment_id)
+            report["incomes_created"] += 1
+
+    for invoice_id in touched:
+        status = by_id[invoice_id].status
+        if status == "paid":
+            report["invoices_paid"] += 1
+        elif status == "partial":
+            report["invoices_partial"] += 1
+    db.flush()
+    return report
+
+
+def unreconcile_payment(db: Session, payment: Payment):
+    """Undo a payment's match: drop its Income rows and re-derive the invoice status (no commit)."""
+    for income in db.query(Income).filter(Income.payment_id == payment.payment_id).all():
+        db.delete(income)
+    invoice_id = payment.invoice_id if payment.payment_status == "reconciled" else None
+    payment.payment_status = "pending"
+    db.flush()
+    if invoice_id:
+        invoice = db.get(Invoice, invoice_id, with_for_update=True)
+        if invoice is not None and invoice.status in OPEN_STATUSES + ("paid",):
+            paid = _paid_totals(db, [invoice_id]).get(invoice_id, 0.0)
+            invoice.status = _invoice_status(invoice, paid)
+        db.flush()
+
+
+def run_batch(db: Session, include_unmatched: bool = True, batch_size: int = None):
+    """Nightly/full run: reconcile every pending (and previously unmatched) payment in keyset batches."""
+    batch_size = batch_size or settings.RECONCILE_BATCH_SIZE
+    statuses = ["pending", "unmatched"] if include_unmatched else ["pending"]
+    started = time.perf_counter()
+    totals = {"payments": 0, "reconciled": 0, "unmatched": 0, "overpaid": 0, "unverified": 0, "invoices_paid": 0, "invoices_partial": 0, "incomes_created": 0, "batches": 0}
+    last_id = 0
+    while True:
+        payments = db.execute(
+            select(Payment)
+            .where(
+                or_(Payment.payment_status.in_(statuses), Payment.payment_status.is_(None)),
+                func.lower(Payment.status).in_(VERIFIED_STATUSES),
+                Payment.payment_id > last_id,
+            )
+            .order_by(Payment.payment_id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not payments:
+            break
+        last_id = payments[-1].payment_id
+        report = reconcile_payments(db, payments)
+        db.commit()
+        for key, value in report.items():
+            totals[key] += value
+        totals["batches"] += 1
+    totals["seconds"] = round(time.perf_counter() - started, 3)
+    return totals
+
+
+def recompute_invoice_statuses(db: Session):
+    """Repair drift: set every open/paid invoice's status from its reconciled payment total in one UPDATE."""
+    paid = (
+        select(func.coalesce(func.sum(Payment.amount), 0.0))
+        .where(Payment.invoice_id == Invoice.invoice_id, counts_as_paid())
+        .scalar_subquery()
+    )
+    result = db.execute(
+        update(Invoice)
+        .where(Invoice.status.in_(OPEN_STATUSES + ("paid",)))
+        .values(status=case(
+            (paid >= Invoice.total_amount - TOLERANCE, "paid"),
+            (Invoice.due_date < datetime.utcnow(), "overdue"),
+            (paid > TOLERANCE, "partial"),
+            else_="pending",
+        ))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
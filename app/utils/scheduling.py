@@ -0,0 +1,499 @@
+# app/utils/scheduling.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event, insert, inspect, or_, select, text
+from sqlalchemy.orm import Session, object_session
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models import models
+from app.utils import course_catalog
+
+_PENDING_KEY = "schedule_index_pending"
+_ROOM_LOCK_CLASS = 7190022  # class id ของ advisory lock (คู่กับ classroom_id)
+_TEACHER_LOCK_CLASS = 7190023  # class id ของ advisory lock (คู่กับ teacher_id)
+_local_write_lock = threading.Lock()  # แทน advisory lock บน dialect อื่น (dev/SQLite, process เดียว)
+
+
+class ScheduleError(ValueError):
+    def __init__(self, status_code: int, detail, conflicts=None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.conflicts = conflicts or []
+
+
+def naive(value: datetime) -> datetime:
+    # DateTime ในระบบเป็นแบบ naive: เวลาที่มี timezone แปลงเป็น UTC ก่อนเทียบ/บันทึก
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class IntervalIndex:
+    """Intervals of one room/teacher sorted by start, with a running max of end times.
+
+    Overlap lookup is a bisect plus a walk over the actual overlaps, so it stays
+    O(log n) for a conflict-free calendar even if old data already overlaps.
+    """
+
+    __slots__ = ("starts", "ends", "ids", "max_ends")
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+        self.max_ends = []  # max_ends[i] = max(ends[0..i])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _refresh_max(self, position: int):
+        running = self.max_ends[position - 1] if position else None
+        for i in range(position, len(self.ends)):
+            running = self.ends[i] if running is None or self.ends[i] > running else running
+            self.max_ends[i] = running
+
+    def add(self, start: datetime, end: datetime, schedule_id):
+        position = bisect.bisect_right(self.starts, start)
+        self.starts.insert(position, start)
+        self.ends.insert(position, end)
+        self.ids.insert(position, schedule_id)
+        self.max_ends.insert(position, end)
+        self._refresh_max(position)
+
+    def remove(self, start: datetime, schedule_id) -> bool:
+        position = bisect.bisect_left(self.starts, start)
+        while position < len(self.starts) and self.starts[position] == start:
+            if self.ids[position] == schedule_id:
+                for values in (self.starts, self.ends, self.ids, self.max_ends):
+                    del values[position]
+                self._refresh_max(position)
+                return True
+            position += 1
+        return False
+
+    def overlapping(self, start: datetime, end: datetime, ignore_id=None):
+        """[(start, end, schedule_id)] of intervals with start < `end` and end > `start`."""
+        found = []
+        i = bisect.bisect_left(self.starts, end) - 1  # เฉพาะช่วงที่เริ่มก่อน end
+        while i >= 0 and self.max_ends[i] > start:
+            if self.ends[i] > start and self.ids[i] != ignore_id:
+                found.append((self.starts[i], self.ends[i], self.ids[i]))
+            i -= 1
+        found.reverse()
+        return found
+
+
+def _overlaps(classroom_id, room, teacher_id, teacher, start: datetime, end: datetime, ignore_id=None):
+    found = []
+    if room is not None:
+        found += [
+            {"resource": "classroom", "resource_id": classroom_id, "schedule_id": sid, "start_time": s, "end_time": e}
+            for s, e, sid in room.overlapping(start, end, ignore_id)
+        ]
+    if teacher is not None:
+        found += [
+            {"resource": "teacher", "resource_id": teacher_id, "schedule_id": sid, "start_time": s, "end_time": e}
+            for s, e, sid in teacher.overlapping(start, end, ignore_id)
+        ]
+    return found
+
+
+class ScheduleIndex:
+    """Per-process interval indexes of every classroom and teacher calendar."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.rooms = {}  # classroom_id -> IntervalIndex
+        self.teachers = {}  # teacher_id -> IntervalIndex
+        self.schedules = {}  # schedule_id -> (course_id, classroom_id, start, end)
+        self.course_teachers = {}  # course_id -> teacher_id
+        self.classrooms = {}  # classroom_id -> (name, location, capacity)
+        self.loaded_at = None
+        self.metrics = {"loads": 0, "last_load_ms": 0.0, "checks": 0, "conflicts_found": 0, "free_room_queries": 0}
+
+    # ----------------- load -----------------
+
+    def load(self, db: Session = None):
+        """Rebuild every index from the database (startup and every SCHEDULE_INDEX_REFRESH seconds)."""
+        own_session = db is None
+        db = db or SessionLocal()
+        started = time.perf_counter()
+        try:
+            course_teachers = dict(db.execute(select(models.Course.course_id, models.Course.teacher_id)).all())
+            classrooms = {
+                classroom_id: (name, location, capacity)
+                for classroom_id, name, location, capacity in db.execute(
+                    select(models.Classroom.classroom_id, models.Classroom.name, models.Classroom.location, models.Classroom.capacity)
+                )
+            }
+            rows = db.execute(
+                select(models.Schedule.schedule_id, models.Schedule.course_id, models.Schedule.classroom_id,
+                       models.Schedule.start_time, models.Schedule.end_time)
+                .order_by(models.Schedule.start_time)
+            ).all()
+        finally:
+            if own_session:
+                db.close()
+        with self._lock:
+            self.rooms, self.teachers, self.schedules = {}, {}, {}
+            self.course_teachers = course_teachers
+            self.classrooms = classrooms
+            for schedule_id, course_id, classroom_id, start, end in rows:
+                self._add(schedule_id, course_id, classroom_id, start, end)
+            self.loaded_at = time.monotonic()
+            self.metrics["loads"] += 1
+            self.metrics["last_load_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def ensure_loaded(self, db: Session):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > settings.SCHEDULE_INDEX_REFRESH:
+            self.load(db)
+
+    def mark_stale(self):
+        # DB พบการจองที่ index ไม่รู้ (worker อื่นเพิ่งจอง): โหลดใหม่ในการใช้ครั้งถัดไป
+        with self._lock:
+            self.loaded_at = None
+            self.metrics["stale_detected"] = self.metrics.get("stale_detected", 0) + 1
+
+    # ----------------- maintain -----------------
+
+    def _add(self, schedule_id, course_id, classroom_id, start, end):
+        self.schedules[schedule_id] = (course_id, classroom_id, start, end)
+        self.rooms.setdefault(classroom_id, IntervalIndex()).add(start, end, schedule_id)
+        teacher_id = self.course_teachers.get(course_id)
+        if teacher_id is not None:
+            self.teachers.setdefault(teacher_id, IntervalIndex()).add(start, end, schedule_id)
+
+    def _discard(self, schedule_id):
+        row = self.schedules.pop(schedule_id, None)
+        if row is None:
+            return
+        course_id, classroom_id, start, _ = row
+        if classroom_id in self.rooms:
+            self.rooms[classroom_id].remove(start, schedule_id)
+        teacher_id = self.course_teachers.get(course_id)
+        if teacher_id in self.teachers:
+            self.teachers[teacher_id].remove(start, schedule_id)
+
+    def apply(self, changes: dict):
+        """Apply committed changes collected by the ORM listeners / bulk inserts."""
+        with self._lock:
+            if self.loaded_at is None:
+                return  # ยังไม่เคยโหลด: ครั้งแรกที่ใช้จะโหลดจาก DB เอง
+            for course_id, teacher_id in changes.get("courses", {}).items():
+                # ครูของคอร์สเปลี่ยน: ย้ายคาบทั้งหมดของคอร์สไป index ของครูคนใหม่
+                rows = {sid: row for sid, row in self.schedules.items() if row[0] == course_id}
+                for schedule_id in rows:
+                    self._discard(schedule_id)
+                if teacher_id is None:
+                    self.course_teachers.pop(course_id, None)
+                else:
+                    self.course_teachers[course_id] = teacher_id
+                for schedule_id, row in rows.items():
+                    self._add(schedule_id, *row)
+            for classroom_id, row in changes.get("classrooms", {}).items():
+                if row is None:
+                    self.classrooms.pop(classroom_id, None)
+                else:
+                    self.classrooms[classroom_id] = row
+            for schedule_id, row in changes.get("schedules", {}).items():
+                self._discard(schedule_id)
+                if row is not None:
+                    self._add(schedule_id, *row)
+
+    # ----------------- queries -----------------
+
+    def conflicts(self, course_id: int, classroom_id: int, start: datetime, end: datetime, ignore_id=None):
+        with self._lock:
+            self.metrics["checks"] += 1
+            teacher_id = self.course_teachers.get(course_id)
+            found = _overlaps(
+                classroom_id, self.rooms.get(classroom_id),
+                teacher_id, self.teachers.get(teacher_id) if teacher_id is not None else None,
+                start, end, ignore_id,
+            )
+            self.metrics["conflicts_found"] += len(found)
+            return found
+
+    def free_rooms(self, start: datetime, end: datetime, min_capacity: int = None):
+        """Classrooms with no booking overlapping [start, end), smallest sufficient capacity first."""
+        with self._lock:
+            self.metrics["free_room_queries"] += 1
+            rooms = []
+            for classroom_id, (name, location, capacity) in self.classrooms.items():
+                if min_capacity and (capacity or 0) < min_capacity:
+                    continue
+                index = self.rooms.get(classroom_id)
+                if index is not None and index.overlapping(start, end):
+                    continue
+                rooms.append({"classroom_id": classroom_id, "name": name, "location": location, "capacity": capacity})
+        rooms.sort(key=lambda room: (room["capacity"] or 0, room["classroom_id"]))
+        return rooms
+
+    def get_metrics(self):
+        with self._lock:
+            return {
+                **self.metrics,
+                "schedules": len(self.schedules),
+                "classrooms": len(self.classrooms),
+                "teachers": len(self.teachers),
+                "loaded_seconds_ago": round(time.monotonic() - self.loaded_at, 1) if self.loaded_at is not None else None,
+            }
+
+
+index = ScheduleIndex()
+
+
+# ----------------- write path -----------------
+
+def _validate(db: Session, course_id: int, classroom_id: int, start: datetime, end: datetime):
+    if end <= start:
+        raise ScheduleError(400, "end_time must be after start_time")
+    if db.get(models.Course, course_id) is None:
+        raise ScheduleError(404, "Course not found")
+    if classroom_id not in index.classrooms:
+        index.load(db)  # ห้องอาจเพิ่งถูกสร้างจาก worker อื่น
+        if classroom_id not in index.classrooms:
+            raise ScheduleError(404, "Classroom not found")
+
+
+@contextmanager
+def _write_guard(db: Session):
+    # Postgres: advisory lock ต่อห้อง/ครูใน _db_conflicts กันทุก worker อยู่แล้ว
+    if db.get_bind().dialect.name == "postgresql":
+        yield
+        return
+    with _local_write_lock:
+        yield
+
+
+def _db_conflicts(db: Session, course_id: int, classroom_id: int, intervals, ignore_id=None):
+    """Authoritative re-check against the schedule table, under per-room/teacher advisory locks.
+
+    The in-memory index can be up to SCHEDULE_INDEX_REFRESH seconds behind other
+    workers, so it only serves as the fast path; this runs right before the
+    insert in the same transaction. Returns the conflicts of every interval.
+    """
+    teacher_id = db.execute(select(models.Course.teacher_id).where(models.Course.course_id == course_id)).scalar()
+    if db.get_bind().dialect.name == "postgresql":
+        # ห้องก่อนครูเสมอ: ลำดับเดียวกันทุก transaction จึงไม่ deadlock
+        db.execute(text("SELECT pg_advisory_xact_lock(:cls, :id)"), {"cls": _ROOM_LOCK_CLASS, "id": classroom_id})
+        if teacher_id is not None:
+            db.execute(text("SELECT pg_advisory_xact_lock(:cls, :id)"), {"cls": _TEACHER_LOCK_CLASS, "id": teacher_id})
+    window_start = min(start for start, _ in intervals)
+    window_end = max(end for _, end in intervals)
+    resource = models.Schedule.classroom_id == classroom_id
+    if teacher_id is not None:
+        resource = or_(resource, models.Course.teacher_id == teacher_id)
+    query = (
+        select(models.Schedule.schedule_id, models.Schedule.classroom_id, models.Course.teacher_id,
+               models.Schedule.start_time, models.Schedule.end_time)
+        .outerjoin(models.Course, models.Course.course_id == models.Schedule.course_id)
+        .where(resource, models.Schedule.start_time < window_end, models.Schedule.end_time > window_start)
+    )
+    if ignore_id is not None:
+        query = query.where(models.Schedule.schedule_id != ignore_id)
+    room, teacher = IntervalIndex(), IntervalIndex()
+    for schedule_id, row_classroom_id, row_teacher_id, start, end in db.execute(query):
+        if row_classroom_id == classroom_id:
+            room.add(start, end, schedule_id)
+        if teacher_id is not None and row_teacher_id == teacher_id:
+            teacher.add(start, end, schedule_id)
+    found = [_overlaps(classroom_id, room, teacher_id, teacher, start, end) for start, end in intervals]
+    if any(found):
+        index.mark_stale()
+    return found
+
+
+def create_schedule(db: Session, course_id: int, classroom_id: int, start: datetime, end: datetime):
+    start, end = naive(start), naive(end)
+    # index ใน memory ตอบเร็ว (ไม่แตะ DB) แต่ต้องยืนยันกับตาราง schedule ก่อน insert เสมอ
+    index.ensure_loaded(db)
+    _validate(db, course_id, classroom_id, start, end)
+    conflicts = index.conflicts(course_id, classroom_id, start, end)
+    if conflicts:
+        raise ScheduleError(409, "Schedule conflicts with existing bookings", conflicts)
+    with _write_guard(db):
+        try:
+            conflicts = _db_conflicts(db, course_id, classroom_id, [(start, end)])[0]
+            if conflicts:
+                raise ScheduleError(409, "Schedule conflicts with existing bookings", conflicts)
+            schedule = models.Schedule(course_id=course_id, classroom_id=classroom_id, start_time=start, end_time=end)
+            db.add(schedule)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    db.refresh(schedule)
+    return schedule
+
+
+def update_schedule(db: Session, schedule: models.Schedule, course_id: int, classroom_id: int, start: datetime, end: datetime):
+    start, end = naive(start), naive(end)
+    index.ensure_loaded(db)
+    _validate(db, course_id, classroom_id, start, end)
+    conflicts = index.conflicts(course_id, classroom_id, start, end, ignore_id=schedule.schedule_id)
+    if conflicts:
+        raise ScheduleError(409, "Schedule conflicts with existing bookings", conflicts)
+    with _write_guard(db):
+        try:
+            conflicts = _db_conflicts(db, course_id, classroom_id, [(start, end)], ignore_id=schedule.schedule_id)[0]
+            if conflicts:
+                raise ScheduleError(409, "Schedule conflicts with existing bookings", conflicts)
+            schedule.course_id, schedule.classroom_id = course_id, classroom_id
+            schedule.start_time, schedule.end_time = start, end
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    db.refresh(schedule)
+    return schedule
+
+
+def iter_term_sessions(start_date, end_date, slots, skip_dates=()):
+    """Every weekly slot occurrence between start_date and end_date (inclusive), in time order."""
+    skip = set(skip_dates)
+    day = start_date
+    while day <= end_date:
+        if day not in skip:
+            for slot in sorted((slot for slot in slots if slot.weekday == day.weekday()), key=lambda slot: slot.start):
+                yield datetime.combine(day, slot.start), datetime.combine(day, slot.end)
+        day += timedelta(days=1)
+
+
+def generate_term(db: Session, course_id: int, classroom_id: int, start_date, end_date, slots, skip_dates=(), skip_conflicts=False):
+    """Create a term of recurring weekly sessions with one multi-row INSERT.
+
+    Every session is checked against the indexes and against the rest of the
+    batch; conflicts abort the whole term unless skip_conflicts is set.
+    """
+    if end_date < start_date:
+        raise ScheduleError(400, "end_date must not be before start_date")
+    for slot in slots:
+        if slot.end <= slot.start:
+            raise ScheduleError(400, "slot end must be after slot start")
+    sessions = list(iter_term_sessions(start_date, end_date, slots, skip_dates))
+    if len(sessions) > settings.SCHEDULE_TERM_MAX_SESSIONS:
+        raise ScheduleError(400, f"At most {settings.SCHEDULE_TERM_MAX_SESSIONS} sessions per term")
+
+    index.ensure_loaded(db)
+    if sessions:
+        _validate(db, course_id, classroom_id, sessions[0][0], sessions[0][1])
+    batch = IntervalIndex()  # คาบในชุดเดียวกันต้องไม่ชนกันเอง (ห้องและครูเดียวกัน)
+    accepted, conflicts = [], []
+    for start, end in sessions:
+        found = index.conflicts(course_id, classroom_id, start, end)
+        found += [
+            {"resource": "classroom", "resource_id": classroom_id, "schedule_id": None, "start_time": s, "end_time": e}
+            for s, e, _ in batch.overlapping(start, end)
+        ]
+        if found:
+            conflicts += found
+            continue
+        batch.add(start, end, None)
+        accepted.append((start, end))
+    if conflicts and not skip_conflicts:
+        raise ScheduleError(409, "Term conflicts with existing bookings", conflicts)
+    if not accepted:
+        return {"created": [], "conflicts": conflicts}
+
+    with _write_guard(db):
+        try:
+            # ยืนยันทั้งเทอมกับตาราง schedule ด้วย query เดียว (worker อื่นอาจจองไปหลัง index โหลด)
+            checked = _db_conflicts(db, course_id, classroom_id, accepted)
+            if any(checked):
+                conflicts += [conflict for found in checked for conflict in found]
+                if not skip_conflicts:
+                    raise ScheduleError(409, "Term conflicts with existing bookings", conflicts)
+                accepted = [session for session, found in zip(accepted, checked) if not found]
+            schedule_ids = []
+            if accepted:
+                schedule_ids = db.execute(
+                    insert(models.Schedule).returning(models.Schedule.schedule_id, sort_by_parameter_order=True),
+                    [
+                        {"course_id": course_id, "classroom_id": classroom_id, "start_time": start, "end_time": end}
+                        for start, end in accepted
+                    ],
+                ).scalars().all()
+                # INSERT แบบ bulk ไม่ผ่าน ORM event: ส่งคาบใหม่ให้ index เองหลัง commit
+                pending = db.info.setdefault(_PENDING_KEY, {})
+                for schedule_id, (start, end) in zip(schedule_ids, accepted):
+                    pending.setdefault("schedules", {})[schedule_id] = (course_id, classroom_id, start, end)
+                course_catalog.mark_dirty(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    return {
+        "created": [
+            {"schedule_id": schedule_id, "course_id": course_id, "classroom_id": classroom_id, "start_time": start, "end_time": end}
+            for schedule_id, (start, end) in zip(schedule_ids, accepted)
+        ],
+        "conflicts": conflicts,
+    }
+
+
+# ----------------- อัปเดต index หลัง commit ที่แก้ schedule/course/classroom -----------------
+
+def _pending(target):
+    session = object_session(target)
+    return session.info.setdefault(_PENDING_KEY, {}) if session is not None else None
+
+
+def _schedule_changed(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.setdefault("schedules", {})[target.schedule_id] = (
+            target.course_id, target.classroom_id, target.start_time, target.end_time
+        )
+
+
+def _schedule_deleted(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.setdefault("schedules", {})[target.schedule_id] = None
+
+
+def _course_changed(mapper, connection, target):
+    if not inspect(target).attrs.teacher_id.history.has_changes():
+        return
+    pending = _pending(target)
+    if pending is not None:
+        pending.setdefault("courses", {})[target.course_id] = target.teacher_id
+
+
+def _classroom_changed(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.setdefault("classrooms", {})[target.classroom_id] = (target.name, target.location, target.capacity)
+
+
+def _classroom_deleted(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.setdefault("classrooms", {})[target.classroom_id] = None
+
+
+for _event in ("after_insert", "after_update"):
+    event.listen(models.Schedule, _event, _schedule_changed)
+    event.listen(models.Course, _event, _course_changed)
+    event.listen(models.Classroom, _event, _classroom_changed)
+event.listen(models.Schedule, "after_delete", _schedule_deleted)
+event.listen(models.Classroom, "after_delete", _classroom_deleted)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session):
+    changes = session.info.pop(_PENDING_KEY, None)
+    if changes:
+        index.apply(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
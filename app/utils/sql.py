@@ -0,0 +1,22 @@
+# app/utils/sql.py
+from sqlalchemy import inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+
+def upsert_insert(db, model):
+    """INSERT that supports ON CONFLICT for the session's (or connection's) dialect, or None if unsupported."""
+    dialect = db.get_bind().dialect.name if isinstance(db, Session) else db.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    return None
+
+
+def has_unique(connection, table: str, columns) -> bool:
+    """True if `table` has a unique constraint or unique index on exactly `columns`."""
+    inspector = inspect(connection)
+    unique_columns = [constraint["column_names"] for constraint in inspector.get_unique_constraints(table)]
+    unique_columns += [index["column_names"] for index in inspector.get_indexes(table) if index.get("unique")]
+    return any(set(found) == set(columns) for found in unique_columns)
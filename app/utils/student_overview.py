@@ -0,0 +1,233 @@
+# app/utils/student_overview.py
+from datetime import datetime
+
+from sqlalchemy import event, func, inspect, select, union
+from sqlalchemy.orm import Session, object_session
+
+from app.core.config import settings
+from app.models import models
+from app.schemas import schemas
+from app.utils.cache import TTLCache
+from app.utils.reconciliation import OPEN_STATUSES, counts_as_paid
+
+# student_id -> JSON ของ overview (อายุสั้น และล้างทันทีหลัง commit ที่แก้ข้อมูลของนักเรียนคนนั้น)
+overview_cache = TTLCache(maxsize=settings.STUDENT_OVERVIEW_CACHE_SIZE, ttl=settings.STUDENT_OVERVIEW_CACHE_TTL)
+
+_DIRTY_KEY = "student_overview_dirty"
+_PAYMENT_KEY = "student_overview_payments"
+_ALL = "*"
+
+
+def _enrollments(db: Session, student_id: int):
+    return [
+        schemas.OverviewEnrollment(**row)
+        for row in db.execute(
+            select(
+                models.Enrollment.enrollment_id,
+                models.Enrollment.course_id,
+                models.Course.name.label("course_name"),
+                models.Enrollment.enroll_date,
+                models.Enrollment.expire_date,
+                models.Enrollment.status,
+            )
+            .outerjoin(models.Course, models.Course.course_id == models.Enrollment.course_id)
+            .where(models.Enrollment.student_id == student_id)
+            .order_by(models.Enrollment.enroll_date.desc(), models.Enrollment.enrollment_id.desc())
+        ).mappings()
+    ]
+
+
+def _open_invoices(db: Session, student_id: int):
+    # ยอดที่ reconcile แล้วต่อใบ เป็น subquery ใน query เดียวกัน (ไม่ query payment ทีละใบ)
+    paid = (
+        select(func.coalesce(func.sum(models.Payment.amount), 0.0))
+        .where(models.Payment.invoice_id == models.Invoice.invoice_id, counts_as_paid())
+        .scalar_subquery()
+    )
+    invoices = []
+    for row in db.execute(
+        select(
+            models.Invoice.invoice_id,
+            models.Invoice.enrollment_id,
+            models.Invoice.due_date,
+            models.Invoice.total_amount,
+            models.Invoice.status,
+            paid.label("paid_amount"),
+        )
+        .where(models.Invoice.student_id == student_id, models.Invoice.status.in_(OPEN_STATUSES))
+        .order_by(models.Invoice.due_date, models.Invoice.invoice_id)
+    ).mappings():
+        total, paid_amount = float(row["total_amount"] or 0.0), float(row["paid_amount"] or 0.0)
+        invoices.append(schemas.OverviewInvoice(
+            **{**row, "total_amount": total, "paid_amount": paid_amount},
+            outstanding=round(max(total - paid_amount, 0.0), 2),
+        ))
+    return invoices
+
+
+def _recent_exams(db: Session, student_id: int):
+    taken_at = func.coalesce(models.StudentExam.finished_at, models.StudentExam.started_at, models.StudentExam.created_at)
+    return [
+        schemas.OverviewExam(**{**row, "score": float(row["score"]) if row["score"] is not None else None})
+        for row in db.execute(
+            select(
+                models.StudentExam.student_exam_id,
+                models.StudentExam.exam_id,
+                models.Exam.name.label("exam_name"),
+                models.StudentExam.status,
+                models.StudentExam.score,
+                models.StudentExam.finished_at,
+            )
+            .outerjoin(models.Exam, models.Exam.exam_id == models.StudentExam.exam_id)
+            .where(models.StudentExam.student_id == student_id)
+            .order_by(taken_at.desc(), models.StudentExam.student_exam_id.desc())
+            .limit(settings.STUDENT_OVERVIEW_RECENT_EXAMS)
+        ).mappings()
+    ]
+
+
+def _attendance(db: Session, student_id: int):
+    rates = []
+    for row in db.execute(
+        select(models.AttendanceCounter)
+        .where(models.AttendanceCounter.student_id == student_id)
+        .order_by(models.AttendanceCounter.course_id)
+    ).scalars():
+        rates.append(schemas.AttendanceRate(
+            student_id=row.student_id,
+            course_id=row.course_id,
+            sessions=row.sessions,
+            present=row.present,
+            late=row.late,
+            absent=row.absent,
+            excused=row.excused,
+            rate=round((row.present + row.late) / row.sessions, 4) if row.sessions else 0.0,
+        ))
+    return rates
+
+
+def build_overview(db: Session, student_id: int):
+    """Everything the admin profile page needs in 5 queries, whatever the number of rows."""
+    student = db.execute(
+        select(
+            models.Student.student_id,
+            models.Student.first_name,
+            models.Student.last_name,
+            models.Student.email,
+            models.Student.phone,
+            models.Student.line_id,
+        ).where(models.Student.student_id == student_id)
+    ).mappings().first()
+    if student is None:
+        return None
+    invoices = _open_invoices(db, student_id)
+    attendance = _attendance(db, student_id)
+    sessions = sum(rate.sessions for rate in attendance)
+    attended = sum(rate.present + rate.late for rate in attendance)
+    now = datetime.utcnow()
+    return schemas.StudentOverview(
+        **student,
+        enrollments=_enrollments(db, student_id),
+        open_invoices=invoices,
+        outstanding_balance=round(sum(invoice.outstanding for invoice in invoices), 2),
+        overdue_count=sum(1 for invoice in invoices if invoice.status == "overdue" or invoice.due_date < now),
+        recent_exams=_recent_exams(db, student_id),
+        attendance=attendance,
+        attendance_rate=round(attended / sessions, 4) if sessions else None,
+        generated_at=now,
+    )
+
+
+def get_overview_json(db: Session, student_id: int):
+    body = overview_cache.get(student_id)
+    if body is not None:
+        return body
+    overview = build_overview(db, student_id)
+    if overview is None:
+        return None
+    body = overview.model_dump_json().encode()
+    overview_cache.set(student_id, body)
+    return body
+
+
+def mark_dirty(db: Session, *student_ids):
+    """For writes that bypass ORM events (bulk INSERT/UPDATE): drop these students' overviews after commit."""
+    db.info.setdefault(_DIRTY_KEY, set()).update(student_ids)
+
+
+def get_stats():
+    return overview_cache.stats()
+
+
+# ----------------- ล้าง cache หลัง commit ที่แก้ข้อมูลของนักเรียน -----------------
+# หมายเหตุ: UPDATE แบบ bulk (sweep ใบแจ้งหนี้, regrade) ไม่ผ่าน event เหล่านี้ ค่าจะค้างไม่เกิน TTL
+
+def _mark(target, *student_ids):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_DIRTY_KEY, set()).update(sid for sid in student_ids if sid is not None)
+
+
+def _student_id_changed(mapper, connection, target):
+    # ย้ายแถวไปนักเรียนคนอื่น: overview ของเจ้าของเดิมก็ต้องล้างด้วย
+    _mark(target, target.student_id, *inspect(target).attrs.student_id.history.deleted)
+
+
+def _payment_changed(mapper, connection, target):
+    # payment ไม่มี student_id: เก็บ invoice / enrollment ที่ผูกอยู่ (รวมค่าเดิมถ้าย้าย) ไว้หาเจ้าของทีเดียวตอน after_flush
+    session = object_session(target)
+    if session is None:
+        return
+    invoice_ids, enrollment_ids = session.info.setdefault(_PAYMENT_KEY, (set(), set()))
+    attrs = inspect(target).attrs
+    invoice_ids.update(i for i in (target.invoice_id, *attrs.invoice_id.history.deleted) if i is not None)
+    enrollment_ids.update(i for i in (target.enrollment_id, *attrs.enrollment_id.history.deleted) if i is not None)
+
+
+def _name_changed(mapper, connection, target):
+    # ชื่อคอร์ส/ข้อสอบแสดงใน overview ของหลายคน: ล้างทั้งหมด (เปลี่ยนไม่บ่อย)
+    _mark(target, _ALL)
+
+
+for _model in (models.Student, models.Enrollment, models.Invoice, models.StudentExam):
+    for _event in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event, _student_id_changed)
+for _event in ("after_insert", "after_update", "after_delete"):
+    event.listen(models.Payment, _event, _payment_changed)
+event.listen(models.Course, "after_update", _name_changed)
+event.listen(models.Exam, "after_update", _name_changed)
+
+
+@event.listens_for(Session, "after_flush")
+def _resolve_payment_students(session, flush_context):
+    pending = session.info.pop(_PAYMENT_KEY, None)
+    if not pending:
+        return
+    invoice_ids, enrollment_ids = pending
+    queries = []
+    if invoice_ids:
+        queries.append(select(models.Invoice.student_id).where(models.Invoice.invoice_id.in_(invoice_ids)))
+    if enrollment_ids:
+        queries.append(select(models.Enrollment.student_id).where(models.Enrollment.enrollment_id.in_(enrollment_ids)))
+    if not queries:
+        return
+    student_ids = session.connection().execute(union(*queries)).scalars()
+    session.info.setdefault(_DIRTY_KEY, set()).update(sid for sid in student_ids if sid is not None)
+
+
+@event.listens_for(Session, "after_commit")
+def _clear_after_commit(session):
+    student_ids = session.info.pop(_DIRTY_KEY, None)
+    if not student_ids:
+        return
+    if _ALL in student_ids:
+        overview_cache.clear()
+        return
+    for student_id in student_ids:
+        overview_cache.pop(student_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_DIRTY_KEY, None)
+    session.info.pop(_PAYMENT_KEY, None)
@@ -0,0 +1,374 @@
+# app/utils/student_search.py
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+from sqlalchemy import DDL, case, event, func, literal, literal_column, or_, select, text
+from sqlalchemy.orm import Session, object_session
+
+from app.core.config import settings
+from app.models import models
+
+Student = models.Student
+
+_PENDING_KEY = "student_search_pending"
+_FIELDS = ("first_name", "last_name", "email", "line_id")
+
+# ----------------- normalize -----------------
+
+_PHONE_INTL = re.compile(r"^660?(\d{8,9})$")
+
+
+def normalize_phone(value) -> str:
+    """Digits only, with +66 / 66(0) turned into the local 0 prefix (+66 81-234-5678 -> 0812345678)."""
+    digits = re.sub(r"\D", "", value or "")
+    return _PHONE_INTL.sub(r"0\1", digits)
+
+
+def normalize_text(value) -> str:
+    # lower() ไม่ใช่ casefold(): ให้ตรงกับ lower(normalize(..., NFKC)) ฝั่ง Postgres (ß ไม่กลายเป็น ss)
+    return unicodedata.normalize("NFKC", value or "").lower().strip()
+
+
+def _tokens(value: str):
+    return [token for token in re.split(r"[\s@._\-+]+", normalize_text(value)) if token]
+
+
+def _document_tokens(row: dict):
+    # ชื่อ: ทั้งค่าเต็มและแต่ละคำ / อีเมล: ค่าเต็มและส่วนหน้า @ (ไม่เก็บโดเมนที่ซ้ำกันทั้งตาราง) / LINE id: ค่าเต็มและแต่ละส่วน
+    tokens = set()
+    for field in ("first_name", "last_name", "line_id"):
+        value = normalize_text(row.get(field))
+        if value:
+            tokens.add(value)
+            tokens.update(_tokens(value))
+    email = normalize_text(row.get("email"))
+    if email:
+        tokens.add(email)
+        tokens.update(_tokens(email.split("@", 1)[0]))
+    return sorted(tokens)
+
+
+def _grams(token: str):
+    # trigram แบบเดียวกับ pg_trgm: เติมช่องว่างหน้า 2 หลัง 1
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _digit_grams(digits: str):
+    return {digits[i:i + 3] for i in range(len(digits) - 2)}
+
+
+def _phone_query(q: str):
+    # ถือว่าเป็นการค้นเบอร์เมื่อมีตัวเลข >= 3 ตัว และไม่มีตัวอักษร
+    if re.search(r"[^\d\s()+\-.]", q):
+        return None
+    digits = normalize_phone(q)
+    return digits if len(digits) >= 3 else None
+
+
+# ----------------- Postgres: pg_trgm + tsvector -----------------
+
+# เอกสารและคำค้นใช้ normalize แบบเดียวกันใน SQL (ต้องใช้ Postgres 13+):
+# lower() ของ Python กับ Postgres ให้ผลต่างกันบางตัวอักษร (เช่น İ) และ lower() อย่างเดียวไม่แปลงอักษรเต็มความกว้าง
+NORMALIZE_SQL = "lower(normalize({}, NFKC))"
+# expression ต้องตรงกับ index ทุกตัวอักษร planner จึงจะใช้ index ได้
+DOCUMENT_SQL = NORMALIZE_SQL.format(
+    "coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' "
+    "|| coalesce(email, '') || ' ' || coalesce(line_id, '')"
+)
+TSVECTOR_SQL = f"to_tsvector('simple'::regconfig, {DOCUMENT_SQL})"
+PHONE_SQL = r"regexp_replace(regexp_replace(coalesce(phone, ''), '\D', '', 'g'), '^660?(\d{8,9})$', '0\1')"
+
+INDEX_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_student_search_nfkc_trgm ON student USING gin (({DOCUMENT_SQL}) gin_trgm_ops)",
+    f"CREATE INDEX IF NOT EXISTS ix_student_search_nfkc_tsv ON student USING gin ({TSVECTOR_SQL})",
+    f"CREATE INDEX IF NOT EXISTS ix_student_phone_trgm ON student USING gin (({PHONE_SQL}) gin_trgm_ops)",
+]
+
+for _statement in INDEX_DDL:
+    event.listen(Student.__table__, "after_create", DDL(_statement.replace("%", "%%")).execute_if(dialect="postgresql"))
+
+
+def create_indexes(connection):
+    """Create the search indexes on an existing Postgres database (idempotent)."""
+    for statement in INDEX_DDL:
+        connection.execute(text(statement))
+
+
+def _search_postgres(db: Session, q: str, limit: int):
+    document = literal_column(DOCUMENT_SQL)
+    tsvector = literal_column(TSVECTOR_SQL)
+    phone = literal_column(PHONE_SQL)
+    # threshold ของ <% ใช้เฉพาะใน transaction นี้ / คำค้น normalize ด้วย expression เดียวกับเอกสารใน round trip เดียวกัน
+    needle = db.execute(
+        text(f"SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true), {NORMALIZE_SQL.format(':q')}"),
+        {"threshold": str(settings.STUDENT_SEARCH_MIN_SIMILARITY), "q": q},
+    ).one()[1].strip()
+
+    conditions = [literal(needle).op("<%")(document)]
+    score = func.word_similarity(needle, document) * 0.5
+    words = [re.sub(r"[&|!():*<>'\\]", "", token) for token in needle.split()]
+    words = [word for word in words if word]
+    if words:
+        tsquery = func.to_tsquery(literal_column("'simple'::regconfig"), " & ".join(f"{word}:*" for word in words))
+        conditions.append(tsvector.op("@@")(tsquery))
+        score = score + case((tsvector.op("@@")(tsquery), 1.0), else_=0.0)
+    digits = _phone_query(q)
+    if digits:
+        conditions.append(phone.like(f"%{digits}%"))
+        score = score + case(
+            (phone == digits, 3.0),
+            (phone.like(f"%{digits}%"), 2.0 + len(digits) / func.greatest(func.length(phone), 1)),
+            else_=0.0,
+        )
+
+    rows = db.execute(
+        select(Student.student_id, *(getattr(Student, field) for field in _FIELDS), Student.phone, score.label("score"))
+        .where(or_(*conditions))
+        .order_by(score.desc(), Student.student_id)
+        .limit(limit)
+    ).mappings().all()
+    return [{**row, "score": round(float(row["score"]), 4)} for row in rows]
+
+
+# ----------------- SQLite/dev: n-gram index ใน memory -----------------
+
+class NGramIndex:
+    """In-memory trigram + sorted-token index over students, for databases without pg_trgm."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self.loaded = False
+        self.rows = {}  # student_id -> dict ของข้อมูลที่แสดงผล
+        self.doc_tokens = {}  # student_id -> tokens
+        self.doc_phones = {}  # student_id -> เบอร์ที่ normalize แล้ว
+        self.grams = defaultdict(set)  # trigram -> {student_id}
+        self.phone_grams = defaultdict(set)  # trigram ของตัวเลข -> {student_id}
+        self.sorted_tokens = []  # [(token, student_id)] สำหรับค้นแบบ prefix ด้วย bisect
+
+    def load(self, db: Session):
+        rows = db.execute(select(Student.student_id, *(getattr(Student, field) for field in _FIELDS), Student.phone)).mappings().all()
+        # สร้าง index ใหม่นอก lock แล้วสลับเข้าไปทีเดียว การค้นระหว่างนั้นยังใช้ของเดิมได้
+        fresh = NGramIndex()
+        for row in rows:
+            fresh._add(dict(row), sort=False)
+        fresh.sorted_tokens.sort()
+        with self._lock:
+            for name in ("rows", "doc_tokens", "doc_phones", "grams", "phone_grams", "sorted_tokens"):
+                setattr(self, name, getattr(fresh, name))
+            self.loaded = True
+
+    def ensure_loaded(self, db: Session):
+        if not self.loaded:
+            with self._load_lock:
+                if not self.loaded:
+                    self.load(db)
+
+    def _add(self, row: dict, sort: bool = True):
+        student_id = row["student_id"]
+        tokens = _document_tokens(row)
+        phone = normalize_phone(row.get("phone"))
+        self.rows[student_id] = row
+        self.doc_tokens[student_id] = tokens
+        self.doc_phones[student_id] = phone
+        for gram in set().union(*map(_grams, tokens)):
+            self.grams[gram].add(student_id)
+        for token in tokens:
+            if sort:
+                bisect.insort(self.sorted_tokens, (token, student_id))
+            else:
+                self.sorted_tokens.append((token, student_id))
+        for gram in _digit_grams(phone):
+            self.phone_grams[gram].add(student_id)
+
+    def _remove(self, student_id: int):
+        if student_id not in self.rows:
+            return
+        del self.rows[student_id]
+        tokens = self.doc_tokens.pop(student_id)
+        for gram in set().union(*map(_grams, tokens)):
+            self.grams[gram].discard(student_id)
+        for token in tokens:
+            position = bisect.bisect_left(self.sorted_tokens, (token, student_id))
+            if position < len(self.sorted_tokens) and self.sorted_tokens[position] == (token, student_id):
+                del self.sorted_tokens[position]
+        for gram in _digit_grams(self.doc_phones.pop(student_id)):
+            self.phone_grams[gram].discard(student_id)
+
+    def apply(self, changes: dict):
+        with self._lock:
+            if not self.loaded:
+                return
+            for student_id, row in changes.items():
+                self._remove(student_id)
+                if row is not None:
+                    self._add(row)
+
+    def _prefix_range(self, word: str):
+        return (
+            bisect.bisect_left(self.sorted_tokens, (word,)),
+            bisect.bisect_left(self.sorted_tokens, (word + "\U0010ffff",)),
+        )
+
+    def _prefix_hits(self, word: str):
+        start, stop = self._prefix_range(word)
+        entries = self.sorted_tokens[start:stop]
+        hits = dict.fromkeys((student_id for _, student_id in entries), 1.0)
+        for token, student_id in entries:
+            if token != word:
+                break  # คำที่ตรงทั้งคำเรียงอยู่หน้าสุดของช่วงเสมอ
+            hits[student_id] = 1.5
+        return hits
+
+    def _word_score(self, student_id: int, word: str):
+        best = 0.0
+        for token in self.doc_tokens[student_id]:
+            if token == word:
+                return 1.5
+            if token.startswith(word):
+                best = 1.0
+        return best
+
+    def _prefix_scores(self, q: str, words: list):
+        """Every typed word must prefix some token; words are intersected from the most selective up."""
+        whole = normalize_text(q)
+        scores = self._prefix_hits(whole)  # ค่าเต็ม เช่น อีเมล / LINE id ทั้งก้อน
+        if words != [whole]:
+            ranges = sorted(((self._prefix_range(word), word) for word in words), key=lambda item: item[0][1] - item[0][0])
+            candidates = None
+            for (start, stop), word in ranges:
+                if candidates is None:
+                    candidates = self._prefix_hits(word)
+                elif stop - start <= 4 * len(candidates):
+                    hits = self._prefix_hits(word)
+                    candidates = {sid: score + hits[sid] for sid, score in candidates.items() if sid in hits}
+                else:
+                    # คำนี้กว้างมาก (เช่นตัวอักษรเดียว): ตรวจเฉพาะ candidate ที่เหลือแทนการกวาดทั้งช่วง
+                    candidates = {
+                        sid: score + word_score
+                        for sid, score in candidates.items()
+                        if (word_score := self._word_score(sid, word))
+                    }
+                if not candidates:
+                    break
+            for student_id, score in (candidates or {}).items():
+                scores[student_id] = max(scores.get(student_id, 0.0), score / len(words))
+        return scores
+
+    def _similarities(self, words: list):
+        """Trigram similarity (share of the query's grams found in the document) of likely matches.
+
+        Candidates come from the rarest grams only: a document reaching the threshold must
+        contain at least one of them. Very common grams are never scanned, and the candidate
+        set is capped, so a vague query degrades to fewer fuzzy hits instead of a full scan.
+        """
+        query_grams = sorted(set().union(*(_grams(word) for word in words)), key=lambda gram: len(self.grams.get(gram, ())))
+        needed = max(1, int(len(query_grams) * settings.STUDENT_SEARCH_MIN_SIMILARITY + 0.999999))
+        candidates = set()
+        for gram in query_grams[:len(query_grams) - needed + 1]:
+            postings = self.grams.get(gram, ())
+            if len(candidates) + len(postings) > settings.STUDENT_SEARCH_MAX_CANDIDATES:
+                break
+            candidates.update(postings)
+        postings = [self.grams.get(gram, set()) for gram in query_grams]
+        similarities = {}
+        for student_id in candidates:
+            similarity = sum(1 for posting in postings if student_id in posting) / len(query_grams)
+            if similarity >= settings.STUDENT_SEARCH_MIN_SIMILARITY:
+                similarities[student_id] = similarity
+        return similarities
+
+    def search(self, q: str, limit: int):
+        scores = {}
+        with self._lock:
+            words = _tokens(q)
+            digits = _phone_query(q)
+            if words:
+                scores = self._prefix_scores(q, words)
+                # fuzzy (กันพิมพ์ผิด) เฉพาะเมื่อ prefix ได้ไม่ครบ limit และไม่ใช่การค้นเบอร์
+                if not digits and len(scores) < limit:
+                    for student_id, similarity in self._similarities(words).items():
+                        scores[student_id] = scores.get(student_id, 0.0) + similarity * 0.5
+
+            if digits:
+                candidates = None
+                for gram in _digit_grams(digits):
+                    postings = self.phone_grams.get(gram, set())
+                    candidates = set(postings) if candidates is None else candidates & postings
+                if candidates is None:  # ตัวเลขสั้นกว่า 3 ตัว
+                    candidates = ()
+                for student_id in candidates:
+                    phone = self.doc_phones[student_id]
+                    if phone == digits:
+                        scores[student_id] = scores.get(student_id, 0.0) + 3.0
+                    elif digits in phone:
+                        scores[student_id] = scores.get(student_id, 0.0) + 2.0 + len(digits) / len(phone)
+
+            best = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+            return [{**self.rows[student_id], "score": round(score, 4)} for student_id, score in best]
+
+    def get_stats(self):
+        with self._lock:
+            return {"loaded": self.loaded, "students": len(self.rows), "grams": len(self.grams), "tokens": len(self.sorted_tokens)}
+
+
+index = NGramIndex()
+
+
+def search(db: Session, q: str, limit: int = None):
+    """Ranked student matches by name/email/LINE id (prefix + fuzzy) and normalized phone number."""
+    limit = limit or settings.STUDENT_SEARCH_LIMIT
+    if db.get_bind().dialect.name == "postgresql":
+        return _search_postgres(db, q, limit)
+    index.ensure_loaded(db)
+    return index.search(q, limit)
+
+
+def get_stats():
+    return index.get_stats()
+
+
+# ----------------- อัปเดต n-gram index หลัง commit ที่แก้ student -----------------
+
+def _pending(target):
+    session = object_session(target)
+    return session.info.setdefault(_PENDING_KEY, {}) if session is not None else None
+
+
+def _student_changed(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending[target.student_id] = {
+            "student_id": target.student_id,
+            **{field: getattr(target, field) for field in _FIELDS},
+            "phone": target.phone,
+        }
+
+
+def _student_deleted(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending[target.student_id] = None
+
+
+event.listen(Student, "after_insert", _student_changed)
+event.listen(Student, "after_update", _student_changed)
+event.listen(Student, "after_delete", _student_deleted)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session):
+    changes = session.info.pop(_PENDING_KEY, None)
+    if changes:
+        index.apply(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
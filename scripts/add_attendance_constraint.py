@@ -0,0 +1,67 @@
+# scripts/add_attendance_constraint.py
+# เพิ่ม unique (course_id, date, student_id) ให้ตาราง attendance บนฐานข้อมูลที่มีอยู่แล้ว
+# (ฐานข้อมูลใหม่ได้ constraint อัตโนมัติตอน create_all)
+# ก่อนเพิ่ม constraint จะลบการเช็คชื่อซ้ำของคาบเดียวกัน โดยเก็บแถวล่าสุดไว้ แล้วสร้าง attendance_counter ใหม่
+# ระหว่างนี้ bulk_check_in ใช้ทาง delete-then-insert ไปก่อน แล้วเปลี่ยนเป็น ON CONFLICT เองเมื่อพบ constraint
+#
+#   python scripts/add_attendance_constraint.py [--dry-run]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, func, select, text
+
+from app.database import SessionLocal, engine
+from app.models import models
+from app.utils import attendance
+from app.utils.sql import upsert_insert
+
+Attendance = models.Attendance
+
+
+def main(dry_run: bool):
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        if upsert_insert(connection, Attendance) is None:
+            print(f"{connection.dialect.name}: ไม่รองรับ ON CONFLICT ใช้ทาง delete-then-insert ต่อไป")
+            return
+        if connection.dialect.name == "postgresql":
+            # กันการเช็คชื่อใหม่สร้างแถวซ้ำระหว่างลบกับเพิ่ม constraint (อ่านได้ตามปกติ)
+            connection.execute(text("LOCK TABLE attendance IN SHARE ROW EXCLUSIVE MODE"))
+        if attendance.session_constraint_exists(connection):
+            print(f"{attendance.SESSION_CONSTRAINT} already exists")
+            return
+        count = connection.execute(select(func.count()).select_from(Attendance).where(attendance.duplicate_marks())).scalar_one()
+        print(f"duplicate attendance rows: {count}")
+        if dry_run:
+            return
+        connection.execute(delete(Attendance).where(attendance.duplicate_marks()))
+        if connection.dialect.name == "postgresql":
+            connection.execute(text(
+                f"ALTER TABLE attendance ADD CONSTRAINT {attendance.SESSION_CONSTRAINT} "
+                "UNIQUE (course_id, date, student_id)"
+            ))
+        else:
+            # SQLite เพิ่ม constraint ให้ตารางเดิมไม่ได้: unique index ใช้กับ ON CONFLICT ได้เหมือนกัน
+            connection.execute(text(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS {attendance.SESSION_CONSTRAINT} "
+                "ON attendance (course_id, date, student_id)"
+            ))
+    if count:
+        # แถวซ้ำเคยถูกนับเข้าตัวนับ: สร้างใหม่จากข้อมูลที่เหลือ
+        db = SessionLocal()
+        try:
+            attendance.rebuild_counters(db)
+        finally:
+            db.close()
+    print(f"removed {count} duplicates and added {attendance.SESSION_CONSTRAINT} in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true", help="นับแถวซ้ำอย่างเดียว")
+    args = parser.parse_args()
+    main(args.dry_run)
@@ -0,0 +1,52 @@
+# scripts/add_enrollment_active_index.py
+# เพิ่ม partial unique index (student_id, course_id) WHERE status = 'active' ให้ตาราง enrollment ที่มีอยู่แล้ว
+# (ฐานข้อมูลใหม่ได้ index อัตโนมัติตอน create_all)
+# enrollment ที่ active ซ้ำมี invoice ผูกอยู่ จึงไม่ลบให้อัตโนมัติ: script จะแสดงรายการให้แก้เองก่อน
+#
+#   python scripts/add_enrollment_active_index.py [--dry-run]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select, text
+
+from app.database import engine
+from app.models import models
+from app.utils.enrollment_service import ACTIVE_ENROLLMENT_INDEX
+
+Enrollment = models.Enrollment
+
+
+def main(dry_run: bool):
+    started = time.perf_counter()
+    index = next(index for index in Enrollment.__table__.indexes if index.name == ACTIVE_ENROLLMENT_INDEX)
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            # กันการลงทะเบียนใหม่ระหว่างตรวจแถวซ้ำกับสร้าง index (อ่านได้ตามปกติ)
+            connection.execute(text("LOCK TABLE enrollment IN SHARE ROW EXCLUSIVE MODE"))
+        duplicates = connection.execute(
+            select(Enrollment.student_id, Enrollment.course_id, func.count())
+            .where(Enrollment.status == "active")
+            .group_by(Enrollment.student_id, Enrollment.course_id)
+            .having(func.count() > 1)
+        ).all()
+        print(f"duplicate active enrollments: {len(duplicates)}")
+        for student_id, course_id, count in duplicates:
+            print(f"  student_id={student_id} course_id={course_id} rows={count}")
+        if dry_run:
+            return
+        if duplicates:
+            print("set status of the extra rows to something other than 'active', then run again")
+            sys.exit(1)
+        index.create(connection, checkfirst=True)
+    print(f"{ACTIVE_ENROLLMENT_INDEX} ready in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true", help="แสดงแถวซ้ำอย่างเดียว")
+    args = parser.parse_args()
+    main(args.dry_run)
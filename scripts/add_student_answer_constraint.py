@@ -0,0 +1,65 @@
+# scripts/add_student_answer_constraint.py
+# เพิ่ม unique (student_exam_id, question_id) ให้ตาราง student_answers บนฐานข้อมูลที่มีอยู่แล้ว
+# (ฐานข้อมูลใหม่ได้ constraint อัตโนมัติตอน create_all)
+# ก่อนเพิ่ม constraint จะลบคำตอบที่ส่งซ้ำ โดยเก็บแถวล่าสุดของแต่ละข้อไว้
+# ระหว่างนี้ upsert_answers ใช้ทาง select-then-update ไปก่อน แล้วเปลี่ยนเป็น ON CONFLICT เองเมื่อพบ constraint
+#
+#   python scripts/add_student_answer_constraint.py [--dry-run]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, func, select, text
+
+from app.database import engine
+from app.models import models
+from app.utils import grading
+from app.utils.sql import upsert_insert
+
+Answer = models.StudentAnswer
+
+
+def duplicates_condition():
+    # แถวที่มีคำตอบข้อเดียวกันที่ใหม่กว่า (เงื่อนไขเดียวกับที่ตอนคิดคะแนนใช้ข้าม)
+    return grading.superseded(Answer)
+
+
+def main(dry_run: bool):
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        if upsert_insert(connection, Answer) is None:
+            print(f"{connection.dialect.name}: ไม่รองรับ ON CONFLICT ใช้ทาง select-then-update ต่อไป")
+            return
+        if connection.dialect.name == "postgresql":
+            # กัน submit ใหม่สร้างแถวซ้ำระหว่างลบกับเพิ่ม constraint (อ่านได้ตามปกติ)
+            connection.execute(text("LOCK TABLE student_answers IN SHARE ROW EXCLUSIVE MODE"))
+        if grading.answer_constraint_exists(connection):
+            print(f"{grading.ANSWER_CONSTRAINT} already exists")
+            return
+        count = connection.execute(select(func.count()).select_from(Answer).where(duplicates_condition())).scalar_one()
+        print(f"duplicate answers: {count}")
+        if dry_run:
+            return
+        connection.execute(delete(Answer).where(duplicates_condition()))
+        if connection.dialect.name == "postgresql":
+            connection.execute(text(
+                f"ALTER TABLE student_answers ADD CONSTRAINT {grading.ANSWER_CONSTRAINT} "
+                "UNIQUE (student_exam_id, question_id)"
+            ))
+        else:
+            # SQLite เพิ่ม constraint ให้ตารางเดิมไม่ได้: unique index ใช้กับ ON CONFLICT ได้เหมือนกัน
+            connection.execute(text(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS {grading.ANSWER_CONSTRAINT} "
+                "ON student_answers (student_exam_id, question_id)"
+            ))
+    print(f"removed {count} duplicates and added {grading.ANSWER_CONSTRAINT} in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true", help="นับแถวซ้ำอย่างเดียว")
+    args = parser.parse_args()
+    main(args.dry_run)
@@ -0,0 +1,36 @@
+# scripts/backfill_finance_rollup.py
+# สร้างตาราง finance_daily_rollup ใหม่จากประวัติ income/expense ทั้งหมด (หรือเฉพาะช่วงวันที่)
+#
+#   python scripts/backfill_finance_rollup.py
+#   python scripts/backfill_finance_rollup.py --start 2025-01-01 --end 2025-03-31
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal, engine
+from app.models import models
+from app.utils import finance_rollup
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--start", type=date.fromisoformat, default=None)
+    parser.add_argument("--end", type=date.fromisoformat, default=None)
+    args = parser.parse_args()
+
+    models.FinanceDailyRollup.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        counts = finance_rollup.backfill(db, start=args.start, end=args.end)
+        print(f"rollup rows: income={counts['income']} expense={counts['expense']} in {time.perf_counter() - started:.2f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
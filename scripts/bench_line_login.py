@@ -0,0 +1,71 @@
+# scripts/bench_line_login.py
+# เปรียบเทียบ throughput ของการ verify LINE id_token แบบเดิม (requests.post ใน async handler)
+# กับ AsyncLineClient (connection pool + keep-alive) โดยยิงไปที่ fake LINE server
+#   python scripts/bench_line_login.py --logins 200 --concurrency 20 --latency-ms 50
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def start_fake_server(port: int, latency_ms: int):
+    import uvicorn
+    from fake_line_server import app
+
+    app.state.latency_ms = latency_ms
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_logins(verify, logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            assert await verify(f"token-{i}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(logins)))
+    return logins / (time.perf_counter() - started)
+
+
+async def main(args):
+    import requests
+    from app.core.config import settings
+    from app.utils.line_client import async_line_client
+
+    url = f"{settings.LINE_API_BASE_URL}/oauth2/v2.1/verify"
+
+    # แบบเดิม: requests.post แบบ blocking ภายใน async def (บล็อก event loop)
+    async def verify_blocking(id_token):
+        resp = requests.post(url, data={"id_token": id_token, "client_id": settings.LINE_LOGIN_CHANNEL_ID})
+        return resp.json() if resp.status_code == 200 else None
+
+    before = await run_logins(verify_blocking, args.logins, args.concurrency)
+    after = await run_logins(async_line_client.verify_id_token, args.logins, args.concurrency)
+    await async_line_client.aclose()
+
+    print(f"logins={args.logins} concurrency={args.concurrency} latency={args.latency_ms}ms")
+    print(f"before (blocking requests.post): {before:8.1f} logins/s")
+    print(f"after  (AsyncLineClient):        {after:8.1f} logins/s  ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+
+    os.environ["LINE_API_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+    start_fake_server(args.port, args.latency_ms)
+    asyncio.run(main(args))
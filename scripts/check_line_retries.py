@@ -0,0 +1,61 @@
+# scripts/check_line_retries.py
+# ตรวจ retry ของ LineClient กับ fake LINE server ที่สุ่ม error และสุ่ม "ส่งแล้วแต่คำตอบหาย"
+# ไม่มีข้อความไหนถึงผู้รับซ้ำ (X-Line-Retry-Key) และข้อความที่ไม่ถึงต้องถูกรายงานว่าส่งไม่สำเร็จ
+#   python scripts/check_line_retries.py --sends 200 --error-rate 0.2 --lost-response-rate 0.3
+import argparse
+import asyncio
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_line_login import start_fake_server
+
+
+async def main(args):
+    from fake_line_server import app
+    from app.utils.line_client import async_line_client, delivered, line_client
+
+    app.state.error_rate = args.error_rate
+    app.state.lost_response_rate = args.lost_response_rate
+
+    async def push(i):
+        return await async_line_client.push_message(f"U{i}", [{"type": "text", "text": f"push {i}"}])
+
+    async def multicast(i):
+        return await async_line_client.multicast([f"U{i}a", f"U{i}b"], [{"type": "text", "text": f"multicast {i}"}])
+
+    responses = await asyncio.gather(*(push(i) for i in range(args.sends)), *(multicast(i) for i in range(args.sends)))
+    responses += [
+        await asyncio.to_thread(line_client.push_message, f"S{i}", [{"type": "text", "text": f"sync {i}"}])
+        for i in range(args.sends // 10)
+    ]
+    await async_line_client.aclose()
+    line_client.close()
+
+    texts = Counter(message["messages"][0]["text"] for message in app.state.messages)
+    expected = 2 * args.sends + args.sends // 10
+    duplicates = {text: count for text, count in texts.items() if count > 1}
+    failed = [response.status_code for response in responses if not delivered(response)]
+    print(f"calls={len(responses)} distinct_delivered={len(texts)} duplicates={len(duplicates)} not_delivered={len(failed)}")
+    print("status codes:", dict(Counter(response.status_code for response in responses)))
+    # retry หมดแล้วยังไม่ถึง = รายงาน failed ได้ แต่ห้ามหายเงียบ ๆ
+    ok = not duplicates and len(texts) + len(failed) >= expected
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sends", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--lost-response-rate", type=float, default=0.3)
+    parser.add_argument("--port", type=int, default=8098)
+    args = parser.parse_args()
+
+    os.environ["LINE_API_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ.setdefault("LINE_API_BACKOFF_BASE", "0.01")
+    os.environ.setdefault("LINE_API_MAX_RETRIES", "6")
+    start_fake_server(args.port, 0)
+    sys.exit(asyncio.run(main(args)))
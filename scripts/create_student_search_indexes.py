@@ -0,0 +1,27 @@
+# scripts/create_student_search_indexes.py
+# สร้าง pg_trgm extension และ index สำหรับ /students/search บนฐานข้อมูล Postgres ที่มีอยู่แล้ว
+# (ฐานข้อมูลใหม่ได้ index อัตโนมัติตอน create_all)
+#
+#   python scripts/create_student_search_indexes.py
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import engine
+from app.utils import student_search
+
+
+def main():
+    if engine.dialect.name != "postgresql":
+        print(f"{engine.dialect.name}: ไม่ต้องสร้าง index (ใช้ n-gram index ใน memory แทน)")
+        return
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        student_search.create_indexes(connection)
+    print(f"student search indexes ready in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
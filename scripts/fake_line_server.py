@@ -0,0 +1,133 @@
+# scripts/fake_line_server.py
+# LINE API ปลอมสำหรับทดสอบ/benchmark บนเครื่อง
+#   python scripts/fake_line_server.py --port 8099 --latency-ms 80
+# แล้วตั้ง LINE_API_BASE_URL=http://127.0.0.1:8099
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+import uuid
+
+import ecdsa
+from fastapi import FastAPI, Request
+from jose import jwk, jwt
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Fake LINE API")
+
+# กุญแจ ES256 สำหรับออก id_token ปลอม (ทดสอบ LINE_ID_TOKEN_VERIFY_MODE=local)
+FAKE_KID = "fake-es256"
+_signing_key = ecdsa.SigningKey.generate(curve=ecdsa.NIST256p).to_pem().decode()
+
+app.state.latency_ms = 0
+app.state.error_rate = 0.0
+app.state.lost_response_rate = 0.0
+app.state.messages = []
+app.state.accepted_retry_keys = {}
+
+
+async def _simulate():
+    if app.state.latency_ms:
+        await asyncio.sleep(app.state.latency_ms / 1000)
+    if app.state.error_rate and random.random() < app.state.error_rate:
+        status = random.choice([429, 500, 503])
+        headers = {"Retry-After": "0"} if status == 429 else {}
+        return JSONResponse({"message": "fake error"}, status_code=status, headers=headers)
+    return None
+
+
+@app.post("/oauth2/v2.1/verify")
+async def verify(request: Request):
+    error = await _simulate()
+    if error:
+        return error
+    form = await request.form()
+    id_token = form.get("id_token", "")
+    if not id_token or id_token == "invalid":
+        return JSONResponse({"error": "invalid_request", "error_description": "Invalid IdToken."}, status_code=400)
+    now = int(time.time())
+    return {
+        "iss": "https://access.line.me",
+        "sub": "U" + hashlib.sha256(id_token.encode()).hexdigest()[:32],
+        "aud": form.get("client_id"),
+        "exp": now + 3600,
+        "iat": now,
+        "name": "Fake User",
+    }
+
+
+def _accept(request: Request, to: list, messages: list):
+    # เลียนแบบ X-Line-Retry-Key ของ LINE: key ที่รับไปแล้วตอบ 409 และไม่ส่งซ้ำ
+    retry_key = request.headers.get("X-Line-Retry-Key")
+    if retry_key in app.state.accepted_retry_keys:
+        return JSONResponse(
+            {"message": "The retry key is already accepted"}, status_code=409,
+            headers={"X-Line-Accepted-Request-Id": app.state.accepted_retry_keys[retry_key]},
+        )
+    request_id = uuid.uuid4().hex
+    if retry_key:
+        app.state.accepted_retry_keys[retry_key] = request_id
+    app.state.messages.append({"to": to, "messages": messages, "retry_key": retry_key})
+    if app.state.lost_response_rate and random.random() < app.state.lost_response_rate:
+        # ส่งแล้วแต่ client ไม่ได้รับคำตอบ (เช่น read timeout): กรณีที่ retry อาจส่งซ้ำ
+        return JSONResponse({"message": "fake lost response"}, status_code=503)
+    return JSONResponse({}, headers={"X-Line-Request-Id": request_id})
+
+
+@app.post("/v2/bot/message/push")
+async def push(request: Request):
+    error = await _simulate()
+    if error:
+        return error
+    body = await request.json()
+    return _accept(request, [body.get("to")], body.get("messages", []))
+
+
+@app.post("/v2/bot/message/multicast")
+async def multicast(request: Request):
+    error = await _simulate()
+    if error:
+        return error
+    body = await request.json()
+    if len(body.get("to", [])) > 500:
+        return JSONResponse({"message": "Size must be between 1 and 500"}, status_code=400)
+    return _accept(request, body.get("to", []), body.get("messages", []))
+
+
+@app.get("/oauth2/v2.1/certs")
+def certs():
+    public_key = jwk.construct(_signing_key, algorithm="ES256").public_key().to_dict()
+    return {"keys": [{**public_key, "kid": FAKE_KID, "use": "sig"}]}
+
+
+@app.get("/_fake/id_token")
+def issue_id_token(sub: str = "Ufake", client_id: str = "", ttl: int = 3600):
+    now = int(time.time())
+    claims = {"iss": "https://access.line.me", "sub": sub, "aud": client_id, "iat": now, "exp": now + ttl}
+    return {"id_token": jwt.encode(claims, _signing_key, algorithm="ES256", headers={"kid": FAKE_KID})}
+
+
+@app.get("/_fake/messages")
+def sent_messages():
+    return app.state.messages
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--lost-response-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    app.state.latency_ms = args.latency_ms
+    app.state.error_rate = args.error_rate
+    app.state.lost_response_rate = args.lost_response_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# scripts/load_test_db.py
+# วัด requests/sec ของ route ที่ใช้ DB ในแต่ละโหมด
+#   blocking   : async def + Session แบบ sync (บล็อก event loop แบบ route เดิม)
+#   threadpool : def + Session แบบ sync (FastAPI รันใน threadpool)
+#
+#   DB_POOL_SIZE=10 python scripts/load_test_db.py --requests 2000 --concurrency 50
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import uvicorn
+from fastapi import Depends, FastAPI
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.database import SQLALCHEMY_DATABASE_URL, get_db
+
+DEFAULT_QUERY = "SELECT pg_sleep(0.005)" if SQLALCHEMY_DATABASE_URL.startswith("postgres") else "SELECT count(*) FROM student"
+
+
+def build_app(query: str):
+    app = FastAPI()
+    statement = text(query)
+
+    @app.get("/blocking")
+    async def blocking(db: Session = Depends(get_db)):
+        db.execute(statement).all()
+        return {"ok": True}
+
+    @app.get("/threadpool")
+    def threadpool(db: Session = Depends(get_db)):
+        db.execute(statement).all()
+        return {"ok": True}
+
+    return app
+
+
+async def hammer(base_url: str, path: str, total: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                response = await client.get(path)
+                if response.status_code != 200:
+                    errors += 1
+
+        await client.get(path)  # warm-up
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+    return total / elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8098)
+    parser.add_argument("--query", default=DEFAULT_QUERY)
+    args = parser.parse_args()
+
+    server = uvicorn.Server(uvicorn.Config(build_app(args.query), host="127.0.0.1", port=args.port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    modes = ["blocking", "threadpool"]
+    print(f"query={args.query!r} requests={args.requests} concurrency={args.concurrency}")
+    for mode in modes:
+        rps, errors = asyncio.run(hammer(base_url, f"/{mode}", args.requests, args.concurrency))
+        print(f"{mode:<11} {rps:8.1f} req/s  errors={errors}")
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+# scripts/rebuild_attendance_counters.py
+# สร้างตาราง attendance_counter ใหม่จากตาราง attendance (ทั้งหมด หรือเฉพาะคอร์ส)
+#
+#   python scripts/rebuild_attendance_counters.py
+#   python scripts/rebuild_attendance_counters.py --course-id 12
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal, engine
+from app.models import models
+from app.utils import attendance
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--course-id", type=int, default=None)
+    args = parser.parse_args()
+
+    models.AttendanceCounter.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        rows = attendance.rebuild_counters(db, course_id=args.course_id)
+        print(f"attendance counters: {rows} rows in {time.perf_counter() - started:.2f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# scripts/reconcile_payments.py
+# reconcile payment ที่ยังไม่จับคู่กับ invoice ทั้งหมด (ตั้ง cron ให้รันทุกคืน)
+#
+#   python scripts/reconcile_payments.py           # payment ที่ pending/unmatched
+#   python scripts/reconcile_payments.py --full    # + คำนวณสถานะ invoice ทุกใบใหม่จากยอดที่ชำระ
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.utils import finance_rollup  # noqa: F401  (ลง event ให้ income ใหม่เข้า rollup)
+from app.utils import reconciliation
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", action="store_true", help="recompute every invoice status afterwards")
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = reconciliation.run_batch(db, batch_size=args.batch_size)
+        if args.full:
+            report["invoice_statuses_recomputed"] = reconciliation.recompute_invoice_statuses(db)
+        print(json.dumps(report, indent=2))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# tests/conftest.py
+# ชุดทดสอบรันบน SQLite ไฟล์ชั่วคราว (ตั้ง TEST_DATABASE_URL เพื่อรันกับ Postgres)
+#
+#   python -m pytest -q
+import os
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+_TMP = tempfile.mkdtemp(prefix="english-mania-tests-")
+
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL", f"sqlite:///{os.path.join(_TMP, 'test.db')}")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+for _name in ("LINE_LOGIN_CHANNEL_ID", "LINE_LOGIN_CHANNEL_SECRET", "LINE_MESSAGING_CHANNEL_ID",
+              "LINE_MESSAGING_CHANNEL_SECRET", "LINE_CHANNEL_ACCESS_TOKEN"):
+    os.environ.setdefault(_name, "test")
+os.environ["IMPORT_UPLOAD_DIR"] = os.path.join(_TMP, "imports")
+os.environ["AUTOSAVE_JOURNAL_DIR"] = os.path.join(_TMP, "autosave")
+os.environ["INVOICE_SCHEDULER_ENABLED"] = "false"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+from jose import jwt
+from sqlalchemy import text
+
+from app.core import auth_cache
+from app.database import SessionLocal, engine
+from app.main import app
+from app.models import models
+from app.utils import attendance, course_catalog, course_prices, exam_cache, grading, scheduling, student_overview, student_search
+
+
+def _reset_caches():
+    # cache ระดับ process ต้องไม่ข้ามระหว่าง test (ฐานข้อมูลสร้างใหม่ทุกครั้ง id จึงซ้ำได้)
+    for cache in (
+        course_prices.price_cache,
+        attendance.roster_cache,
+        student_overview.overview_cache,
+        course_catalog.catalog_cache,
+        exam_cache.detail_cache,
+        grading._keys,
+        auth_cache.principal_cache,
+    ):
+        cache.clear()
+    exam_cache._versions.clear()
+    grading._answer_constraint.update(ready=False, checked_at=None)
+    attendance._session_constraint.update(ready=False, checked_at=None)
+    scheduling.index.loaded_at = None
+    student_search.index.loaded = False
+
+
+@pytest.fixture
+def db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    _reset_caches()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client(db):
+    # ไม่ใช้ context manager: ไม่ต้องการ startup (worker import, autosave, scheduler) ใน test
+    return TestClient(app)
+
+
+@pytest.fixture
+def admin_headers(db):
+    db.add(models.User(username="admin", role=models.Role(role_name="admin")))
+    db.commit()
+    token = jwt.encode({"sub": "admin", "role": "admin"}, os.environ["SECRET_KEY"], algorithm=os.environ["ALGORITHM"])
+    return {"Authorization": f"Bearer {token}"}
+
+
+def drop_unique_constraint(db, table: str, name: str):
+    # จำลองฐานข้อมูลเดิมที่สร้างก่อนมี unique constraint (create_all ไม่เพิ่มให้ตารางที่มีอยู่แล้ว)
+    if engine.dialect.name == "postgresql":
+        db.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT {name}"))
+    else:
+        ddl = db.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :table"), {"table": table}).scalar()
+        start = ddl.index(f", \n\tCONSTRAINT {name}")
+        ddl = ddl[:start] + ddl[ddl.index(")", start) + 1:]
+        db.execute(text(f"DROP TABLE {table}"))
+        db.execute(text(ddl))
+    db.commit()
+    _reset_caches()
+
+
+# ----------------- ตัวช่วยสร้างข้อมูล -----------------
+
+def make_student(db, **fields):
+    student = models.Student(**{"first_name": "Somchai", "last_name": "Jaidee", **fields})
+    db.add(student)
+    db.commit()
+    return student
+
+
+def make_course(db, price: float = 1000.0, **fields):
+    course = models.Course(**{"name": "English A1", **fields})
+    db.add(course)
+    db.flush()
+    db.add(models.CoursePrice(course_id=course.course_id, price=price))
+    db.commit()
+    return course
+
+
+def make_enrollment(db, student, course, status: str = "active"):
+    enrollment = models.Enrollment(student_id=student.student_id, course_id=course.course_id, enroll_date=date.today(), status=status)
+    db.add(enrollment)
+    db.commit()
+    return enrollment
+
+
+def make_invoice(db, enrollment, total_amount: float, due_in_days: int = 7, status: str = "pending", invoice_date: datetime = None):
+    invoice_date = invoice_date or datetime.utcnow()
+    invoice = models.Invoice(
+        student_id=enrollment.student_id,
+        enrollment_id=enrollment.enrollment_id,
+        invoice_date=invoice_date,
+        due_date=invoice_date + timedelta(days=due_in_days),
+        total_amount=total_amount,
+        status=status,
+    )
+    db.add(invoice)
+    db.commit()
+    return invoice
+
+
+def make_payment(db, enrollment, amount: float, invoice=None, status: str = "verified", payment_date: datetime = None):
+    payment = models.Payment(
+        enrollment_id=enrollment.enrollment_id,
+        invoice_id=invoice.invoice_id if invoice is not None else None,
+        amount=amount,
+        payment_date=payment_date or datetime.utcnow(),
+        status=status,
+        payment_status="pending",
+    )
+    db.add(payment)
+    db.commit()
+    return payment
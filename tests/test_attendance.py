@@ -0,0 +1,147 @@
+from datetime import datetime
+
+import pytest
+from conftest import drop_unique_constraint, make_course, make_enrollment, make_student
+
+from app.models import models
+from app.schemas import schemas
+from app.utils import attendance
+
+SESSION = datetime(2026, 10, 5, 9, 0)
+
+
+def _mark(student, status, note=None):
+    return schemas.AttendanceMark(student_id=student.student_id, status=status, note=note)
+
+
+def _counter(db, student, course):
+    db.expire_all()
+    return db.get(models.AttendanceCounter, (student.student_id, course.course_id))
+
+
+@pytest.fixture
+def roster(db):
+    course = make_course(db)
+    students = [make_student(db, first_name=name) for name in ("Anan", "Boon", "Chai")]
+    for student in students:
+        make_enrollment(db, student, course)
+    return course, students
+
+
+def test_first_check_in_counts_one_session(db, roster):
+    course, (anan, boon, _) = roster
+    result = attendance.bulk_check_in(db, course.course_id, SESSION, [_mark(anan, "present"), _mark(boon, "late")])
+
+    assert (result["inserted"], result["updated"], result["unchanged"]) == (2, 0, 0)
+    counter = _counter(db, anan, course)
+    assert (counter.sessions, counter.present, counter.late) == (1, 1, 0)
+    counter = _counter(db, boon, course)
+    assert (counter.sessions, counter.present, counter.late) == (1, 0, 1)
+
+
+def test_resending_the_same_session_is_a_no_op(db, roster):
+    course, (anan, _, _) = roster
+    attendance.bulk_check_in(db, course.course_id, SESSION, [_mark(anan, "present")])
+    result = attendance.bulk_check_in(db, course.course_id, SESSION, [_mark(anan, "present")])
+
+    assert result["unchanged"] == 1
+    counter = _counter(db, anan, course)
+    assert (counter.sessions, counter.present) == (1, 1)
+
+
+def test_status_change_moves_counters_without_new_session(db, roster):
+    course, (anan, _, _) = roster
+    attendance.bulk_check_in(db, course.course_id, SESSION, [_mark(anan, "present")])
+    result = attendance.bulk_check_in(db, course.course_id, SESSION, [_mark(anan, "absent", "sick")])
+
+    assert result["updated"] == 1
+    counter = _counter(db, anan, course)
+    assert (counter.sessions, counter.present, counter.absent) == (1, 0, 1)
+
+
+def test_note_only_change_keeps_counters(db, roster):
+    course, (anan, _, _) = roster
+    attendance.bulk_check_in(db, course.course_id, SESSION, [_mark(anan, "late")])
+    attendance.bulk_check_in(db, course.course_id, SESSION, [_mark(anan, "late", "bus")])
+
+    counter = _counter(db, anan, course)
+    assert (counter.sessions, counter.late) == (1, 1)
+
+
+def test_default_status_fills_the_roster(db, roster):
+    course, (anan, boon, chai) = roster
+    result = attendance.bulk_check_in(db, course.course_id, SESSION, [_mark(anan, "present")], default_status="absent")
+
+    assert result["inserted"] == 3
+    assert _counter(db, chai, course).absent == 1
+    assert _counter(db, anan, course).present == 1
+
+
+def test_rejects_students_outside_the_roster(db, roster):
+    course, _ = roster
+    outsider = make_student(db, first_name="Dao")
+    with pytest.raises(attendance.AttendanceError) as error:
+        attendance.bulk_check_in(db, course.course_id, SESSION, [_mark(outsider, "present")])
+    assert error.value.status_code == 400
+    assert db.query(models.AttendanceCounter).count() == 0
+
+
+def test_rebuild_counters_matches_incremental_counts(db, roster):
+    course, (anan, boon, _) = roster
+    attendance.bulk_check_in(db, course.course_id, SESSION, [_mark(anan, "present"), _mark(boon, "late")])
+    attendance.bulk_check_in(db, course.course_id, datetime(2026, 10, 12, 9, 0), [_mark(anan, "absent"), _mark(boon, "late")])
+    attendance.bulk_check_in(db, course.course_id, SESSION, [_mark(anan, "excused")])
+    before = attendance.get_rates(db, course_id=course.course_id)
+
+    attendance.rebuild_counters(db, course.course_id)
+
+    assert attendance.get_rates(db, course_id=course.course_id) == before
+    assert [rate["sessions"] for rate in before] == [2, 2]
+
+
+def test_check_in_without_session_constraint(db, roster):
+    course, (anan, boon, _) = roster
+    drop_unique_constraint(db, "attendance", attendance.SESSION_CONSTRAINT)
+
+    assert not attendance.has_session_constraint(db)
+    attendance.bulk_check_in(db, course.course_id, SESSION, [_mark(anan, "present"), _mark(boon, "late")])
+    result = attendance.bulk_check_in(db, course.course_id, SESSION, [_mark(anan, "absent"), _mark(boon, "late")])
+
+    assert (result["updated"], result["unchanged"]) == (1, 1)
+    assert db.query(models.Attendance).count() == 2
+    counter = _counter(db, anan, course)
+    assert (counter.sessions, counter.present, counter.absent) == (1, 0, 1)
+
+
+def test_constraint_script_dedupes_and_rebuilds_counters(db, roster, capsys):
+    from scripts import add_attendance_constraint
+
+    course, (anan, _, _) = roster
+    drop_unique_constraint(db, "attendance", attendance.SESSION_CONSTRAINT)
+    for status in ("absent", "present"):
+        db.add(models.Attendance(student_id=anan.student_id, course_id=course.course_id, date=SESSION, status=status))
+    db.commit()
+    attendance.rebuild_counters(db, course.course_id)
+    assert _counter(db, anan, course).sessions == 2
+
+    add_attendance_constraint.main(dry_run=False)
+
+    assert "removed 1 duplicates" in capsys.readouterr().out
+    assert [row.status for row in db.query(models.Attendance).all()] == ["present"]
+    counter = _counter(db, anan, course)
+    assert (counter.sessions, counter.present, counter.absent) == (1, 1, 0)
+    attendance._session_constraint.update(ready=False, checked_at=None)
+    assert attendance.has_session_constraint(db)
+
+
+def test_course_without_price_has_a_roster(db):
+    course = models.Course(name="Trial class")
+    db.add(course)
+    db.commit()
+    student = make_student(db)
+    make_enrollment(db, student, course)
+
+    result = attendance.bulk_check_in(db, course.course_id, SESSION, [_mark(student, "present")])
+
+    assert result["inserted"] == 1
+    assert attendance.get_roster(db, 999) is None
@@ -0,0 +1,109 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from conftest import make_student
+
+from app.models import models
+from app.schemas import schemas
+from app.utils import autosave
+
+
+@pytest.fixture
+def attempt(db):
+    exam = models.Exam(name="Quiz")
+    for number in range(3):
+        question = models.Question(question_text=f"Q{number}", question_type="multiple_choice")
+        question.choices = [models.Choice(choice_text="right", is_correct=True), models.Choice(choice_text="wrong")]
+        exam.questions.append(question)
+    db.add(exam)
+    db.commit()
+    student_exam = models.StudentExam(student_id=make_student(db).student_id, exam_id=exam.exam_id)
+    db.add(student_exam)
+    db.commit()
+    return exam, student_exam
+
+
+@pytest.fixture
+def buffer(tmp_path):
+    buffer = autosave.AutosaveBuffer(str(tmp_path))
+    yield buffer
+    if buffer._journal is not None:
+        buffer._journal.close()
+
+
+def _choice(question, correct=True):
+    return next(choice.choice_id for choice in question.choices if bool(choice.is_correct) is correct)
+
+
+def _other_worker_journal(buffer, student_exam, answers, at: datetime):
+    # journal ของ worker อื่นที่ยังทำงานอยู่ (pid อื่น) ในโฟลเดอร์เดียวกัน
+    path = os.path.join(buffer.journal_dir, "autosave-999999999-000001.jsonl")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"se": student_exam.student_exam_id, "at": at.isoformat(), "answers": answers}) + "\n")
+        f.write('{"se": 1, "at": "2026-')  # บรรทัดที่กำลังเขียนอยู่
+
+
+def _saved(db, student_exam):
+    db.expire_all()
+    return {
+        answer.question_id: answer.choice_id
+        for answer in db.query(models.StudentAnswer).filter_by(student_exam_id=student_exam.student_exam_id)
+    }
+
+
+def test_put_is_journaled_and_flushed(db, attempt, buffer):
+    exam, student_exam = attempt
+    question = exam.questions[0]
+    buffer.put(student_exam.student_exam_id, [schemas.StudentAnswerCreate(question_id=question.question_id, choice_id=_choice(question))])
+
+    assert os.path.getsize(buffer._journal_path) > 0
+    assert buffer.flush() == 1
+    assert _saved(db, student_exam) == {question.question_id: _choice(question)}
+
+
+def test_finish_flush_reads_other_workers_journals(db, attempt, buffer):
+    exam, student_exam = attempt
+    first, second, third = exam.questions
+    now = datetime.utcnow()
+    _other_worker_journal(buffer, student_exam, [
+        [first.question_id, _choice(first), None],
+        [second.question_id, _choice(second, correct=False), None],
+    ], now - timedelta(seconds=5))
+    # worker นี้ได้ข้อ 2 ใหม่กว่า และข้อ 3 ที่ worker อื่นไม่เห็น
+    buffer.put(student_exam.student_exam_id, [
+        schemas.StudentAnswerCreate(question_id=second.question_id, choice_id=_choice(second)),
+        schemas.StudentAnswerCreate(question_id=third.question_id, choice_id=_choice(third)),
+    ])
+
+    assert buffer.flush(student_exam.student_exam_id) == 3
+    assert _saved(db, student_exam) == {
+        first.question_id: _choice(first),
+        second.question_id: _choice(second),
+        third.question_id: _choice(third),
+    }
+
+
+def test_newer_draft_from_another_worker_wins(db, attempt, buffer):
+    exam, student_exam = attempt
+    question = exam.questions[0]
+    buffer.put(student_exam.student_exam_id, [schemas.StudentAnswerCreate(question_id=question.question_id, choice_id=_choice(question))])
+    _other_worker_journal(buffer, student_exam, [[question.question_id, _choice(question, correct=False), None]], datetime.utcnow() + timedelta(seconds=5))
+
+    buffer.flush(student_exam.student_exam_id)
+
+    assert _saved(db, student_exam) == {question.question_id: _choice(question, correct=False)}
+
+
+def test_rotated_segment_is_synced_before_close(attempt, buffer, monkeypatch):
+    _, student_exam = attempt
+    synced = []
+    monkeypatch.setattr(autosave.os, "fsync", lambda fd: synced.append(fd))
+    buffer.put(student_exam.student_exam_id, [])
+    journal = buffer._journal
+
+    buffer._take()
+
+    assert journal.closed
+    assert len(synced) == 2  # put + ก่อนปิดตอน rotate
@@ -0,0 +1,136 @@
+import pytest
+from conftest import make_course, make_enrollment, make_student
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from app.models import models
+from app.utils import enrollment_service
+
+
+def _counts(db):
+    return db.query(models.Enrollment).count(), db.query(models.Invoice).count()
+
+
+def test_enroll_creates_enrollment_and_invoice(db):
+    student, course = make_student(db), make_course(db, price=2500.0)
+
+    result = enrollment_service.enroll_student(db, student.student_id, course.course_id)
+
+    invoice = db.get(models.Invoice, result["invoice_id"])
+    assert invoice.enrollment_id == result["enrollment_id"]
+    assert (invoice.total_amount, invoice.status) == (2500.0, "pending")
+    assert _counts(db) == (1, 1)
+
+
+def test_enroll_twice_is_rejected(db):
+    student, course = make_student(db), make_course(db)
+    enrollment_service.enroll_student(db, student.student_id, course.course_id)
+
+    with pytest.raises(enrollment_service.EnrollmentError) as error:
+        enrollment_service.enroll_student(db, student.student_id, course.course_id)
+    assert error.value.status_code == 409
+    assert _counts(db) == (1, 1)
+
+
+def test_unknown_course(db):
+    student = make_student(db)
+    with pytest.raises(enrollment_service.EnrollmentError) as error:
+        enrollment_service.enroll_student(db, student.student_id, 999)
+    assert error.value.status_code == 404
+
+
+def test_failed_invoice_rolls_back_the_enrollment(db, monkeypatch):
+    student, course = make_student(db), make_course(db)
+    monkeypatch.setattr(enrollment_service, "_invoice_dates", lambda: (None, None))  # invoice_date NOT NULL
+
+    with pytest.raises(IntegrityError):
+        enrollment_service.enroll_student(db, student.student_id, course.course_id)
+    assert _counts(db) == (0, 0)
+
+
+def test_bulk_enroll_skips_active_students(db):
+    course = make_course(db)
+    students = [make_student(db, first_name=name) for name in ("Anan", "Boon", "Chai")]
+    enrollment_service.enroll_student(db, students[0].student_id, course.course_id)
+
+    result = enrollment_service.bulk_enroll(db, course.course_id, [student.student_id for student in students] * 2)
+
+    assert result["skipped_student_ids"] == [students[0].student_id]
+    assert [row["student_id"] for row in result["enrolled"]] == [students[1].student_id, students[2].student_id]
+    assert all(db.get(models.Invoice, row["invoice_id"]).enrollment_id == row["enrollment_id"] for row in result["enrolled"])
+    assert _counts(db) == (3, 3)
+
+
+def test_bulk_enroll_rejects_unknown_students_without_writing(db):
+    course, student = make_course(db), make_student(db)
+    with pytest.raises(enrollment_service.EnrollmentError) as error:
+        enrollment_service.bulk_enroll(db, course.course_id, [student.student_id, 999])
+    assert error.value.status_code == 400
+    assert _counts(db) == (0, 0)
+
+
+def test_bulk_enroll_failure_rolls_back_everything(db, monkeypatch):
+    course = make_course(db)
+    students = [make_student(db, first_name=name) for name in ("Anan", "Boon")]
+    monkeypatch.setattr(enrollment_service, "_invoice_dates", lambda: (None, None))
+
+    with pytest.raises(IntegrityError):
+        enrollment_service.bulk_enroll(db, course.course_id, [student.student_id for student in students])
+    assert _counts(db) == (0, 0)
+
+
+def test_concurrent_enroll_is_rejected_by_the_index(db, monkeypatch):
+    student, course = make_student(db), make_course(db)
+    enrollment_service.enroll_student(db, student.student_id, course.course_id)
+    # request ที่สองผ่านการเช็คไปก่อนที่ request แรกจะ commit
+    monkeypatch.setattr(enrollment_service, "_active_student_ids", lambda *args: set())
+
+    with pytest.raises(enrollment_service.EnrollmentError) as error:
+        enrollment_service.enroll_student(db, student.student_id, course.course_id)
+    assert error.value.status_code == 409
+    with pytest.raises(enrollment_service.EnrollmentError) as error:
+        enrollment_service.bulk_enroll(db, course.course_id, [student.student_id])
+    assert error.value.status_code == 409
+    assert _counts(db) == (1, 1)
+
+
+def test_inactive_enrollment_does_not_block_reenrolling(db):
+    student, course = make_student(db), make_course(db)
+    make_enrollment(db, student, course, status="expired")
+
+    enrollment_service.enroll_student(db, student.student_id, course.course_id)
+
+    assert db.query(models.Enrollment).filter_by(status="active").count() == 1
+
+
+def test_bulk_route_accepts_user_admins(db, client, admin_headers):
+    course, student = make_course(db), make_student(db)
+
+    response = client.post(
+        "/enrollments/bulk", json={"course_id": course.course_id, "student_ids": [student.student_id]}, headers=admin_headers,
+    )
+
+    assert response.status_code == 200
+    assert [row["student_id"] for row in response.json()["enrolled"]] == [student.student_id]
+
+
+def test_index_script_reports_duplicates(db, capsys):
+    from scripts import add_enrollment_active_index
+
+    student, course = make_student(db), make_course(db)
+    db.execute(text(f"DROP INDEX {enrollment_service.ACTIVE_ENROLLMENT_INDEX}"))
+    db.commit()
+    first = make_enrollment(db, student, course)
+    make_enrollment(db, student, course)
+
+    with pytest.raises(SystemExit):
+        add_enrollment_active_index.main(dry_run=False)
+    assert f"student_id={student.student_id} course_id={course.course_id} rows=2" in capsys.readouterr().out
+
+    first.status = "cancelled"
+    db.commit()
+    add_enrollment_active_index.main(dry_run=False)
+    assert "ready" in capsys.readouterr().out
+    with pytest.raises(IntegrityError):
+        make_enrollment(db, student, course)
+    db.rollback()
@@ -0,0 +1,56 @@
+import io
+
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+
+from app.models import models
+from app.utils import exam_import
+
+# choice1 ว่างทั้งไฟล์: ตัวเลือกถูกนับเลขใหม่จาก choice2 (คำตอบ "1" คือ choice2)
+CSV = (
+    "subject,grade,question_text,answer,choice1,choice2,choice3\n"
+    "Math,P6,Q0,1,,two,three\n"
+    "Math,P6,Q1,1,,three,four\n"
+)
+
+
+def _correct(db):
+    return {
+        question.question_text: [choice.choice_text for choice in question.choices if choice.is_correct]
+        for question in db.query(models.Question).all()
+    }
+
+
+EXPECTED = {"Q0": ["two"], "Q1": ["three"]}
+
+
+def test_dataframe_import_drops_empty_choice_columns(db):
+    exam_import.import_dataframe(db, pd.read_csv(io.StringIO(CSV)))
+
+    assert _correct(db) == EXPECTED
+
+
+def test_streaming_import_drops_empty_choice_columns_across_chunks(db):
+    importer = exam_import.import_chunks(db, "exam.csv", io.BytesIO(CSV.encode()), chunk_size=1)
+
+    assert importer.choice_cols == ["choice2", "choice3"]
+    assert _correct(db) == EXPECTED
+
+
+def test_streaming_import_keeps_a_column_used_in_a_later_chunk(db):
+    csv = CSV + "Math,P6,Q3,1,one,two,four\n"
+
+    exam_import.import_chunks(db, "exam.csv", io.BytesIO(csv.encode()), chunk_size=2)
+
+    # choice1 มีค่าใน chunk หลัง จึงไม่ถูกตัด: คำตอบ "1" ของ Q0/Q1 ชี้ไปที่ช่องว่างเหมือน import_dataframe
+    assert _correct(db) == {"Q0": [], "Q1": [], "Q3": ["one"]}
+
+
+def test_streaming_import_rejects_a_file_without_choices(db):
+    csv = "subject,grade,question_text,answer,choice1\nMath,P6,Q0,1,\n"
+
+    with pytest.raises(HTTPException) as error:
+        exam_import.import_chunks(db, "exam.csv", io.BytesIO(csv.encode()))
+    assert error.value.status_code == 400
+    assert db.query(models.Question).count() == 0
@@ -0,0 +1,186 @@
+from datetime import datetime, timedelta
+
+import pytest
+from conftest import drop_unique_constraint, make_student
+
+from app.database import SessionLocal
+from app.models import models
+from app.schemas import schemas
+from app.utils import grading
+
+
+def _drop_answer_constraint(db):
+    drop_unique_constraint(db, "student_answers", grading.ANSWER_CONSTRAINT)
+
+
+@pytest.fixture
+def exam(db):
+    exam = models.Exam(name="Midterm")
+    for number in range(4):
+        question = models.Question(question_text=f"Q{number}", question_type="multiple_choice")
+        question.choices = [
+            models.Choice(choice_text="right", is_correct=True),
+            models.Choice(choice_text="wrong", is_correct=False),
+        ]
+        exam.questions.append(question)
+    db.add(exam)
+    db.commit()
+    student_exam = models.StudentExam(student_id=make_student(db).student_id, exam_id=exam.exam_id, started_at=datetime.utcnow())
+    db.add(student_exam)
+    db.commit()
+    return exam, student_exam
+
+
+def _answer(question, correct=True):
+    choice = next(choice for choice in question.choices if choice.is_correct is correct)
+    return schemas.StudentAnswerCreate(question_id=question.question_id, choice_id=choice.choice_id)
+
+
+def _rows(db, student_exam):
+    return db.query(models.StudentAnswer).filter_by(student_exam_id=student_exam.student_exam_id).count()
+
+
+def test_upsert_is_idempotent(db, exam):
+    exam, student_exam = exam
+    answers = [_answer(question) for question in exam.questions]
+
+    grading.upsert_answers(db, student_exam, answers)
+    saved = grading.upsert_answers(db, student_exam, answers)
+
+    assert grading.has_answer_constraint(db)
+    assert _rows(db, student_exam) == 4
+    assert all(answer.is_correct for answer in saved)
+
+
+def test_older_write_never_overwrites_newer(db, exam):
+    exam, student_exam = exam
+    question = exam.questions[0]
+    now = datetime.utcnow()
+    grading.upsert_answers(db, student_exam, [_answer(question, correct=False)], written_at={question.question_id: now})
+
+    saved = grading.upsert_answers(db, student_exam, [_answer(question)], written_at={question.question_id: now - timedelta(seconds=5)})
+
+    assert saved[0].is_correct is False
+
+
+def test_fallback_without_constraint(db, exam):
+    exam, student_exam = exam
+    _drop_answer_constraint(db)
+    question = exam.questions[0]
+
+    assert not grading.has_answer_constraint(db)
+    grading.upsert_answers(db, student_exam, [_answer(question, correct=False)])
+    saved = grading.upsert_answers(db, student_exam, [_answer(question)])
+
+    assert _rows(db, student_exam) == 1
+    assert saved[0].is_correct is True
+
+
+def test_fallback_updates_the_newest_legacy_duplicate(db, exam):
+    exam, student_exam = exam
+    _drop_answer_constraint(db)
+    question = exam.questions[0]
+    old = datetime.utcnow() - timedelta(minutes=5)
+    for offset in (0, 1):
+        db.add(models.StudentAnswer(
+            student_exam_id=student_exam.student_exam_id, question_id=question.question_id,
+            is_correct=False, updated_at=old + timedelta(seconds=offset),
+        ))
+    db.commit()
+
+    saved = grading.upsert_answers(db, student_exam, [_answer(question)])
+
+    assert _rows(db, student_exam) == 2
+    assert saved[0].is_correct is True
+    assert saved[0].updated_at > old + timedelta(seconds=1)
+
+
+def test_constraint_script_dedupes_and_enables_on_conflict(db, exam, capsys):
+    from scripts import add_student_answer_constraint
+
+    exam, student_exam = exam
+    _drop_answer_constraint(db)
+    question = exam.questions[0]
+    old = datetime.utcnow() - timedelta(minutes=5)
+    for offset, correct in ((0, False), (1, True)):
+        db.add(models.StudentAnswer(
+            student_exam_id=student_exam.student_exam_id, question_id=question.question_id,
+            is_correct=correct, updated_at=old + timedelta(seconds=offset),
+        ))
+    db.commit()
+
+    add_student_answer_constraint.main(dry_run=False)
+
+    assert "removed 1 duplicates" in capsys.readouterr().out
+    db.expire_all()
+    remaining = db.query(models.StudentAnswer).filter_by(student_exam_id=student_exam.student_exam_id).all()
+    assert [answer.is_correct for answer in remaining] == [True]
+    grading._answer_constraint.update(ready=False, checked_at=None)
+    assert grading.has_answer_constraint(db)
+
+
+def test_finish_scores_from_correct_answers(db, exam):
+    exam, student_exam = exam
+    grading.upsert_answers(db, student_exam, [_answer(question, correct=number % 2 == 0) for number, question in enumerate(exam.questions)])
+
+    grading.finish_student_exam(db, student_exam)
+    db.commit()
+
+    assert float(student_exam.score) == 50.0
+    assert student_exam.status == "completed"
+
+
+def _seed_duplicates(db, exam, student_exam):
+    # ข้อ 0: แถวเก่าถูก แถวล่าสุดผิด / ข้อ 1: ถูกซ้ำสองแถว / ข้อ 2: ถูกแถวเดียว / ข้อ 3: ไม่ได้ตอบ
+    old = datetime.utcnow() - timedelta(minutes=5)
+    rows = [(0, True, 0), (0, False, 1), (1, True, 0), (1, True, 1), (2, True, 0)]
+    for number, correct, offset in rows:
+        question = exam.questions[number]
+        choice = next(choice for choice in question.choices if choice.is_correct is correct)
+        db.add(models.StudentAnswer(
+            student_exam_id=student_exam.student_exam_id, question_id=question.question_id,
+            choice_id=choice.choice_id, is_correct=correct, updated_at=old + timedelta(seconds=offset),
+        ))
+    db.commit()
+
+
+def test_score_counts_only_the_newest_answer_per_question(db, exam):
+    exam, student_exam = exam
+    _drop_answer_constraint(db)
+    _seed_duplicates(db, exam, student_exam)
+
+    grading.finish_student_exam(db, student_exam)
+    db.commit()
+
+    assert float(student_exam.score) == 50.0
+
+
+def test_regrade_counts_only_the_newest_answer_per_question(db, exam):
+    exam, student_exam = exam
+    _drop_answer_constraint(db)
+    _seed_duplicates(db, exam, student_exam)
+    student_exam.status = "completed"
+    db.commit()
+
+    grading.regrade_exam(db, exam.exam_id)
+
+    db.refresh(student_exam)
+    assert float(student_exam.score) == 50.0
+
+
+def test_finish_is_claimed_once(db, exam):
+    exam, student_exam = exam
+    grading.upsert_answers(db, student_exam, [_answer(question) for question in exam.questions])
+    # request ที่สองโหลด student_exam มาก่อนที่ request แรกจะ commit
+    other = SessionLocal()
+    second = other.get(models.StudentExam, student_exam.student_exam_id)
+
+    assert grading.finish_student_exam(db, student_exam) is True
+    db.commit()
+    assert second.status == "in_progress"
+    assert grading.finish_student_exam(other, second) is False
+    other.rollback()
+    other.close()
+
+    db.refresh(student_exam)
+    assert (student_exam.status, float(student_exam.score)) == ("completed", 100.0)
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.models import models
+from app.utils import import_jobs
+
+
+class _Executor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    executor = _Executor()
+    monkeypatch.setattr(import_jobs, "get_executor", lambda: executor)
+    return executor
+
+
+@pytest.fixture
+def job(db, tmp_path):
+    path = tmp_path / "exam.csv"
+    rows = ["subject,grade,question_text,answer,choice1,choice2"]
+    rows += [f"Math,P6,Q{number},1,yes,no" for number in range(4)]
+    path.write_text("\n".join(rows) + "\n")
+    job = models.ImportJob(filename="exam.csv", file_path=str(path), status="queued")
+    db.add(job)
+    db.commit()
+    return job
+
+
+def _questions(db):
+    return sorted(text for (text,) in db.query(models.Question.question_text).all())
+
+
+def _age_heartbeat(db, job, seconds):
+    job.heartbeat_at = datetime.utcnow() - timedelta(seconds=seconds)
+    db.commit()
+
+
+def test_live_worker_is_not_requeued(db, job, executor):
+    assert import_jobs._claim_job(db, job.job_id)
+    # ไม่มี progress นานแต่ heartbeat ยังสด: worker ยังทำงานอยู่
+    job.updated_at = datetime.utcnow() - timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS * 2)
+    _age_heartbeat(db, job, 1)
+
+    assert import_jobs.get_import_job(db, job.job_id).status == "running"
+    assert executor.submitted == []
+
+
+def test_stale_job_is_requeued_once(db, job, executor):
+    assert import_jobs._claim_job(db, job.job_id)
+    _age_heartbeat(db, job, settings.IMPORT_JOB_STALE_SECONDS + 1)
+
+    assert import_jobs.get_import_job(db, job.job_id).status == "queued"
+    assert import_jobs.get_import_job(db, job.job_id).status == "queued"
+    assert executor.submitted == [(job.job_id,)]
+
+
+def test_worker_that_lost_its_lease_cannot_commit(db, job, executor, monkeypatch):
+    monkeypatch.setattr(settings, "EXAM_IMPORT_CHUNK_SIZE", 2)
+    old_lease = import_jobs._claim_job(db, job.job_id)
+    _age_heartbeat(db, job, settings.IMPORT_JOB_STALE_SECONDS + 1)
+    import_jobs.get_import_job(db, job.job_id)
+
+    import_jobs.run_import_job(job.job_id)
+
+    db.refresh(job)
+    assert (job.status, job.questions_inserted) == ("completed", 4)
+    assert import_jobs._save_progress(db, job.job_id, old_lease, {
+        "rows": 2, "duplicates_skipped": 0, "invalid_skipped": 0, "questions_inserted": 2,
+    }) is None
+    db.rollback()
+    assert _questions(db) == ["Q0", "Q1", "Q2", "Q3"]
+
+
+def test_requeued_job_resumes_from_its_checkpoint(db, job, monkeypatch):
+    monkeypatch.setattr(settings, "EXAM_IMPORT_CHUNK_SIZE", 1)
+    # สามแถวแรกถูก commit ไปแล้วก่อน worker เดิมตาย (Q1 ถูกลบทีหลัง จึงต้องไม่ถูก import ซ้ำ)
+    job.rows_done, job.questions_inserted = 3, 3
+    exam = models.Exam(name="Math P6")
+    exam.questions = [models.Question(question_text=text, question_type="normal") for text in ("Q0", "Q2")]
+    db.add(exam)
+    db.commit()
+
+    import_jobs.run_import_job(job.job_id)
+
+    db.refresh(job)
+    assert (job.status, job.rows_done, job.questions_inserted) == ("completed", 4, 4)
+    assert _questions(db) == ["Q0", "Q2", "Q3"]
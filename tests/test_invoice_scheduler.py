@@ -0,0 +1,115 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from conftest import make_course, make_enrollment, make_invoice, make_payment, make_student
+
+from app.core.config import settings
+from app.models import models
+from app.utils import invoice_scheduler, reconciliation
+
+
+@pytest.fixture
+def enrollment(db):
+    db.add(models.User(username="somchai", line_user_id="U123"))
+    student = make_student(db, line_id="U123")
+    return make_enrollment(db, student, make_course(db))
+
+
+def _partial(db, enrollment, due_in_days):
+    invoice = make_invoice(db, enrollment, 1000.0, due_in_days=due_in_days, status="partial", invoice_date=datetime.utcnow() - timedelta(days=10))
+    payment = make_payment(db, enrollment, 400.0, invoice=invoice)
+    payment.payment_status = "reconciled"
+    db.commit()
+    return invoice
+
+
+def test_past_due_partial_invoice_becomes_overdue_and_is_reminded(db, enrollment):
+    invoice = _partial(db, enrollment, due_in_days=8)  # เลยกำหนดมาแล้ว 2 วัน
+
+    report, jobs = invoice_scheduler.sweep()
+
+    db.refresh(invoice)
+    assert invoice.status == "overdue"
+    assert report["overdue_marked"] == 1
+    assert [(job["invoice_id"], job["kind"]) for job in jobs] == [(invoice.invoice_id, "overdue")]
+    assert "600.00" in jobs[0]["message"]  # ทวงเฉพาะยอดที่ยังค้าง
+
+
+def test_partial_invoice_gets_due_soon_reminder(db, enrollment):
+    invoice = _partial(db, enrollment, due_in_days=11)  # ครบกำหนดในอีก 1 วัน
+
+    report, jobs = invoice_scheduler.sweep()
+
+    assert report["due_soon_reminders"] == 1
+    assert [(job["invoice_id"], job["kind"]) for job in jobs] == [(invoice.invoice_id, "due_soon")]
+
+
+def test_reconciliation_keeps_past_due_partial_invoice_overdue(db, enrollment):
+    invoice = make_invoice(db, enrollment, 1000.0, due_in_days=8, status="overdue", invoice_date=datetime.utcnow() - timedelta(days=10))
+    payment = make_payment(db, enrollment, 400.0)
+
+    reconciliation.reconcile_payments(db, [payment])
+    db.commit()
+    assert invoice.status == "overdue"
+
+    reconciliation.recompute_invoice_statuses(db)
+    db.refresh(invoice)
+    assert invoice.status == "overdue"
+
+
+def _reminder(db, job):
+    db.expire_all()
+    return db.get(models.InvoiceReminder, job["reminder_id"])
+
+
+def test_failed_reminder_is_retried_with_backoff(db, enrollment, monkeypatch):
+    monkeypatch.setattr(settings, "INVOICE_REMINDER_MAX_ATTEMPTS", 2)
+    make_invoice(db, enrollment, 500.0, due_in_days=-1)
+    now = datetime.utcnow()
+    _, jobs = invoice_scheduler.sweep(now=now)
+    invoice_scheduler._record_results(jobs, {jobs[0]["reminder_id"]: "500 LINE error"})
+
+    reminder = _reminder(db, jobs[0])
+    assert (reminder.status, reminder.attempts) == ("failed", 1)
+    assert invoice_scheduler.sweep(now=now + timedelta(seconds=60))[1] == []
+
+    retry_at = now + timedelta(seconds=settings.INVOICE_REMINDER_RETRY_SECONDS + 1)
+    _, retried = invoice_scheduler.sweep(now=retry_at)
+    assert [(job["reminder_id"], job["attempts"]) for job in retried] == [(jobs[0]["reminder_id"], 2)]
+
+    invoice_scheduler._record_results(retried, {jobs[0]["reminder_id"]: "500 LINE error"})
+    assert invoice_scheduler.sweep(now=retry_at + timedelta(days=1))[1] == []  # ครบจำนวนครั้งแล้ว
+
+
+def test_claim_is_kept_alive_while_sending(db, enrollment, monkeypatch):
+    monkeypatch.setattr(settings, "INVOICE_REMINDER_HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "INVOICE_REMINDER_STALE_SECONDS", 0.2)
+    make_invoice(db, enrollment, 500.0, due_in_days=-1)
+    now = datetime.utcnow()
+    _, jobs = invoice_scheduler.sweep(now=now)
+    others = []
+
+    async def slow_send(line_user_id, message):
+        await asyncio.sleep(0.4)
+        # อีก worker sweep ระหว่างที่ยังส่งอยู่ (นานเกิน stale แล้ว): claim ถูกต่ออายุจึงไม่ถูก claim ซ้ำ
+        others.extend(invoice_scheduler.sweep()[1])
+        return 200, ""
+
+    monkeypatch.setattr(invoice_scheduler, "asend_line_message", slow_send)
+    asyncio.run(invoice_scheduler.InvoiceScheduler()._send(jobs))
+
+    assert others == []
+    reminder = _reminder(db, jobs[0])
+    assert reminder.status == "sent"
+    assert reminder.heartbeat_at > now
+
+
+def test_abandoned_claim_is_reclaimed(db, enrollment):
+    make_invoice(db, enrollment, 500.0, due_in_days=-1)
+    now = datetime.utcnow()
+    _, jobs = invoice_scheduler.sweep(now=now)  # worker ตายก่อนส่ง
+
+    assert invoice_scheduler.sweep(now=now + timedelta(seconds=60))[1] == []
+    _, reclaimed = invoice_scheduler.sweep(now=now + timedelta(seconds=settings.INVOICE_REMINDER_STALE_SECONDS + 1))
+    assert [job["reminder_id"] for job in reclaimed] == [jobs[0]["reminder_id"]]
@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta
+
+from conftest import make_course, make_enrollment, make_invoice, make_payment, make_student
+
+from app.models import models
+from app.utils import reconciliation
+
+
+def _setup(db):
+    student = make_student(db)
+    course = make_course(db)
+    enrollment = make_enrollment(db, student, course)
+    return enrollment
+
+
+def test_exact_amount_beats_older_invoice(db):
+    enrollment = _setup(db)
+    older = make_invoice(db, enrollment, 1000.0, due_in_days=3)
+    exact = make_invoice(db, enrollment, 500.0, due_in_days=10)
+    payment = make_payment(db, enrollment, 500.0)
+
+    report = reconciliation.reconcile_payments(db, [payment])
+    db.commit()
+
+    assert report["reconciled"] == 1 and report["invoices_paid"] == 1
+    assert payment.invoice_id == exact.invoice_id
+    assert exact.status == "paid"
+    assert older.status == "pending"
+
+
+def test_partial_payment_marks_invoice_partial(db):
+    enrollment = _setup(db)
+    invoice = make_invoice(db, enrollment, 1000.0)
+    payment = make_payment(db, enrollment, 400.0)
+
+    report = reconciliation.reconcile_payments(db, [payment])
+    db.commit()
+
+    assert payment.invoice_id == invoice.invoice_id
+    assert invoice.status == "partial"
+    assert report["invoices_partial"] == 1
+
+    second = make_payment(db, enrollment, 600.0)
+    reconciliation.reconcile_payments(db, [second])
+    db.commit()
+    assert invoice.status == "paid"
+
+
+def test_unverified_payment_never_touches_invoice(db):
+    enrollment = _setup(db)
+    invoice = make_invoice(db, enrollment, 500.0)
+    pending = make_payment(db, enrollment, 500.0, status="pending")
+    rejected = make_payment(db, enrollment, 500.0, status="rejected")
+
+    report = reconciliation.reconcile_payments(db, [pending, rejected])
+    db.commit()
+
+    assert report["unverified"] == 2 and report["reconciled"] == 0
+    assert (pending.payment_status, rejected.payment_status) == ("pending", "rejected")
+    assert invoice.status == "pending"
+    assert db.query(models.Income).count() == 0
+
+
+def test_payment_outside_date_window_is_unmatched(db):
+    enrollment = _setup(db)
+    make_invoice(db, enrollment, 500.0)
+    payment = make_payment(db, enrollment, 500.0, payment_date=datetime.utcnow() - timedelta(days=365))
+
+    report = reconciliation.reconcile_payments(db, [payment])
+    db.commit()
+
+    assert report["unmatched"] == 1
+    assert payment.payment_status == "unmatched"
+
+
+def test_run_batch_creates_income_once(db):
+    enrollment = _setup(db)
+    invoice = make_invoice(db, enrollment, 500.0)
+    make_payment(db, enrollment, 500.0)
+
+    first = reconciliation.run_batch(db)
+    second = reconciliation.run_batch(db)
+
+    assert first["reconciled"] == 1 and first["incomes_created"] == 1
+    assert second["payments"] == 0
+    db.refresh(invoice)
+    assert invoice.status == "paid"
+    assert db.query(models.Income).count() == 1
+
+
+def test_unreconcile_reopens_invoice(db):
+    enrollment = _setup(db)
+    invoice = make_invoice(db, enrollment, 500.0)
+    payment = make_payment(db, enrollment, 500.0)
+    reconciliation.reconcile_payments(db, [payment])
+    db.commit()
+
+    payment.status = "rejected"
+    reconciliation.unreconcile_payment(db, payment)
+    db.commit()
+
+    assert payment.payment_status == "pending"
+    assert invoice.status == "pending"
+    assert db.query(models.Income).count() == 0
+
+
+def test_recompute_ignores_rejected_payments(db):
+    enrollment = _setup(db)
+    invoice = make_invoice(db, enrollment, 500.0, status="paid")
+    payment = make_payment(db, enrollment, 500.0, invoice=invoice, status="rejected")
+    payment.payment_status = "reconciled"  # ข้อมูลเก่าก่อนมีการตรวจสลิป
+    db.commit()
+
+    reconciliation.recompute_invoice_statuses(db)
+
+    db.refresh(invoice)
+    assert invoice.status == "pending"
+
+
+def test_explicit_invoice_of_another_enrollment_is_unmatched(db):
+    enrollment, other = _setup(db), _setup(db)
+    foreign = make_invoice(db, other, 500.0)
+    payment = make_payment(db, enrollment, 500.0, invoice=foreign)
+
+    report = reconciliation.reconcile_payments(db, [payment])
+    db.commit()
+
+    assert report["unmatched"] == 1
+    assert payment.payment_status == "unmatched"
+    assert foreign.status == "pending"
+    assert db.query(models.Income).count() == 0
+
+
+def test_explicit_invoice_that_is_already_paid_is_unmatched(db):
+    enrollment = _setup(db)
+    invoice = make_invoice(db, enrollment, 500.0, status="paid")
+    payment = make_payment(db, enrollment, 500.0, invoice=invoice)
+
+    report = reconciliation.reconcile_payments(db, [payment])
+    db.commit()
+
+    assert report["unmatched"] == 1
+    assert invoice.status == "paid"
+
+
+def test_overpayment_is_not_booked(db):
+    enrollment = _setup(db)
+    invoice = make_invoice(db, enrollment, 500.0)
+    fifo = make_payment(db, enrollment, 10000.0)
+    explicit = make_payment(db, enrollment, 600.0, invoice=invoice)
+
+    report = reconciliation.reconcile_payments(db, [fifo, explicit])
+    db.commit()
+
+    assert report["overpaid"] == 2 and report["reconciled"] == 0
+    assert (fifo.payment_status, explicit.payment_status) == ("overpaid", "overpaid")
+    assert invoice.status == "pending"
+    assert db.query(models.Income).count() == 0
+    assert reconciliation.run_batch(db)["payments"] == 0
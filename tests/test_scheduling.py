@@ -0,0 +1,122 @@
+from datetime import date, datetime, time
+
+import pytest
+from conftest import make_course
+
+from app.models import models
+from app.schemas import schemas
+from app.utils import scheduling
+
+
+def _at(hour, day=2):
+    return datetime(2026, 11, day, hour, 0)
+
+
+@pytest.fixture
+def setup(db):
+    teacher = models.Teacher(first_name="Kru", last_name="Nok")
+    room_a, room_b = models.Classroom(name="A", capacity=20), models.Classroom(name="B", capacity=10)
+    db.add_all([teacher, room_a, room_b])
+    db.commit()
+    course = make_course(db, teacher_id=teacher.teacher_id)
+    other = make_course(db, name="English B1", teacher_id=teacher.teacher_id)
+    free = make_course(db, name="Reading")
+    return course, other, free, room_a, room_b
+
+
+def test_interval_index_overlaps():
+    index = scheduling.IntervalIndex()
+    index.add(_at(9), _at(11), 1)
+    index.add(_at(8), _at(18), 2)
+    index.add(_at(12), _at(13), 3)
+
+    assert [sid for _, _, sid in index.overlapping(_at(11), _at(12))] == [2]
+    assert [sid for _, _, sid in index.overlapping(_at(10), _at(13))] == [2, 1, 3]
+    assert index.overlapping(_at(18), _at(19)) == []  # ชนขอบพอดีไม่ถือว่าซ้อน
+    assert index.remove(_at(8), 2)
+    assert index.overlapping(_at(11), _at(12)) == []
+
+
+def test_room_conflict(db, setup):
+    course, _, free, room_a, _ = setup
+    scheduling.create_schedule(db, course.course_id, room_a.classroom_id, _at(10), _at(12))
+
+    with pytest.raises(scheduling.ScheduleError) as error:
+        scheduling.create_schedule(db, free.course_id, room_a.classroom_id, _at(11), _at(13))
+    assert error.value.status_code == 409
+    assert [conflict["resource"] for conflict in error.value.conflicts] == ["classroom"]
+
+
+def test_teacher_conflict_across_rooms(db, setup):
+    course, other, _, room_a, room_b = setup
+    scheduling.create_schedule(db, course.course_id, room_a.classroom_id, _at(10), _at(12))
+
+    with pytest.raises(scheduling.ScheduleError) as error:
+        scheduling.create_schedule(db, other.course_id, room_b.classroom_id, _at(11), _at(12))
+    assert [conflict["resource"] for conflict in error.value.conflicts] == ["teacher"]
+
+    # ชนขอบพอดีไม่ชน
+    scheduling.create_schedule(db, other.course_id, room_b.classroom_id, _at(12), _at(14))
+
+
+def test_stale_index_is_caught_by_the_database(db, setup):
+    course, _, free, room_a, _ = setup
+    scheduling.index.ensure_loaded(db)
+    # worker อื่นจองไปแล้ว: index ของ process นี้ยังไม่รู้
+    db.execute(models.Schedule.__table__.insert().values(
+        course_id=free.course_id, classroom_id=room_a.classroom_id, start_time=_at(10), end_time=_at(12),
+    ))
+    db.commit()
+    assert scheduling.index.conflicts(course.course_id, room_a.classroom_id, _at(10), _at(11)) == []
+
+    with pytest.raises(scheduling.ScheduleError) as error:
+        scheduling.create_schedule(db, course.course_id, room_a.classroom_id, _at(10), _at(11))
+    assert error.value.status_code == 409
+    assert db.query(models.Schedule).count() == 1
+
+
+def test_update_ignores_its_own_booking(db, setup):
+    course, _, _, room_a, _ = setup
+    schedule = scheduling.create_schedule(db, course.course_id, room_a.classroom_id, _at(10), _at(12))
+
+    scheduling.update_schedule(db, schedule, course.course_id, room_a.classroom_id, _at(11), _at(13))
+
+    assert (schedule.start_time, schedule.end_time) == (_at(11), _at(13))
+
+
+def test_generate_term_skips_conflicts(db, setup):
+    course, _, free, room_a, _ = setup
+    scheduling.create_schedule(db, free.course_id, room_a.classroom_id, _at(9, day=9), _at(11, day=9))
+    slots = [schemas.WeeklySlot(weekday=0, start=time(10), end=time(12))]  # วันจันทร์
+
+    with pytest.raises(scheduling.ScheduleError):
+        scheduling.generate_term(db, course.course_id, room_a.classroom_id, date(2026, 11, 2), date(2026, 11, 23), slots)
+    assert db.query(models.Schedule).count() == 1
+
+    result = scheduling.generate_term(
+        db, course.course_id, room_a.classroom_id, date(2026, 11, 2), date(2026, 11, 23), slots, skip_conflicts=True,
+    )
+    assert [row["start_time"].day for row in result["created"]] == [2, 16, 23]
+    assert len(result["conflicts"]) == 1
+
+
+def test_free_rooms(db, setup):
+    course, _, _, room_a, room_b = setup
+    scheduling.create_schedule(db, course.course_id, room_a.classroom_id, _at(10), _at(12))
+
+    rooms = scheduling.index.free_rooms(_at(11), _at(12))
+    assert [room["classroom_id"] for room in rooms] == [room_b.classroom_id]
+    assert scheduling.index.free_rooms(_at(11), _at(12), min_capacity=15) == []
+
+
+def test_course_without_price_can_be_scheduled(db, setup):
+    _, _, _, room_a, _ = setup
+    course = models.Course(name="Trial class")
+    db.add(course)
+    db.commit()
+
+    scheduling.create_schedule(db, course.course_id, room_a.classroom_id, _at(10), _at(12))
+
+    with pytest.raises(scheduling.ScheduleError) as error:
+        scheduling.create_schedule(db, 999, room_a.classroom_id, _at(13), _at(14))
+    assert error.value.status_code == 404